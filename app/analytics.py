@@ -0,0 +1,348 @@
+"""Колоночная копия оценок и агрегаты по ней: среднее, перцентили, гистограммы.
+
+Оценки — целые 1..10, поэтому любой агрегат выводится из гистограммы. Колонки
+один раз сворачиваются в гистограммы по идеям (np.bincount по всем новым
+строкам сразу), а статистика группы — сумма строк её идей. Повторный запрос
+досчитывает только оценки, добавленные после предыдущего.
+"""
+
+import threading
+from array import array
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.models import (
+    AnalyticsGroupBy,
+    Evaluation,
+    EvaluationAnalytics,
+    GroupStatistics,
+    IdeaRecord,
+    MetricStatistics,
+)
+
+METRICS = ("value", "effort", "confidence")
+# Ячейка 0 не используется: индекс ячейки совпадает с оценкой.
+SCORE_BINS = 11
+PERCENTILES = (50, 90, 99)
+
+_INITIAL_CAPACITY = 1024
+# Голосов с одной оценкой у одной идеи заведомо меньше 2**32; вдвое меньше
+# памяти на строку, чем int64.
+HISTOGRAM_DTYPE = np.uint32
+
+# Выражения для SQL-бэкенда: число голосов с данной оценкой по каждой метрике.
+HISTOGRAM_COLUMNS = ", ".join(
+    f"SUM({metric} = {score})" for metric in METRICS for score in range(1, SCORE_BINS)
+)
+
+
+class EvaluationColumns:
+    """Оценки построчно в массивах NumPy: id идеи и по колонке на метрику.
+
+    Строка гистограммы — позиция id в прогрессии id_start, id_start + id_step,
+    ..., как у хранилища: шард с id k + 1, k + 1 + N, ... не держит пустых
+    строк под id соседей.
+    """
+
+    def __init__(self, *, id_start: int = 0, id_step: int = 1) -> None:
+        self._id_start = id_start
+        self._id_step = id_step
+        # Хранилище вызывает histograms под блокировкой чтения, то есть из
+        # нескольких потоков сразу, а сворачивание меняет состояние.
+        self._fold_lock = threading.Lock()
+        self.clear()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self) -> None:
+        self._idea_ids = np.empty(_INITIAL_CAPACITY, dtype=np.int32)
+        self._columns = {
+            metric: np.empty(_INITIAL_CAPACITY, dtype=np.uint8) for metric in METRICS
+        }
+        self._size = 0
+        self._folded = 0
+        self._histograms = _empty_histograms()
+
+    def append(self, idea_id: int, entries: Sequence[Evaluation]) -> None:
+        start = self._size
+        stop = start + len(entries)
+        self._reserve(stop)
+        self._idea_ids[start:stop] = idea_id
+        self._columns["value"][start:stop] = [entry.value for entry in entries]
+        self._columns["effort"][start:stop] = [entry.effort for entry in entries]
+        self._columns["confidence"][start:stop] = [
+            entry.confidence for entry in entries
+        ]
+        self._size = stop
+
+    def histograms(self) -> Dict[str, np.ndarray]:
+        """Гистограммы по идеям: строка — row_positions(id), ячейка — оценка, значение — голоса."""
+        with self._fold_lock:
+            return self._fold()
+
+    def _fold(self) -> Dict[str, np.ndarray]:
+        if self._folded < self._size:
+            window = slice(self._folded, self._size)
+            folded = fold_histograms(
+                row_positions(self._idea_ids[window], self._id_start, self._id_step),
+                {metric: column[window] for metric, column in self._columns.items()},
+            )
+            _accumulate(self._histograms, folded)
+            self._folded = self._size
+        return dict(self._histograms)
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self._idea_ids)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self._idea_ids = _grow(self._idea_ids, capacity)
+        self._columns = {
+            metric: _grow(column, capacity) for metric, column in self._columns.items()
+        }
+
+
+class PackedHistograms:
+    """Гистограммы по идеям для компактного режима, без колоночной копии оценок.
+
+    Оценки уже лежат в PackedEvaluations записей, поэтому append только
+    помечает идею. Запрос сворачивает тем же bincount хвосты упакованных оценок
+    помеченных идей: свёрнуто столько оценок идеи, сколько голосов в её строке
+    гистограммы. Интерфейс тот же, что у EvaluationColumns.
+    """
+
+    def __init__(
+        self, records: Mapping[int, IdeaRecord], *, id_start: int = 0, id_step: int = 1
+    ) -> None:
+        self._records = records
+        self._id_start = id_start
+        self._id_step = id_step
+        self._fold_lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self._dirty: Set[int] = set()
+        self._histograms = _empty_histograms()
+
+    def append(self, idea_id: int, entries: Sequence[Evaluation]) -> None:
+        self._dirty.add(idea_id)
+
+    def histograms(self) -> Dict[str, np.ndarray]:
+        """Гистограммы по идеям: строка — row_positions(id), ячейка — оценка, значение — голоса."""
+        with self._fold_lock:
+            if self._dirty:
+                self._fold()
+            return dict(self._histograms)
+
+    def _fold(self) -> None:
+        folded_votes = self._histograms["value"].sum(axis=1)
+        rows: List[int] = []
+        lengths: List[int] = []
+        chunks: Dict[str, List[array]] = {metric: [] for metric in METRICS}
+        for idea_id in self._dirty:
+            packed = self._records[idea_id].evaluations
+            row = (idea_id - self._id_start) // self._id_step
+            start = int(folded_votes[row]) if row < len(folded_votes) else 0
+            rows.append(row)
+            lengths.append(len(packed) - start)
+            for metric in METRICS:
+                chunks[metric].append(getattr(packed, metric)[start:])
+        self._dirty = set()
+        positions = np.repeat(np.array(rows, dtype=np.int64), lengths)
+        columns = {
+            metric: np.frombuffer(b"".join(parts), dtype=np.uint8)
+            for metric, parts in chunks.items()
+        }
+        _accumulate(self._histograms, fold_histograms(positions, columns))
+
+
+def row_positions(idea_ids: np.ndarray, id_start: int, id_step: int) -> np.ndarray:
+    """Строки гистограмм для id из прогрессии id_start, id_start + id_step, ..."""
+    return (idea_ids.astype(np.int64) - id_start) // id_step
+
+
+def _empty_histograms() -> Dict[str, np.ndarray]:
+    return {
+        metric: np.zeros((0, SCORE_BINS), dtype=HISTOGRAM_DTYPE) for metric in METRICS
+    }
+
+
+def _accumulate(
+    histograms: Dict[str, np.ndarray], folded: Mapping[str, np.ndarray]
+) -> None:
+    """Прибавляет свёрнутые гистограммы к накопленным, расширяя их по числу строк.
+
+    Массивы заменяются новыми, а не меняются на месте: снимок, который
+    histograms() отдал раньше, можно суммировать без блокировок.
+    """
+    for metric, counts in folded.items():
+        current = histograms[metric]
+        updated = np.zeros(
+            (max(len(current), len(counts)), SCORE_BINS), HISTOGRAM_DTYPE
+        )
+        updated[: len(current)] = current
+        updated[: len(counts)] += counts.astype(HISTOGRAM_DTYPE)
+        histograms[metric] = updated
+
+
+def _grow(column: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.empty(capacity, dtype=column.dtype)
+    grown[: len(column)] = column
+    return grown
+
+
+def fold_histograms(
+    positions: np.ndarray, columns: Mapping[str, np.ndarray]
+) -> Dict[str, np.ndarray]:
+    """Гистограммы по идеям из колонок оценок (positions — строка каждой оценки)."""
+    rows = int(positions.max()) + 1 if len(positions) else 0
+    # Номер ячейки в плоской матрице rows x SCORE_BINS.
+    cells = positions.astype(np.int64) * SCORE_BINS
+    return {
+        metric: np.bincount(
+            cells + columns[metric], minlength=rows * SCORE_BINS
+        ).reshape(rows, SCORE_BINS)
+        for metric in METRICS
+    }
+
+
+def histograms_from_rows(rows: Sequence[Sequence[int]]) -> Dict[str, np.ndarray]:
+    """Гистограммы по идеям из строк «id идеи, счётчики HISTOGRAM_COLUMNS»."""
+    width = SCORE_BINS - 1
+    table = np.array(rows, dtype=np.int64).reshape(len(rows), 1 + len(METRICS) * width)
+    ids = table[:, 0]
+    size = int(ids.max()) + 1 if len(ids) else 0
+    histograms = {}
+    for position, metric in enumerate(METRICS):
+        start = 1 + position * width
+        matrix = np.zeros((size, SCORE_BINS), dtype=np.int64)
+        matrix[ids, 1:] = table[:, start : start + width]
+        histograms[metric] = matrix
+    return histograms
+
+
+def metric_statistics(counts: np.ndarray) -> MetricStatistics:
+    """Статистика по гистограмме одной метрики (SCORE_BINS ячеек).
+
+    Перцентили — с линейной интерполяцией, как np.percentile по исходным
+    оценкам: порядковая статистика с номером i — первая ячейка, где
+    накопленная сумма больше i.
+    """
+    total = int(counts.sum())
+    histogram = [int(count) for count in counts[1:]]
+    if not total:
+        return MetricStatistics(count=0, histogram=histogram)
+    mean = float(counts @ np.arange(SCORE_BINS)) / total
+    positions = (total - 1) * np.array(PERCENTILES, dtype=np.float64) / 100
+    lower, upper = np.floor(positions), np.ceil(positions)
+    cumulative = np.cumsum(counts)
+    lower_score = np.searchsorted(cumulative, lower, side="right")
+    upper_score = np.searchsorted(cumulative, upper, side="right")
+    values = lower_score + (positions - lower) * (upper_score - lower_score)
+    p50, p90, p99 = (round(float(value), 2) for value in values)
+    return MetricStatistics(
+        count=total,
+        mean=round(mean, 2),
+        p50=p50,
+        p90=p90,
+        p99=p99,
+        histogram=histogram,
+    )
+
+
+def group_statistics(
+    key: Optional[str], ideas: int, counts: Mapping[str, np.ndarray]
+) -> GroupStatistics:
+    return GroupStatistics(
+        key=key,
+        ideas=ideas,
+        evaluations=int(counts["value"].sum()),
+        **{metric: metric_statistics(counts[metric]) for metric in METRICS},
+    )
+
+
+# Идей в группе и гистограмма по каждой метрике; такие счётчики складываются,
+# поэтому из них собирается сводка и по нескольким хранилищам (шардам).
+GroupCounts = Tuple[int, Dict[str, np.ndarray]]
+
+
+def group_counts(
+    histograms: Mapping[str, np.ndarray],
+    groups: Mapping[str, Iterable[int]],
+    ideas: int,
+    *,
+    id_start: int = 0,
+    id_step: int = 1,
+) -> Tuple[GroupCounts, Dict[str, GroupCounts]]:
+    """Счётчики по всем оценкам и по группам идей.
+
+    histograms — гистограммы по идеям (строка — row_positions id с этими
+    id_start и id_step, по умолчанию сам id), groups — id идей каждой группы.
+    Пустые группы пропускаются.
+    """
+    rows = len(histograms["value"])
+    total = {
+        metric: histograms[metric].sum(axis=0, dtype=np.int64) for metric in METRICS
+    }
+    counts: Dict[str, GroupCounts] = {}
+    for key, ids in groups.items():
+        members = np.fromiter(ids, dtype=np.int64)
+        if not len(members):
+            continue
+        positions = row_positions(members, id_start, id_step)
+        # У идей без оценок строки в гистограмме может ещё не быть.
+        rated = positions[positions < rows]
+        counts[key] = (
+            len(members),
+            {
+                metric: histograms[metric][rated].sum(axis=0, dtype=np.int64)
+                for metric in METRICS
+            },
+        )
+    return (ideas, total), counts
+
+
+def merge_group_counts(
+    parts: Iterable[Tuple[GroupCounts, Dict[str, GroupCounts]]]
+) -> Tuple[GroupCounts, Dict[str, GroupCounts]]:
+    """Складывает результаты group_counts нескольких хранилищ."""
+    ideas = 0
+    total = {metric: np.zeros(SCORE_BINS, dtype=np.int64) for metric in METRICS}
+    merged: Dict[str, GroupCounts] = {}
+    for (part_ideas, part_total), groups in parts:
+        ideas += part_ideas
+        for metric in METRICS:
+            total[metric] = total[metric] + part_total[metric]
+        for key, (members, counts) in groups.items():
+            if key in merged:
+                previous, sums = merged[key]
+                counts = {metric: sums[metric] + counts[metric] for metric in METRICS}
+                members += previous
+            merged[key] = (members, counts)
+    return (ideas, total), merged
+
+
+def analytics_from_counts(
+    group_by: AnalyticsGroupBy,
+    total: GroupCounts,
+    groups: Mapping[str, GroupCounts],
+) -> EvaluationAnalytics:
+    """Сводка из счётчиков group_counts; группы идут по ключу."""
+    return EvaluationAnalytics(
+        group_by=group_by,
+        total=group_statistics(None, *total),
+        groups=[group_statistics(key, *groups[key]) for key in sorted(groups)],
+    )
+
+
+def build_analytics(
+    group_by: AnalyticsGroupBy,
+    histograms: Mapping[str, np.ndarray],
+    groups: Mapping[str, Iterable[int]],
+    ideas: int,
+) -> EvaluationAnalytics:
+    """Сводка по всем оценкам и по группам идей (аргументы — как у group_counts)."""
+    return analytics_from_counts(group_by, *group_counts(histograms, groups, ideas))
@@ -0,0 +1,132 @@
+"""Асинхронный интерфейс хранилища идей для async-обработчиков FastAPI.
+
+In-memory IdeaStorage отвечает за микросекунды и без ввода-вывода, поэтому
+его методы выполняются прямо в event loop: никакого прыжка в пул потоков
+anyio и очереди к его 40 слотам. Бэкенды, которые блокируются (SQLite,
+fsync журнала), помечают это атрибутами blocking_reads/blocking_writes, и
+такие вызовы уходят в отдельный пул потоков — как файловые операции
+вложений в AttachmentStorage.run_io. Аналитика — суммы NumPy по всем идеям —
+уходит в пул у любого бэкенда.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from app.models import (
+    AnalyticsGroupBy,
+    EvaluationAnalytics,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaResponse,
+    IdeaSort,
+    IdeaUpdate,
+    ScoreSummary,
+)
+
+T = TypeVar("T")
+
+
+class AsyncIdeaStorage:
+    """Те же операции, что у хранилища storage, но awaitable.
+
+    executor нужен, только если storage блокирует чтения или записи; без него
+    аналитика идёт в пул потоков event loop по умолчанию. Один пул можно
+    разделить между фасадами разных хранилищ.
+    """
+
+    def __init__(self, storage: Any, *, executor: Optional[ThreadPoolExecutor] = None):
+        self.sync = storage
+        self._blocking_reads = getattr(storage, "blocking_reads", True)
+        self._blocking_writes = getattr(storage, "blocking_writes", True)
+        if (self._blocking_reads or self._blocking_writes) and executor is None:
+            raise ValueError("a blocking storage needs an executor")
+        self._executor = executor
+
+    async def _read(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if not self._blocking_reads:
+            return func(*args, **kwargs)
+        return await self._offload(func, *args, **kwargs)
+
+    async def _write(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if not self._blocking_writes:
+            return func(*args, **kwargs)
+        return await self._offload(func, *args, **kwargs)
+
+    async def _offload(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    async def create(self, payload: IdeaCreate) -> IdeaResponse:
+        return await self._write(self.sync.create, payload)
+
+    async def create_many(self, payloads: Sequence[IdeaCreate]) -> List[int]:
+        return await self._write(self.sync.create_many, payloads)
+
+    async def update(self, idea_id: int, payload: IdeaUpdate) -> IdeaResponse:
+        return await self._write(self.sync.update, idea_id, payload)
+
+    async def add_evaluation(
+        self, idea_id: int, payload: EvaluationCreate
+    ) -> IdeaResponse:
+        return await self._write(self.sync.add_evaluation, idea_id, payload)
+
+    async def add_evaluations(
+        self, batches: Dict[int, Sequence[EvaluationCreate]]
+    ) -> Dict[int, ScoreSummary]:
+        return await self._write(self.sync.add_evaluations, batches)
+
+    async def add_attachment(self, idea_id: int, attachment: str) -> List[str]:
+        return await self._write(self.sync.add_attachment, idea_id, attachment)
+
+    async def clear(self) -> None:
+        await self._write(self.sync.clear)
+
+    async def get(self, idea_id: int) -> IdeaResponse:
+        return await self._read(self.sync.get, idea_id)
+
+    async def get_json(self, idea_id: int) -> bytes:
+        return await self._read(self.sync.get_json, idea_id)
+
+    async def ensure_exists(self, idea_id: int) -> None:
+        await self._read(self.sync.ensure_exists, idea_id)
+
+    async def record_etag(self, idea_id: int) -> str:
+        return await self._read(self.sync.record_etag, idea_id)
+
+    async def totals(self) -> Tuple[int, int]:
+        return await self._read(self.sync.totals)
+
+    async def list_etag(self) -> str:
+        return await self._read(self.sync.list_etag)
+
+    async def list(self, **filters: Any) -> List[IdeaResponse]:
+        """Фильтры и страница — как у IdeaStorage.list."""
+        return await self._read(self.sync.list, **filters)
+
+    async def list_json(self, **filters: Any) -> List[Tuple[int, bytes]]:
+        return await self._read(self.sync.list_json, **filters)
+
+    async def search_json(self, query: str, **filters: Any) -> List[Tuple[int, bytes]]:
+        return await self._read(self.sync.search_json, query, **filters)
+
+    async def ranked_json(
+        self, sort: IdeaSort, **filters: Any
+    ) -> List[Tuple[int, bytes]]:
+        return await self._read(self.sync.ranked_json, sort, **filters)
+
+    async def evaluations(self, idea_id: int) -> List[Dict[str, object]]:
+        return await self._read(self.sync.evaluations, idea_id)
+
+    async def evaluations_many(
+        self, idea_ids: Sequence[int]
+    ) -> Dict[int, List[Dict[str, object]]]:
+        return await self._read(self.sync.evaluations_many, idea_ids)
+
+    async def evaluation_analytics(
+        self, group_by: AnalyticsGroupBy
+    ) -> EvaluationAnalytics:
+        return await self._offload(self.sync.evaluation_analytics, group_by)
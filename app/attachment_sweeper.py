@@ -0,0 +1,154 @@
+"""Фоновый сборщик файлов вложений, на которые не ссылается ни одна идея.
+
+Такие файлы остаются, например, если процесс упал между записью файла и
+storage.add_attachment, или от оборванных загрузок (`.upload-*.part`).
+Каталог обходится через os.scandir по кускам: за один тик просматривается
+не больше batch_size записей, а позиция обхода сохраняется до следующего тика.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Collection, Deque, Iterator, List, Optional, Set
+
+from app.security import (
+    CONTENT_TYPES_BY_SUFFIX,
+    REF_SUFFIX,
+    TEMP_PREFIX,
+    TEMP_SUFFIX,
+    AttachmentStorage,
+)
+
+DEFAULT_SWEEP_GRACE_SECONDS = 3600
+DEFAULT_SWEEP_BATCH_SIZE = 1000
+# Выключен по умолчанию: сборщик удаляет блобы, о которых не знает хранилище
+# идей этого процесса, а in-memory хранилище у каждого воркера своё.
+DEFAULT_SWEEP_INTERVAL_SECONDS = 0
+
+
+class AttachmentSweeper:
+    def __init__(
+        self,
+        storage: AttachmentStorage,
+        find_referenced: Callable[[Collection[str]], Set[str]],
+        *,
+        grace_seconds: float = DEFAULT_SWEEP_GRACE_SECONDS,
+        batch_size: int = DEFAULT_SWEEP_BATCH_SIZE,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._storage = storage
+        self._find_referenced = find_referenced
+        self.grace_seconds = grace_seconds
+        self.batch_size = max(1, batch_size)
+        self._clock = clock
+        self._pending_dirs: Deque[Path] = deque()
+        self._entries: Optional[Iterator[os.DirEntry]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.passes = 0
+        self.removed = 0
+
+    def tick(self) -> int:
+        """Один шаг обхода; возвращает число удалённых файлов."""
+        now = self._clock()
+        candidates: List[str] = []
+        removed = 0
+        for entry in self._scan(self.batch_size):
+            name = entry.name
+            try:
+                stale = (
+                    now - entry.stat(follow_symlinks=False).st_mtime
+                    >= self.grace_seconds
+                )
+            except FileNotFoundError:
+                continue
+            if not stale:
+                continue
+            if name.startswith(TEMP_PREFIX) and name.endswith(TEMP_SUFFIX):
+                removed += _unlink(entry.path)
+            elif name.endswith(REF_SUFFIX):
+                # .ref без блоба остаётся после гонок с миграцией или удалением.
+                if not os.path.exists(entry.path[: -len(REF_SUFFIX)]):
+                    removed += _unlink(entry.path)
+            elif Path(name).suffix in CONTENT_TYPES_BY_SUFFIX:
+                candidates.append(name)
+
+        if candidates:
+            referenced = self._find_referenced(candidates)
+            for name in candidates:
+                if name not in referenced and self._storage.remove_orphan(
+                    name, self.grace_seconds
+                ):
+                    removed += 1
+        self.removed += removed
+        return removed
+
+    def start(self, interval: float) -> None:
+        """Запускает tick раз в interval секунд в фоновом потоке."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="attachment-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close_entries()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.tick()
+            except Exception:
+                # Сбой одного тика (каталог подменили, хранилище недоступно) не
+                # должен останавливать сборщик: начинаем обход заново.
+                self._close_entries()
+                self._pending_dirs.clear()
+
+    def _scan(self, budget: int) -> Iterator[os.DirEntry]:
+        """Файлы очередного куска обхода; каталоги тоже расходуют бюджет."""
+        restarted = False
+        while budget > 0:
+            if self._entries is None:
+                if not self._pending_dirs:
+                    if restarted:
+                        # Весь каталог уже пройден в этом тике.
+                        return
+                    restarted = True
+                    self.passes += 1
+                    self._pending_dirs.append(self._storage.base_dir)
+                directory = self._pending_dirs.popleft()
+                try:
+                    self._entries = os.scandir(directory)
+                except FileNotFoundError:
+                    continue
+            entry = next(self._entries, None)
+            if entry is None:
+                self._close_entries()
+                continue
+            budget -= 1
+            if entry.is_dir(follow_symlinks=False):
+                self._pending_dirs.append(Path(entry.path))
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+    def _close_entries(self) -> None:
+        if self._entries is not None:
+            self._entries.close()
+            self._entries = None
+
+
+def _unlink(path: str) -> int:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return 0
+    return 1
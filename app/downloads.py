@@ -0,0 +1,150 @@
+"""Отдача вложений: HTTP Range, условные запросы и потоковое чтение файла."""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Awaitable, BinaryIO, Callable, Mapping, Tuple
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.security import ATTACHMENT_CHUNK_SIZE, StoredAttachment
+
+# Имя файла вложения не меняется при изменении содержимого, поэтому кэшировать
+# ответ можно сколько угодно.
+ATTACHMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int] | None:
+    """Разбирает `Range: bytes=...` в включительный отрезок [start, end].
+
+    None означает, что заголовок нужно проигнорировать и отдать файл целиком:
+    так RFC 9110 разрешает поступать с непонятными и составными диапазонами.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first or last):
+        return None
+    if first and not first.isdigit() or last and not last.isdigit():
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Проверка If-None-Match: слабое сравнение, `*` совпадает с любым ETag."""
+    candidates = [item.strip() for item in header.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def attachment_headers(attachment: StoredAttachment) -> dict:
+    return {
+        "ETag": attachment.etag,
+        "Cache-Control": ATTACHMENT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+
+class AttachmentFileResponse(Response):
+    """Отдаёт диапазон уже открытого файла handle и закрывает его.
+
+    Файл читается чанками через os.pread в run_io — ограниченном пуле
+    AttachmentStorage, как и остальной файловый ввод-вывод вложений. Если
+    сервер поддерживает ASGI-расширение zerocopysend, байты уходят через
+    sendfile; uvicorn из Dockerfile его не объявляет, так что в развёртывании
+    работает чтение чанками.
+    """
+
+    chunk_size = ATTACHMENT_CHUNK_SIZE
+
+    def __init__(
+        self,
+        attachment: StoredAttachment,
+        handle: BinaryIO,
+        *,
+        run_io: Callable[..., Awaitable[Any]],
+        byte_range: Tuple[int, int] | None = None,
+        headers: Mapping[str, str] | None = None,
+    ) -> None:
+        self.attachment = attachment
+        self.handle = handle
+        self._run_io = run_io
+        self.status_code = 200 if byte_range is None else 206
+        self.media_type = attachment.content_type
+        self.background = None
+        self.start, end = byte_range or (0, attachment.size - 1)
+        self.length = end - self.start + 1
+        merged = dict(headers or {})
+        merged["Content-Length"] = str(self.length)
+        if byte_range is not None:
+            merged["Content-Range"] = f"bytes {self.start}-{end}/{attachment.size}"
+        self.init_headers(merged)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        handle = self.handle
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            if scope["method"].upper() == "HEAD" or self.length == 0:
+                await send({"type": "http.response.body", "body": b""})
+            elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": handle,
+                        "offset": self.start,
+                        "count": self.length,
+                    }
+                )
+            else:
+                await self._send_chunks(handle.fileno(), send)
+        finally:
+            handle.close()
+
+    async def _send_chunks(self, fd: int, send: Send) -> None:
+        offset = self.start
+        remaining = self.length
+        while remaining > 0:
+            size = min(self.chunk_size, remaining)
+            # Запрос уже принят: чанки встают в очередь пула, а не получают
+            # attachment_storage_busy посреди ответа.
+            chunk = await self._run_io(os.pread, fd, size, offset, queue_limit=False)
+            if not chunk:
+                # Файл оказался короче, чем при stat: закрываем ответ как есть.
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                }
+            )
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b""})
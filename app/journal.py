@@ -0,0 +1,616 @@
+"""Журнал изменений и снапшоты для in-memory хранилища.
+
+Каждая мутация дописывается строкой JSON в сегмент журнала. Фоновый поток
+сбрасывает накопившиеся строки одним write + fsync (group commit), поэтому
+параллельные запросы делят один fsync. Периодически состояние сохраняется в
+компактный снапшот, а старые сегменты удаляются: при старте достаточно
+прочитать последний снапшот и доиграть только хвост журнала.
+"""
+
+import gc
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.models import (
+    Evaluation,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaRecord,
+    IdeaResponse,
+    IdeaStatus,
+    IdeaUpdate,
+    PackedEvaluations,
+    ScoreSummary,
+)
+from app.problem_details import ApiProblem
+from app.response_cache import DEFAULT_CACHE_ENTRIES
+from app.storage import IdeaStorage
+
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".json"
+DEFAULT_SNAPSHOT_EVERY = 100_000
+
+_decode = json.JSONDecoder().decode
+
+
+def _segment_path(directory: Path, first_seq: int) -> Path:
+    return directory / f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}"
+
+
+def _numbered_files(
+    directory: Path, prefix: str, suffix: str
+) -> List[Tuple[int, Path]]:
+    found = []
+    for path in directory.iterdir():
+        name = path.name
+        if not (name.startswith(prefix) and name.endswith(suffix)):
+            continue
+        number = name[len(prefix) : -len(suffix)]
+        if number.isdigit():
+            found.append((int(number), path))
+    found.sort()
+    return found
+
+
+def _evaluation_rows(
+    evaluations: List[Evaluation] | PackedEvaluations, length: int
+) -> List[list]:
+    """Первые length оценок строками снапшота; их не меняют дописывающие писатели."""
+    if isinstance(evaluations, PackedEvaluations):
+        comments = evaluations.comments or {}
+        scores = zip(
+            evaluations.value[:length],
+            evaluations.effort[:length],
+            evaluations.confidence[:length],
+        )
+        return [
+            [value, effort, confidence, comments.get(index)]
+            for index, (value, effort, confidence) in enumerate(scores)
+        ]
+    return [
+        [item.value, item.effort, item.confidence, item.comment]
+        for item in evaluations[:length]
+    ]
+
+
+def _fsync_dir(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _trim_torn_tail(path: Path) -> None:
+    """Обрезает недописанную последнюю строку, чтобы новые записи не склеились с ней."""
+    if not path.exists():
+        return
+    with path.open("r+b") as handle:
+        end = handle.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(64 * 1024, position)
+            position -= step
+            handle.seek(position)
+            chunk = handle.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                keep = position + newline + 1
+                break
+        else:
+            keep = 0
+        if keep != end:
+            handle.truncate(keep)
+
+
+def _journal_failed() -> ApiProblem:
+    return ApiProblem(
+        code="storage_unavailable",
+        detail="idea journal write failed",
+        status=503,
+    )
+
+
+def _dump(entry: Dict[str, Any]) -> bytes:
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+class JournalWriter:
+    """Append-only журнал с group commit.
+
+    Номер записи не хранится в строке: сегмент называется по номеру первой
+    записи, а дальше номера идут подряд.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        first_seq: int,
+        *,
+        fsync: bool = True,
+        commit_delay: float = 0.0,
+    ) -> None:
+        self._dir = directory
+        self._fsync = fsync
+        self._commit_delay = commit_delay
+        self._seq = first_seq - 1
+        self._durable = self._seq
+        self._pending: List[bytes] = []
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        path = _segment_path(directory, first_seq)
+        _trim_torn_tail(path)
+        self._handle = path.open("ab")
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="idea-journal-flush", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    @property
+    def failed(self) -> bool:
+        """Запись на диск сломалась; дальше журнал ничего не сохранит."""
+        return self._error is not None
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Ставит запись в очередь и возвращает её номер (без ожидания fsync)."""
+        line = _dump(entry)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("journal is closed")
+            self._seq += 1
+            self._pending.append(line)
+            self._cond.notify_all()
+            return self._seq
+
+    def append_many(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Ставит записи в очередь одним куском; возвращает номер последней."""
+        lines = [_dump(entry) for entry in entries]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("journal is closed")
+            self._seq += len(lines)
+            self._pending.extend(lines)
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq: int) -> None:
+        """Ждёт, пока запись с номером seq окажется на диске."""
+        with self._cond:
+            while self._durable < seq and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise RuntimeError("journal write failed") from self._error
+
+    def rotate(self) -> int:
+        """Сбрасывает очередь и начинает новый сегмент; возвращает номер последней записи.
+
+        Вызывающий должен не пускать новые append на время ротации.
+        """
+        self.wait(self._seq)
+        with self._cond:
+            self._handle.close()
+            self._handle = _segment_path(self._dir, self._seq + 1).open("ab")
+            return self._seq
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._handle.close()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            if self._commit_delay:
+                # Даём соседним запросам дописаться, чтобы разделить с ними fsync.
+                time.sleep(self._commit_delay)
+            with self._cond:
+                batch, self._pending = self._pending, []
+                upto = self._seq
+                handle = self._handle
+            try:
+                handle.write(b"".join(batch))
+                handle.flush()
+                if self._fsync:
+                    os.fsync(handle.fileno())
+            except OSError as exc:
+                with self._cond:
+                    self._error = exc
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable = upto
+                self._cond.notify_all()
+
+
+def iter_journal(
+    directory: Path, after_seq: int
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Отдаёт записи журнала с номером больше after_seq.
+
+    Недописанная последняя строка (обрыв при падении) пропускается: клиент
+    этой записи подтверждения не получал.
+    """
+    expected: Optional[int] = None
+    for first_seq, path in _numbered_files(directory, SEGMENT_PREFIX, SEGMENT_SUFFIX):
+        if expected is not None and first_seq > expected:
+            raise ValueError(f"journal gap before {path.name}")
+        seq = first_seq - 1
+        with path.open("rb") as handle:
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                seq += 1
+                if seq <= after_seq:
+                    continue
+                yield seq, _decode(line.decode())
+        expected = seq + 1
+
+
+class JournaledIdeaStorage(IdeaStorage):
+    """In-memory IdeaStorage, которое переживает рестарт благодаря журналу.
+
+    Мутация видна читателям раньше, чем журнал дождётся fsync. Если запись
+    журнала сломалась, откатить её уже нельзя: хранилище считается
+    неисправным и отвечает 503 на все следующие мутации, пока сервис не
+    перезапустят и он не восстановится из журнала.
+    """
+
+    # Запись ждёт fsync группового коммита в потоке storage-io и держит там
+    # блокировку записи. Чтение в event loop ждало бы её на acquire_read и
+    # останавливало бы весь loop, поэтому чтения тоже уходят в пул.
+    blocking_reads = True
+    blocking_writes = True
+
+    def __init__(
+        self,
+        directory: Path | str,
+        *,
+        fsync: bool = True,
+        commit_delay: float = 0.0,
+        snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+        background_compaction: bool = True,
+        compact: bool = False,
+        id_start: int = 1,
+        id_step: int = 1,
+        json_cache_size: int = DEFAULT_CACHE_ENTRIES,
+    ) -> None:
+        super().__init__(
+            compact=compact,
+            id_start=id_start,
+            id_step=id_step,
+            json_cache_size=json_cache_size,
+        )
+        self._dir = Path(directory).expanduser()
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._snapshot_every = snapshot_every
+        self._background_compaction = background_compaction
+        self._mutation_lock = threading.Lock()
+        # _commit идёт уже без _mutation_lock, из нескольких потоков storage-io.
+        self._snapshot_counter_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        # Восстановление создаёт миллионы мелких объектов без циклов; сборщик
+        # мусора на этом этапе только тратит время на обходы поколений.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            last_seq = self._recover()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self._entries_since_snapshot = 0
+        self._journal = JournalWriter(
+            self._dir, last_seq + 1, fsync=fsync, commit_delay=commit_delay
+        )
+
+    def create(self, payload: IdeaCreate) -> IdeaResponse:
+        with self._mutation_lock:
+            self._ensure_writable()
+            created = super().create(payload)
+            seq = self._journal.append(
+                {
+                    "op": "create",
+                    "id": created.id,
+                    "title": created.title,
+                    "description": created.description,
+                    "tags": created.tags,
+                }
+            )
+        self._commit(seq)
+        return created
+
+    def create_many(self, payloads: Sequence[IdeaCreate]) -> List[int]:
+        with self._mutation_lock:
+            self._ensure_writable()
+            ids = super().create_many(payloads)
+            seq = self._journal.append_many(
+                {
+                    "op": "create",
+                    "id": record.id,
+                    "title": record.title,
+                    "description": record.description,
+                    "tags": record.tags,
+                }
+                for record in map(self._ideas.__getitem__, ids)
+            )
+        if ids:
+            self._commit(seq, entries=len(ids))
+        return ids
+
+    def update(self, idea_id: int, payload: IdeaUpdate) -> IdeaResponse:
+        with self._mutation_lock:
+            self._ensure_writable()
+            updated = super().update(idea_id, payload)
+            entry: Dict[str, Any] = {"op": "update", "id": idea_id}
+            if payload.title is not None:
+                entry["title"] = updated.title
+            if payload.description is not None:
+                entry["description"] = updated.description
+            if payload.status is not None:
+                entry["status"] = updated.status.value
+            if payload.tags is not None:
+                entry["tags"] = updated.tags
+            seq = self._journal.append(entry)
+        self._commit(seq)
+        return updated
+
+    def add_evaluation(self, idea_id: int, payload: EvaluationCreate) -> IdeaResponse:
+        with self._mutation_lock:
+            self._ensure_writable()
+            evaluated = super().add_evaluation(idea_id, payload)
+            seq = self._journal.append(
+                {
+                    "op": "evaluate",
+                    "id": idea_id,
+                    "value": payload.value,
+                    "effort": payload.effort,
+                    "confidence": payload.confidence,
+                    "comment": payload.comment,
+                }
+            )
+        self._commit(seq)
+        return evaluated
+
+    def add_evaluations(
+        self, batches: Dict[int, Sequence[EvaluationCreate]]
+    ) -> Dict[int, ScoreSummary]:
+        with self._mutation_lock:
+            self._ensure_writable()
+            scores = super().add_evaluations(batches)
+            seq = self._journal.append_many(
+                {
+                    "op": "evaluate",
+                    "id": idea_id,
+                    "value": payload.value,
+                    "effort": payload.effort,
+                    "confidence": payload.confidence,
+                    "comment": payload.comment,
+                }
+                for idea_id in scores
+                for payload in batches[idea_id]
+            )
+        if scores:
+            self._commit(seq, entries=sum(len(batches[idea_id]) for idea_id in scores))
+        return scores
+
+    def add_attachment(self, idea_id: int, attachment: str) -> List[str]:
+        with self._mutation_lock:
+            self._ensure_writable()
+            attachments = super().add_attachment(idea_id, attachment)
+            seq = self._journal.append(
+                {"op": "attach", "id": idea_id, "name": attachment}
+            )
+        self._commit(seq)
+        return attachments
+
+    def clear(self) -> None:
+        with self._mutation_lock:
+            self._ensure_writable()
+            super().clear()
+            seq = self._journal.append({"op": "clear"})
+        self._commit(seq)
+
+    def compact(self, *, background: bool = False) -> None:
+        """Пишет снапшот и удаляет покрытые им сегменты журнала.
+
+        Под блокировкой мутаций только ротируем сегмент и снимаем копию
+        ссылок на записи; сериализация и запись на диск идут уже без неё.
+        """
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+        if not background:
+            try:
+                self._compact()
+            finally:
+                self._compaction_lock.release()
+            return
+
+        def run() -> None:
+            try:
+                self._compact()
+            finally:
+                self._compaction_lock.release()
+
+        self._compaction_thread = threading.Thread(
+            target=run, name="idea-journal-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def close(self) -> None:
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        self._journal.close()
+
+    def _ensure_writable(self) -> None:
+        if self._journal.failed:
+            raise _journal_failed()
+
+    def _commit(self, seq: int, entries: int = 1) -> None:
+        try:
+            self._journal.wait(seq)
+        except RuntimeError as exc:
+            raise _journal_failed() from exc
+        with self._snapshot_counter_lock:
+            self._entries_since_snapshot += entries
+            due = (
+                self._snapshot_every
+                and self._entries_since_snapshot >= self._snapshot_every
+            )
+            if due:
+                self._entries_since_snapshot = 0
+        if due:
+            self.compact(background=self._background_compaction)
+
+    def _compact(self) -> None:
+        with self._mutation_lock:
+            seq = self._journal.rotate()
+            next_id = self._next_id
+            # Оценки и вложения только дописываются в конец, поэтому под
+            # блокировкой хватает ссылки на историю и её длины: копия и JSON
+            # строятся уже после того, как писатели отпущены.
+            captured = [
+                (
+                    record.id,
+                    record.title,
+                    record.description,
+                    record.status.value,
+                    record.tags,
+                    record.evaluations,
+                    len(record.evaluations),
+                    record.attachments,
+                    len(record.attachments),
+                )
+                for record in self._ideas.values()
+            ]
+
+        ideas = []
+        for idea_id, title, description, status, tags, *history in captured:
+            evaluations, votes, attachments, files = history
+            ideas.append(
+                [
+                    idea_id,
+                    title,
+                    description,
+                    status,
+                    tags,
+                    _evaluation_rows(evaluations, votes),
+                    attachments[:files],
+                ]
+            )
+        target = self._dir / f"{SNAPSHOT_PREFIX}{seq:020d}{SNAPSHOT_SUFFIX}"
+        temp = target.with_suffix(".tmp")
+        with temp.open("wb") as handle:
+            handle.write(_dump({"seq": seq, "next_id": next_id, "ideas": ideas}))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp, target)
+        _fsync_dir(self._dir)
+
+        for first_seq, path in _numbered_files(
+            self._dir, SEGMENT_PREFIX, SEGMENT_SUFFIX
+        ):
+            if first_seq <= seq:
+                path.unlink(missing_ok=True)
+        for snapshot_seq, path in _numbered_files(
+            self._dir, SNAPSHOT_PREFIX, SNAPSHOT_SUFFIX
+        ):
+            if snapshot_seq < seq:
+                path.unlink(missing_ok=True)
+
+    def _recover(self) -> int:
+        """Загружает последний снапшот и доигрывает хвост журнала."""
+        last_seq = 0
+        snapshots = _numbered_files(self._dir, SNAPSHOT_PREFIX, SNAPSHOT_SUFFIX)
+        if snapshots:
+            last_seq, path = snapshots[-1]
+            with path.open("rb") as handle:
+                snapshot = json.load(handle)
+            for row in snapshot["ideas"]:
+                idea_id, title, description, status, tags, evaluations, attachments = (
+                    row
+                )
+                self._insert(
+                    IdeaRecord(
+                        id=idea_id,
+                        title=title,
+                        description=description,
+                        tags=tags,
+                        status=IdeaStatus(status),
+                        evaluations=[Evaluation(*item) for item in evaluations],
+                        attachments=attachments,
+                        value_total=sum(item[0] for item in evaluations),
+                        effort_total=sum(item[1] for item in evaluations),
+                        confidence_total=sum(item[2] for item in evaluations),
+                    ),
+                    index_score=False,
+                )
+            self._next_id = snapshot["next_id"]
+
+        # Индекс по оценкам поддерживать на каждой записи хвоста дорого —
+        # строим его один раз после проигрывания.
+        for seq, entry in iter_journal(self._dir, last_seq):
+            self._replay(entry)
+            last_seq = seq
+        self._rebuild_score_index()
+        return last_seq
+
+    def _replay(self, entry: Dict[str, Any]) -> None:
+        op = entry["op"]
+        if op == "clear":
+            IdeaStorage.clear(self)
+            return
+        if op == "create":
+            record = IdeaRecord(
+                id=entry["id"],
+                title=entry["title"],
+                description=entry["description"],
+                tags=entry["tags"],
+            )
+            self._insert(record, index_score=False)
+            return
+
+        record = self._ideas[entry["id"]]
+        if op == "update":
+            if "title" in entry or "description" in entry:
+                self._set_text(
+                    record,
+                    title=entry.get("title"),
+                    description=entry.get("description"),
+                )
+            if "status" in entry:
+                self._set_status(record, IdeaStatus(entry["status"]))
+            if "tags" in entry:
+                self._set_tags(record, entry["tags"])
+        elif op == "evaluate":
+            evaluation = Evaluation(
+                value=entry["value"],
+                effort=entry["effort"],
+                confidence=entry["confidence"],
+                comment=entry["comment"],
+            )
+            record.append_evaluation(evaluation)
+            self._evaluation_count += 1
+            # Колонки analytics пополняются здесь: индекс по оценкам строится
+            # после проигрывания, а колонки — нет.
+            self._columns.append(record.id, [evaluation])
+        elif op == "attach":
+            self._record_attachment(record, entry["name"])
+        else:
+            raise ValueError(f"unknown journal operation: {op}")
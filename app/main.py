@@ -1,28 +1,109 @@
 """FastAPI приложение для каталога идей с оценкой ценности.
 
-Сервис держит состояния в оперативной памяти: этого достаточно для учебных
-примеров и автотестов. Когда модель станет сложнее, хранилище можно заменить на
-реальную базу, при этом схемы запросов/ответов менять не придётся.
+По умолчанию сервис держит состояние в оперативной памяти: этого достаточно для
+учебных примеров и автотестов. Для сохранения данных между рестартами можно
+включить SQLite-бэкенд (IDEA_STORAGE_BACKEND=sqlite), схемы запросов/ответов
+при этом не меняются.
 """
 
+import base64
+import binascii
+import json
+import logging
 import os
-from dataclasses import dataclass, field
-from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
 
-from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
+import anyio
+from fastapi import FastAPI, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.exceptions import RequestValidationError
-from pydantic import BaseModel, Field, constr, field_validator
-
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+
+from app.async_storage import AsyncIdeaStorage
+from app.attachment_sweeper import (
+    DEFAULT_SWEEP_BATCH_SIZE,
+    DEFAULT_SWEEP_GRACE_SECONDS,
+    DEFAULT_SWEEP_INTERVAL_SECONDS,
+    AttachmentSweeper,
+)
+from app.downloads import (
+    AttachmentFileResponse,
+    RangeNotSatisfiable,
+    attachment_headers,
+    etag_matches,
+    parse_range,
+)
+from app.journal import DEFAULT_SNAPSHOT_EVERY, JournaledIdeaStorage
+from app.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware, route_label
+from app.models import (
+    AnalyticsGroupBy,
+    EvaluationAnalytics,
+    EvaluationBatchCreate,
+    EvaluationBatchItem,
+    EvaluationCreate,
+    IdeaBatchCreate,
+    IdeaCreate,
+    IdeaResponse,
+    IdeaSort,
+    IdeaStatus,
+    IdeaUpdate,
+    parse_status,
+)
 from app.problem_details import ApiProblem
-from app.security import AttachmentStorage, AttachmentValidationError, RateLimiter
+from app.response_cache import cache_entries_from_env, join_json_array
+from app.security import (
+    ATTACHMENT_CHUNK_SIZE,
+    DEFAULT_IO_QUEUE_DEPTH,
+    DEFAULT_IO_WORKERS,
+    ENV_RATE_LIMIT_SHARED_FILE,
+    AttachmentStorage,
+    AttachmentValidationError,
+    RateLimiter,
+    SharedMemoryRateLimitBackend,
+)
+from app.sharding import (
+    DEFAULT_SHARD_TIMEOUT,
+    ShardedIdeaStorage,
+    default_shard_count,
+    shard_authkey,
+)
+from app.sqlite_storage import DEFAULT_POOL_SIZE, SQLiteIdeaStorage
+from app.storage import IdeaStorage
 
 app = FastAPI(title="Idea Catalog", version="0.3.0")
+logger = logging.getLogger(__name__)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "")
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return default
+
 
 _attachment_dir = os.getenv("IDEA_ATTACHMENT_DIR", str(Path("var/uploads")))
-attachment_storage = AttachmentStorage(_attachment_dir)
-rate_limiter = RateLimiter()
+attachment_storage = AttachmentStorage(
+    _attachment_dir,
+    io_workers=_env_int("IDEA_ATTACHMENT_IO_WORKERS", DEFAULT_IO_WORKERS),
+    io_queue_depth=_env_int("IDEA_ATTACHMENT_IO_QUEUE_DEPTH", DEFAULT_IO_QUEUE_DEPTH),
+    content_addressed=os.getenv("IDEA_ATTACHMENT_DEDUP", "0") == "1",
+    sharded=os.getenv("IDEA_ATTACHMENT_SHARDED", "0") == "1",
+)
+_rate_limit_file = os.getenv(ENV_RATE_LIMIT_SHARED_FILE)
+rate_limiter = RateLimiter(
+    backend=SharedMemoryRateLimitBackend(_rate_limit_file) if _rate_limit_file else None
+)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+MAX_SEARCH_QUERY_LENGTH = 200
 
 
 @app.exception_handler(ApiProblem)
@@ -32,8 +113,14 @@ async def api_problem_handler(request: Request, exc: ApiProblem):
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    return validation_problem(exc.errors()).as_response(request)
+
+
+def validation_problem(
+    items: Sequence[Dict[str, Any]], detail: str = "request validation failed"
+) -> ApiProblem:
     errors = []
-    for item in exc.errors():
+    for item in items:
         errors.append(
             {
                 "loc": item.get("loc"),
@@ -41,13 +128,12 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
                 "type": item.get("type"),
             }
         )
-    problem = ApiProblem(
+    return ApiProblem(
         code="validation_error",
-        detail="request validation failed",
+        detail=detail,
         status=422,
         extras={"errors": errors},
     )
-    return problem.as_response(request)
 
 
 @app.exception_handler(HTTPException)
@@ -63,348 +149,146 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 
 
 @app.get("/health")
-def health():
+async def health():
     """Простой пинг, чтобы CI и деплой понимали, что сервис жив."""
     return {"status": "ok"}
 
 
-class IdeaStatus(str, Enum):
-    """Статус идеи в жизненном цикле каталога."""
-
-    draft = "draft"
-    in_review = "in_review"
-    approved = "approved"
-    archived = "archived"
-
-
-@dataclass
-class Evaluation:
-    value: int
-    effort: int
-    confidence: int
-    comment: Optional[str] = None
-
-
-@dataclass
-class IdeaRecord:
-    id: int
-    title: str
-    description: str
-    tags: List[str]
-    status: IdeaStatus = IdeaStatus.draft
-    evaluations: List[Evaluation] = field(default_factory=list)
-    attachments: List[str] = field(default_factory=list)
-
-
-class ScoreSummary(BaseModel):
-    value: Optional[float] = None
-    confidence: Optional[float] = None
-    effort: Optional[float] = None
-    impact: Optional[float] = None
-    votes: int = 0
-
-    @classmethod
-    def from_evaluations(cls, evaluations: List[Evaluation]) -> "ScoreSummary":
-        """Считает усреднённые метрики по всем оценкам идеи."""
-        if not evaluations:
-            return cls()
-
-        votes = len(evaluations)
-        total_value = 0.0
-        total_confidence = 0.0
-        total_effort = 0.0
-
-        for item in evaluations:
-            total_value += item.value
-            total_confidence += item.confidence
-            total_effort += item.effort
-
-        avg_value = round(total_value / votes, 2)
-        avg_confidence = round(total_confidence / votes, 2)
-        avg_effort = round(total_effort / votes, 2)
-        impact = round((avg_value * avg_confidence) / max(avg_effort, 1), 2)
-
-        return cls(
-            value=avg_value,
-            confidence=avg_confidence,
-            effort=avg_effort,
-            impact=impact,
-            votes=votes,
+def create_storage():
+    """Создаёт хранилище по IDEA_STORAGE_BACKEND.
+
+    memory (по умолчанию), journal, sqlite или sharded — клиент процессов-шардов
+    из app/sharding.py.
+    """
+    backend = os.getenv("IDEA_STORAGE_BACKEND", "memory").strip().lower()
+    # Компактные записи для in-memory бэкендов (memory и journal).
+    compact = os.getenv("IDEA_STORAGE_COMPACT", "0") != "0"
+    json_cache_size = cache_entries_from_env()
+    if backend == "sqlite":
+        path = os.getenv("IDEA_SQLITE_PATH", str(Path("var/ideas.db")))
+        return SQLiteIdeaStorage(
+            path,
+            pool_size=_env_int("IDEA_SQLITE_POOL_SIZE", DEFAULT_POOL_SIZE),
+            json_cache_size=json_cache_size,
+        )
+    if backend == "journal":
+        directory = os.getenv("IDEA_JOURNAL_DIR", str(Path("var/journal")))
+        return JournaledIdeaStorage(
+            directory,
+            fsync=os.getenv("IDEA_JOURNAL_FSYNC", "1") != "0",
+            snapshot_every=_env_int(
+                "IDEA_JOURNAL_SNAPSHOT_EVERY", DEFAULT_SNAPSHOT_EVERY
+            ),
+            compact=compact,
+            json_cache_size=json_cache_size,
         )
+    if backend == "sharded":
+        return ShardedIdeaStorage.from_directory(
+            os.getenv("IDEA_SHARD_SOCKET_DIR", str(Path("var/shards"))),
+            _env_int("IDEA_SHARD_COUNT", 0) or default_shard_count(),
+            authkey=shard_authkey(),
+            timeout=_env_int("IDEA_SHARD_TIMEOUT", DEFAULT_SHARD_TIMEOUT),
+        )
+    if backend != "memory":
+        raise ValueError(f"unsupported IDEA_STORAGE_BACKEND: {backend}")
+    return IdeaStorage(compact=compact, json_cache_size=json_cache_size)
 
 
-class IdeaResponse(BaseModel):
-    id: int
-    title: str
-    description: str
-    tags: List[str]
-    status: IdeaStatus
-    score: ScoreSummary
-    attachments: List[str]
-
-    @classmethod
-    def from_record(cls, record: IdeaRecord) -> "IdeaResponse":
-        """Создаёт ответ API на основе состояния в памяти."""
-        score = ScoreSummary.from_evaluations(record.evaluations)
-        return cls(
-            id=record.id,
-            title=record.title,
-            description=record.description,
-            tags=record.tags,
-            status=record.status,
-            score=score,
-            attachments=list(record.attachments),
-        )
+storage = create_storage()
+attachment_sweeper = AttachmentSweeper(
+    attachment_storage,
+    # Через лямбду, чтобы сборщик видел подменённое в тестах хранилище.
+    lambda names: storage.referenced_attachments(names),
+    grace_seconds=_env_int("IDEA_ATTACHMENT_SWEEP_GRACE", DEFAULT_SWEEP_GRACE_SECONDS),
+    batch_size=_env_int("IDEA_ATTACHMENT_SWEEP_BATCH", DEFAULT_SWEEP_BATCH_SIZE),
+)
 
 
-class IdeaCreate(BaseModel):
-    title: constr(min_length=3, max_length=120)
-    description: constr(min_length=10, max_length=2000)
-    tags: List[constr(min_length=1, max_length=30)] = Field(default_factory=list)
-
-    @field_validator("title")
-    @classmethod
-    def tidy_title(cls, value: str) -> str:
-        cleaned = value.strip()
-        if len(cleaned) < 3:
-            raise ValueError("title must contain at least 3 characters")
-        return cleaned
-
-    @field_validator("description")
-    @classmethod
-    def tidy_description(cls, value: str) -> str:
-        cleaned = value.strip()
-        if len(cleaned) < 10:
-            raise ValueError("description must contain at least 10 characters")
-        return cleaned
-
-    @field_validator("tags", mode="before")
-    @classmethod
-    def tidy_tags(cls, value):
-        if value is None:
-            return []
-
-        if not isinstance(value, list):
-            raise ValueError("tags must be a list")
-
-        cleaned: List[str] = []
-        for raw in value:
-            tag = raw.strip().lower()
-            if not tag:
-                raise ValueError("tag cannot be blank")
-            cleaned.append(tag)
-        return cleaned
-
-
-class IdeaUpdate(BaseModel):
-    title: Optional[constr(min_length=3, max_length=120)] = None
-    description: Optional[constr(min_length=10, max_length=2000)] = None
-    status: Optional[str] = None
-    tags: Optional[List[constr(min_length=1, max_length=30)]] = None
-
-    @field_validator("title")
-    @classmethod
-    def tidy_title(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return None
-        cleaned = value.strip()
-        if len(cleaned) < 3:
-            raise ValueError("title must contain at least 3 characters")
-        return cleaned
-
-    @field_validator("description")
-    @classmethod
-    def tidy_description(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return None
-        cleaned = value.strip()
-        if len(cleaned) < 10:
-            raise ValueError("description must contain at least 10 characters")
-        return cleaned
-
-    @field_validator("tags", mode="before")
-    @classmethod
-    def tidy_tags(cls, value):
-        if value is None:
-            return None
-
-        if not isinstance(value, list):
-            raise ValueError("tags must be a list")
-
-        cleaned: List[str] = []
-        for raw in value:
-            tag = raw.strip().lower()
-            if not tag:
-                raise ValueError("tag cannot be blank")
-            cleaned.append(tag)
-        return cleaned
-
-    @field_validator("status")
-    @classmethod
-    def tidy_status(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return None
-        cleaned = value.strip().lower()
-        if not cleaned:
-            raise ValueError("status cannot be blank")
-        return cleaned
-
-
-class EvaluationCreate(BaseModel):
-    value: int = Field(..., ge=1, le=10)
-    effort: int = Field(..., ge=1, le=10)
-    confidence: int = Field(..., ge=1, le=10)
-    comment: Optional[constr(max_length=500)] = None
-
-    @field_validator("comment")
-    @classmethod
-    def tidy_comment(cls, value: Optional[str]) -> Optional[str]:
-        if value is None:
-            return None
-        cleaned = value.strip()
-        return cleaned or None
-
-
-class IdeaStorage:
-    """Миниатюрное in-memory хранилище для идей.
-
-    В продакшене здесь будет база данных, но интерфейс оставим тем же самым.
-    """
+def start_attachment_sweeper(interval: float) -> bool:
+    """Запускает сборщик, только если хранилище идей общее или переживает рестарт.
 
-    def __init__(self) -> None:
-        self._ideas: Dict[int, IdeaRecord] = {}
-        self._next_id = 1
-
-    def create(self, payload: IdeaCreate) -> IdeaResponse:
-        """Создаёт идею и возвращает её состояние."""
-        tags = sorted({tag for tag in payload.tags})
-        record = IdeaRecord(
-            id=self._next_id,
-            title=payload.title.strip(),
-            description=payload.description.strip(),
-            tags=tags,
-        )
-        self._ideas[record.id] = record
-        self._next_id += 1
-        return IdeaResponse.from_record(record)
-
-    def list(
-        self,
-        *,
-        tag: Optional[str] = None,
-        status: Optional[IdeaStatus] = None,
-        min_score: Optional[float] = None,
-    ) -> List[IdeaResponse]:
-        ideas = []
-        for record in sorted(self._ideas.values(), key=lambda item: item.id):
-            idea = IdeaResponse.from_record(record)
-            if tag and tag.lower() not in idea.tags:
-                continue
-            if status and idea.status != status:
-                continue
-            if min_score is not None:
-                current_score = idea.score.value
-                if current_score is None or current_score < min_score:
-                    continue
-            ideas.append(idea)
-        return ideas
-
-    def get(self, idea_id: int) -> IdeaResponse:
-        """Возвращает идею по идентификатору или отдаёт 404."""
-        record = self._get_or_raise(idea_id)
-        return IdeaResponse.from_record(record)
-
-    def ensure_exists(self, idea_id: int) -> None:
-        """Проверяет, что идея существует (без аллокаций ответа)."""
-        self._get_or_raise(idea_id)
-
-    def update(self, idea_id: int, payload: IdeaUpdate) -> IdeaResponse:
-        """Обновляет только те поля, которые передал клиент."""
-        record = self._get_or_raise(idea_id)
-
-        if payload.title is not None:
-            record.title = payload.title.strip()
-        if payload.description is not None:
-            record.description = payload.description.strip()
-        if payload.status is not None:
-            try:
-                record.status = IdeaStatus(payload.status)
-            except ValueError:
-                raise ApiProblem(
-                    code="invalid_status",
-                    detail="unsupported status",
-                    status=422,
-                )
-        if payload.tags is not None:
-            record.tags = sorted({tag for tag in payload.tags})
-
-        return IdeaResponse.from_record(record)
-
-    def add_evaluation(self, idea_id: int, payload: EvaluationCreate) -> IdeaResponse:
-        """Добавляет новую оценку и возвращает идею с пересчитанным рейтингом."""
-        record = self._get_or_raise(idea_id)
-        entry = Evaluation(
-            value=payload.value,
-            effort=payload.effort,
-            confidence=payload.confidence,
-            comment=payload.comment,
+    С in-memory хранилищем каждый воркер видит только свои идеи, а после
+    перезапуска — никаких: сборщик удалил бы чужие и все старые вложения.
+    """
+    if interval <= 0:
+        return False
+    if not isinstance(
+        storage, (JournaledIdeaStorage, SQLiteIdeaStorage, ShardedIdeaStorage)
+    ):
+        logger.warning(
+            "IDEA_ATTACHMENT_SWEEP_INTERVAL ignored: the %s backend is per-process, "
+            "use journal, sqlite or sharded storage",
+            type(storage).__name__,
         )
-        record.evaluations.append(entry)
-        return IdeaResponse.from_record(record)
-
-    def evaluations(self, idea_id: int) -> List[Dict[str, object]]:
-        """История оценок для детального просмотра в интерфейсе/тестах."""
-        record = self._get_or_raise(idea_id)
-        history: List[Dict[str, object]] = []
-        for item in record.evaluations:
-            history.append(
-                {
-                    "value": item.value,
-                    "effort": item.effort,
-                    "confidence": item.confidence,
-                    "comment": item.comment,
-                }
-            )
-        return history
-
-    def clear(self) -> None:
-        """Сбрасывает состояние. Используется в тестах."""
-        self._ideas.clear()
-        self._next_id = 1
+        return False
+    attachment_sweeper.start(interval)
+    return True
+
+
+start_attachment_sweeper(
+    _env_int("IDEA_ATTACHMENT_SWEEP_INTERVAL", DEFAULT_SWEEP_INTERVAL_SECONDS)
+)
+
+# Пул для блокирующих вызовов хранилища (SQLite, fsync журнала). Больше
+# потоков, чем соединений в пуле SQLite, не нужно: лишние всё равно ждали бы.
+storage_executor = ThreadPoolExecutor(
+    max_workers=max(1, _env_int("IDEA_SQLITE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+    thread_name_prefix="storage-io",
+)
+_async_storage: Optional[AsyncIdeaStorage] = None
+
+
+def async_storage() -> AsyncIdeaStorage:
+    """Асинхронный фасад над текущим storage; тесты подменяют main.storage."""
+    global _async_storage
+    if _async_storage is None or _async_storage.sync is not storage:
+        _async_storage = AsyncIdeaStorage(storage, executor=storage_executor)
+    return _async_storage
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus: задержки, размеры, отказы."""
+    ideas, evaluations = await async_storage().totals()
+    # У общей mmap-таблицы это обход всех записей — не в event loop.
+    tracked_keys = await anyio.to_thread.run_sync(rate_limiter.tracked_keys)
+    gauges = {
+        "idea_ideas": ("Ideas in the storage.", ideas),
+        "idea_evaluations": ("Evaluations in the storage.", evaluations),
+        "idea_rate_limit_tracked_keys": (
+            "Client keys tracked by the rate limiter.",
+            tracked_keys,
+        ),
+    }
+    return PlainTextResponse(metrics.render(gauges), media_type=CONTENT_TYPE)
 
-    def add_attachment(self, idea_id: int, attachment: str) -> List[str]:
-        record = self._get_or_raise(idea_id)
-        record.attachments.append(attachment)
-        return list(record.attachments)
 
-    def _get_or_raise(self, idea_id: int) -> IdeaRecord:
-        """Утилита, чтобы не дублировать проверку на существование."""
-        if idea_id not in self._ideas:
-            raise ApiProblem(code="idea_not_found", detail="idea not found", status=404)
-        return self._ideas[idea_id]
+def client_key(request: Request) -> str:
+    client_id = request.headers.get("X-Client-Id")
+    if not client_id and request.client:
+        client_id = request.client.host
+    return client_id or "anonymous"
 
 
-storage = IdeaStorage()
+def rate_limit_problem(limit: int) -> ApiProblem:
+    return ApiProblem(
+        code="too_many_requests",
+        detail="per-minute rate limit exceeded for idea creation",
+        status=429,
+        title="Too Many Requests",
+        extras={"limit_per_minute": limit},
+    )
 
 
 @app.post("/ideas", response_model=IdeaResponse, status_code=201)
-def create_idea(request: Request, payload: IdeaCreate):
+async def create_idea(request: Request, payload: IdeaCreate):
     """Создать новую идею о продукте."""
-    client_id = request.headers.get("X-Client-Id")
-    if not client_id and request.client:
-        client_id = request.client.host
-    client_id = client_id or "anonymous"
     limit = rate_limiter.resolve_limit()
-    if not rate_limiter.allow(client_id, limit=limit):
-        raise ApiProblem(
-            code="too_many_requests",
-            detail="per-minute rate limit exceeded for idea creation",
-            status=429,
-            title="Too Many Requests",
-            extras={"limit_per_minute": limit},
-        )
+    if not rate_limiter.allow(client_key(request), limit=limit):
+        metrics.count_rate_limited(route_label(request.scope))
+        raise rate_limit_problem(limit)
     try:
-        return storage.create(payload)
+        return await async_storage().create(payload)
     except ValueError as exc:
         raise ApiProblem(
             code="validation_error",
@@ -413,8 +297,136 @@ def create_idea(request: Request, payload: IdeaCreate):
         )
 
 
+@app.post("/ideas/batch")
+async def create_ideas_batch(request: Request, payload: IdeaBatchCreate):
+    """Создать до MAX_BATCH_SIZE идей за запрос с результатом по каждой.
+
+    Каждый элемент списывается с лимита клиента, но за один проход; идеи,
+    не уложившиеся в лимит, получают 429, невалидные — 422, остальные
+    создаются одной операцией хранилища.
+    """
+    correlation_id = str(uuid4())
+    results: List[Optional[Dict[str, Any]]] = [None] * len(payload.items)
+    accepted: List[Tuple[int, IdeaCreate]] = []
+    for index, item in enumerate(payload.items):
+        try:
+            accepted.append((index, IdeaCreate.model_validate(item)))
+        except ValidationError as exc:
+            results[index] = validation_problem(
+                exc.errors(), detail="batch item validation failed"
+            ).as_dict(correlation_id)
+
+    limit = rate_limiter.resolve_limit()
+    granted = rate_limiter.allow_many(client_key(request), len(accepted), limit=limit)
+    metrics.count_rate_limited(route_label(request.scope), len(accepted) - granted)
+    limited = rate_limit_problem(limit).as_dict(correlation_id)
+    for index, _ in accepted[granted:]:
+        results[index] = limited
+
+    accepted = accepted[:granted]
+    ids = await async_storage().create_many([item for _, item in accepted])
+    for (index, _), idea_id in zip(accepted, ids):
+        results[index] = {"status": 201, "id": idea_id}
+    return JSONResponse(
+        {"created": len(ids), "results": results},
+        headers={"X-Correlation-Id": correlation_id},
+    )
+
+
+@app.post("/ideas/evaluations/batch")
+async def evaluate_ideas_batch(payload: EvaluationBatchCreate):
+    """Принять пачку оценок для разных идей и вернуть краткую сводку по идеям.
+
+    Оценки группируются по идее и применяются одной операцией хранилища:
+    суммы и индекс по оценке обновляются один раз на идею. Полный
+    IdeaResponse не собирается — в ответе только новые средние по идее.
+    """
+    correlation_id = str(uuid4())
+    errors: List[Dict[str, Any]] = []
+    batches: Dict[int, List[EvaluationCreate]] = {}
+    positions: Dict[int, List[int]] = {}
+    for index, item in enumerate(payload.items):
+        try:
+            evaluation = EvaluationBatchItem.model_validate(item)
+        except ValidationError as exc:
+            problem = validation_problem(
+                exc.errors(), detail="batch item validation failed"
+            )
+            errors.append({"index": index, **problem.as_dict(correlation_id)})
+            continue
+        batches.setdefault(evaluation.idea_id, []).append(evaluation)
+        positions.setdefault(evaluation.idea_id, []).append(index)
+
+    scores = await async_storage().add_evaluations(batches)
+    missing = ApiProblem(
+        code="idea_not_found", detail="idea not found", status=404
+    ).as_dict(correlation_id)
+    for idea_id, indexes in positions.items():
+        if idea_id not in scores:
+            errors.extend({"index": index, **missing} for index in indexes)
+    errors.sort(key=lambda error: error["index"])
+    return JSONResponse(
+        {
+            "applied": sum(len(batches[idea_id]) for idea_id in scores),
+            "ideas": [
+                {
+                    "id": idea_id,
+                    "added": len(batches[idea_id]),
+                    "score": score.model_dump(),
+                }
+                for idea_id, score in scores.items()
+            ],
+            "errors": errors,
+        },
+        headers={"X-Correlation-Id": correlation_id},
+    )
+
+
+def parse_status_filter(status: Optional[str]) -> Optional[IdeaStatus]:
+    if not status:
+        return None
+    return parse_status(status)
+
+
+def encode_cursor(position: int, key: str = "after") -> str:
+    """Непрозрачный курсор: клиент не должен опираться на его формат.
+
+    Для обычного списка это последний отданный id (after), для поиска по
+    релевантности — смещение в выдаче (offset).
+    """
+    raw = json.dumps({key: position}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key: str = "after") -> int:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        position = payload[key]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        position = None
+    if not isinstance(position, int) or isinstance(position, bool) or position < 0:
+        raise ApiProblem(
+            code="invalid_cursor",
+            detail="cursor is malformed",
+            status=422,
+        )
+    return position
+
+
+def json_bytes_response(body: bytes, headers: Dict[str, str]) -> Response:
+    """Готовые JSON-байты отдаются как есть, минуя response_model."""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    return header is not None and etag_matches(header, etag)
+
+
 @app.get("/ideas", response_model=List[IdeaResponse])
-def list_ideas(
+async def list_ideas(
+    request: Request,
     tag: Optional[str] = Query(default=None, description="Filter ideas by tag"),
     min_score: Optional[float] = Query(
         default=None,
@@ -425,30 +437,189 @@ def list_ideas(
     status: Optional[str] = Query(
         default=None, description="Filter by workflow status"
     ),
+    limit: int = Query(
+        default=DEFAULT_PAGE_SIZE,
+        ge=1,
+        le=MAX_PAGE_SIZE,
+        description="Maximum number of ideas in one page",
+    ),
+    cursor: Optional[str] = Query(
+        default=None,
+        description="Opaque cursor from the X-Next-Cursor header of the previous page",
+    ),
+    q: Optional[str] = Query(
+        default=None,
+        min_length=1,
+        max_length=MAX_SEARCH_QUERY_LENGTH,
+        description="Full-text search over title and description, ranked by BM25",
+    ),
+    sort: Optional[IdeaSort] = Query(
+        default=None,
+        description="Order by impact, average value or vote count, highest first",
+    ),
+    top: Optional[int] = Query(
+        default=None,
+        ge=1,
+        le=MAX_PAGE_SIZE,
+        description="Return only the first K ideas of the sort order, without a cursor",
+    ),
 ):
-    """Получить список идей с простыми фильтрами."""
-    status_filter: Optional[IdeaStatus] = None
-    if status:
-        try:
-            status_filter = IdeaStatus(status)
-        except ValueError:
-            raise ApiProblem(
-                code="invalid_status",
-                detail="unsupported status",
-                status=422,
+    """Получить страницу идей с простыми фильтрами.
+
+    С `q` идеи отбираются полнотекстовым поиском и идут по убыванию
+    релевантности, с `sort` — по убыванию выбранной метрики (при равенстве по
+    id, идеи без оценок в конце), иначе — по возрастанию id. `top=K` отдаёт
+    первые K идей выбранного порядка одной страницей. Если есть следующая страница,
+    её курсор приходит в заголовке X-Next-Cursor (и в Link с rel="next").
+    ETag меняется при любой мутации хранилища.
+    Тело склеивается из закэшированных JSON-фрагментов идей, поэтому
+    response_model здесь только описывает схему.
+    """
+    status_filter = parse_status_filter(status)
+    if sort is not None and q is not None:
+        raise ApiProblem(
+            code="validation_error",
+            detail="sort cannot be combined with q: search is ordered by relevance",
+            status=422,
+        )
+    if top is not None and (sort is None or cursor is not None):
+        raise ApiProblem(
+            code="validation_error",
+            detail="top requires sort and cannot be combined with cursor",
+            status=422,
+        )
+    ordered = q is not None or sort is not None
+    cursor_key = "offset" if ordered else "after"
+    position = decode_cursor(cursor, cursor_key) if cursor else None
+    # ETag снимаем до чтения: если запись изменится между ними, клиент
+    # получит более старый ETag и просто перезапросит страницу.
+    ideas_store = async_storage()
+    etag = await ideas_store.list_etag()
+    headers = {"ETag": etag}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Берём на одну идею больше, чтобы понять, есть ли следующая страница.
+    filters = {"tag": tag, "status": status_filter, "min_score": min_score}
+    offset = position or 0
+    if top is not None:
+        ideas = await ideas_store.ranked_json(sort, **filters, limit=top)
+    elif sort is not None:
+        ideas = await ideas_store.ranked_json(
+            sort, **filters, offset=offset, limit=limit + 1
+        )
+    elif q is not None:
+        ideas = await ideas_store.search_json(
+            q, **filters, offset=offset, limit=limit + 1
+        )
+    else:
+        ideas = await ideas_store.list_json(
+            **filters, after_id=position, limit=limit + 1
+        )
+    if top is None and len(ideas) > limit:
+        ideas = ideas[:limit]
+        if ordered:
+            next_cursor = encode_cursor(offset + limit, "offset")
+        else:
+            next_cursor = encode_cursor(ideas[-1][0])
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return json_bytes_response(join_json_array(data for _, data in ideas), headers)
+
+
+async def iter_export_lines(
+    *,
+    tag: Optional[str],
+    status: Optional[IdeaStatus],
+    min_score: Optional[float],
+    include_evaluations: bool,
+) -> AsyncIterator[bytes]:
+    """Отдаёт идеи построчно, читая хранилище пачками через keyset-курсор.
+
+    В памяти одновременно живёт не больше EXPORT_BATCH_SIZE ответов, а
+    записи, появившиеся во время выгрузки, не ломают порядок и не дублируются.
+    """
+    ideas_store = async_storage()
+    after_id: Optional[int] = None
+    while True:
+        batch = await ideas_store.list_json(
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=after_id,
+            limit=EXPORT_BATCH_SIZE,
+        )
+        if include_evaluations:
+            # Одна выборка на пачку; массив вклеивается в готовый фрагмент
+            # перед закрывающей скобкой объекта, без разбора JSON.
+            histories = await ideas_store.evaluations_many(
+                [idea_id for idea_id, _ in batch]
             )
+            for idea_id, data in batch:
+                evaluations = json.dumps(
+                    histories.get(idea_id, []),
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                ).encode()
+                yield data[:-1] + b',"evaluations":' + evaluations + b"}\n"
+        else:
+            for _, data in batch:
+                yield data + b"\n"
+        if len(batch) < EXPORT_BATCH_SIZE:
+            return
+        after_id = batch[-1][0]
+
+
+@app.get("/ideas/export")
+async def export_ideas(
+    tag: Optional[str] = Query(default=None, description="Filter ideas by tag"),
+    min_score: Optional[float] = Query(
+        default=None,
+        ge=0,
+        le=10,
+        description="Only return ideas with average value score at or above this number",
+    ),
+    status: Optional[str] = Query(
+        default=None, description="Filter by workflow status"
+    ),
+    include_evaluations: bool = Query(
+        default=False, description="Embed the evaluation history into every line"
+    ),
+):
+    """Потоковая выгрузка каталога в NDJSON для ночной синхронизации."""
+    lines = iter_export_lines(
+        tag=tag,
+        status=parse_status_filter(status),
+        min_score=min_score,
+        include_evaluations=include_evaluations,
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
 
-    return storage.list(tag=tag, status=status_filter, min_score=min_score)
+
+@app.get("/ideas/analytics", response_model=EvaluationAnalytics)
+async def evaluation_analytics(
+    group_by: AnalyticsGroupBy = Query(
+        default=AnalyticsGroupBy.status,
+        description="Group evaluation statistics by idea tag or workflow status",
+    ),
+):
+    """Среднее, перцентили и гистограммы value/effort/confidence по группам идей."""
+    return await async_storage().evaluation_analytics(group_by)
 
 
 @app.get("/ideas/{idea_id}", response_model=IdeaResponse)
-def get_idea(idea_id: int):
+async def get_idea(idea_id: int, request: Request):
     """Вернуть одну идею. Полезно для карточки в интерфейсе."""
-    return storage.get(idea_id)
+    ideas_store = async_storage()
+    headers = {"ETag": await ideas_store.record_etag(idea_id)}
+    if not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return json_bytes_response(await ideas_store.get_json(idea_id), headers)
 
 
 @app.patch("/ideas/{idea_id}", response_model=IdeaResponse)
-def update_idea(idea_id: int, payload: IdeaUpdate):
+async def update_idea(idea_id: int, payload: IdeaUpdate):
     """Обновить описание, статус или теги существующей идеи."""
     updates = payload.model_dump(exclude_unset=True)
     if not updates:
@@ -458,46 +629,122 @@ def update_idea(idea_id: int, payload: IdeaUpdate):
             status=422,
         )
 
-    return storage.update(idea_id, payload)
+    return await async_storage().update(idea_id, payload)
 
 
 @app.post("/ideas/{idea_id}/evaluations", response_model=IdeaResponse)
-def evaluate_idea(idea_id: int, payload: EvaluationCreate):
+async def evaluate_idea(idea_id: int, payload: EvaluationCreate):
     """Сохранить свежую оценку и вернуть пересчитанный рейтинг."""
-    return storage.add_evaluation(idea_id, payload)
+    return await async_storage().add_evaluation(idea_id, payload)
 
 
 @app.get("/ideas/{idea_id}/evaluations")
-def list_evaluations(idea_id: int):
+async def list_evaluations(idea_id: int):
     """Посмотреть все оценки, которые команда оставила по идее."""
-    return storage.evaluations(idea_id)
+    return await async_storage().evaluations(idea_id)
+
+
+ATTACHMENT_ERROR_STATUS = {
+    "attachment_bad_type": 415,
+    "attachment_too_large": 413,
+    "attachment_not_found": 404,
+    "attachment_storage_busy": 503,
+}
+
+
+def attachment_problem(error: AttachmentValidationError) -> ApiProblem:
+    metrics.count_attachment_error(error.code)
+    return ApiProblem(
+        code=error.code,
+        detail=error.detail,
+        status=ATTACHMENT_ERROR_STATUS.get(error.code, 400),
+    )
 
 
 @app.post("/ideas/{idea_id}/attachments", status_code=201)
 async def upload_attachment(idea_id: int, file: UploadFile = File(...)):
     """Безопасно сохранить вложение, проверяя сигнатуру и размер."""
-    storage.ensure_exists(idea_id)
-    data = await file.read()
+    ideas_store = async_storage()
+    await ideas_store.ensure_exists(idea_id)
     try:
-        stored = attachment_storage.save(data)
+        # Читаем по чанкам: в памяти не больше ATTACHMENT_CHUNK_SIZE байт, а
+        # неподходящая сигнатура или превышение лимита обрывают загрузку сразу.
+        # Запись на диск идёт в отдельном пуле, чтобы не блокировать event loop.
+        size = 0
+        async with await attachment_storage.open_writer_async() as writer:
+            while chunk := await file.read(ATTACHMENT_CHUNK_SIZE):
+                await writer.write(chunk)
+                size += len(chunk)
+            stored = await writer.commit()
     except AttachmentValidationError as error:
-        status_map = {
-            "attachment_bad_type": 415,
-            "attachment_too_large": 413,
-        }
-        raise ApiProblem(
-            code=error.code,
-            detail=error.detail,
-            status=status_map.get(error.code, 400),
-        )
+        raise attachment_problem(error)
 
     try:
-        attachments = storage.add_attachment(idea_id, stored.filename)
+        attachments = await ideas_store.add_attachment(idea_id, stored.filename)
     except ApiProblem:
-        attachment_storage.delete(stored.filename)
+        await attachment_storage.delete_async(stored.filename)
         raise
+    # Считаем только то, что осталось на диске: отклонённая загрузка удаляется,
+    # а дубль по содержимому ссылается на уже записанный файл.
+    if not stored.deduplicated:
+        metrics.count_attachment_bytes(size)
     return {
         "attachment_id": stored.filename,
         "content_type": stored.content_type,
         "attachments": attachments,
     }
+
+
+@app.api_route("/ideas/{idea_id}/attachments/{attachment_id}", methods=["GET", "HEAD"])
+async def download_attachment(idea_id: int, attachment_id: str, request: Request):
+    """Отдать вложение идеи с поддержкой Range, ETag и долгого кэширования."""
+    idea = await async_storage().get(idea_id)
+    if attachment_id not in idea.attachments:
+        raise ApiProblem(
+            code="attachment_not_found",
+            detail="attachment not found",
+            status=404,
+        )
+    try:
+        attachment = await attachment_storage.run_io(
+            attachment_storage.lookup, attachment_id
+        )
+    except AttachmentValidationError as error:
+        raise attachment_problem(error)
+
+    headers = attachment_headers(attachment)
+    if not_modified(request, attachment.etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header is not None and (if_range is None or if_range == attachment.etag):
+        try:
+            byte_range = parse_range(range_header, attachment.size)
+        except RangeNotSatisfiable:
+            response = ApiProblem(
+                code="range_not_satisfiable",
+                detail="requested range is outside the attachment",
+                status=416,
+            ).as_response(request)
+            response.headers["Content-Range"] = f"bytes */{attachment.size}"
+            return response
+    try:
+        handle = await attachment_storage.run_io(open, attachment.path, "rb")
+    except FileNotFoundError:
+        # Файл удалили между lookup и отдачей.
+        raise ApiProblem(
+            code="attachment_not_found",
+            detail="attachment file not found",
+            status=404,
+        )
+    except AttachmentValidationError as error:
+        raise attachment_problem(error)
+    return AttachmentFileResponse(
+        attachment,
+        handle,
+        run_io=attachment_storage.run_io,
+        byte_range=byte_range,
+        headers=headers,
+    )
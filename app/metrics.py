@@ -0,0 +1,186 @@
+"""Метрики сервиса в текстовом формате Prometheus (GET /metrics).
+
+Горячий путь — наблюдение за запросом в MetricsMiddleware: два perf_counter,
+поиск гистограммы по (метод, маршрут, статус) и bisect по заранее заданным
+границам корзин. Блокировок нет: обработчики async и все счётчики меняются
+только в потоке event loop, а снимок для /metrics собирается там же. Каждый
+воркер uvicorn считает свои запросы; размеры хранилища общие.
+"""
+
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Tuple
+
+# Границы корзин задержки в секундах, как у клиентов Prometheus по умолчанию,
+# но с более мелкими корзинами снизу: in-memory запросы укладываются в миллисекунду.
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+UNMATCHED_ROUTE = "<unmatched>"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами; counts[i] — попадания в корзину i."""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # Последняя ячейка — всё, что больше верхней границы (+Inf).
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        """Накопленные счётчики по корзинам, как их ждёт формат Prometheus."""
+        running, result = 0, []
+        for count in self.counts:
+            running += count
+            result.append(running)
+        return result
+
+
+def route_label(scope: Mapping[str, Any]) -> str:
+    """Шаблон маршрута (/ideas/{idea_id}), а не путь: число серий ограничено."""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+class Metrics:
+    """Счётчики и гистограммы сервиса."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self._buckets = buckets
+        self.requests: Dict[Tuple[str, str, int], Histogram] = {}
+        self.rate_limited: Dict[str, int] = {}
+        self.attachment_bytes = 0
+        self.attachment_errors: Dict[str, int] = {}
+
+    def observe_request(
+        self, method: str, route: str, status: int, seconds: float
+    ) -> None:
+        key = (method, route, status)
+        histogram = self.requests.get(key)
+        if histogram is None:
+            histogram = self.requests[key] = Histogram(self._buckets)
+        histogram.observe(seconds)
+
+    def count_rate_limited(self, route: str, count: int = 1) -> None:
+        if count:
+            self.rate_limited[route] = self.rate_limited.get(route, 0) + count
+
+    def count_attachment_bytes(self, size: int) -> None:
+        self.attachment_bytes += size
+
+    def count_attachment_error(self, code: str) -> None:
+        self.attachment_errors[code] = self.attachment_errors.get(code, 0) + 1
+
+    def reset(self) -> None:
+        self.requests.clear()
+        self.rate_limited.clear()
+        self.attachment_bytes = 0
+        self.attachment_errors.clear()
+
+    def render(self, gauges: Mapping[str, Tuple[str, float]]) -> str:
+        """Текст для /metrics; gauges — имя -> (описание, значение) на момент опроса."""
+        lines: List[str] = []
+        name = "idea_http_request_duration_seconds"
+        _header(
+            lines, name, "histogram", "Request latency by method, route and status."
+        )
+        bounds = [_format_value(bound) for bound in self._buckets] + ["+Inf"]
+        for (method, route, status), histogram in sorted(self.requests.items()):
+            labels = _labels(method=method, route=route, status=str(status))
+            for bound, count in zip(bounds, histogram.cumulative()):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {_format_value(histogram.total)}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        for gauge, (description, value) in gauges.items():
+            _header(lines, gauge, "gauge", description)
+            lines.append(f"{gauge} {_format_value(value)}")
+
+        name = "idea_rate_limited_total"
+        _header(lines, name, "counter", "Requests and batch items rejected with 429.")
+        _samples(lines, name, "route", self.rate_limited.items())
+        name = "idea_attachment_bytes_written_total"
+        _header(lines, name, "counter", "Attachment bytes written to disk.")
+        lines.append(f"{name} {self.attachment_bytes}")
+        name = "idea_attachment_errors_total"
+        _header(lines, name, "counter", "Rejected attachment operations by error code.")
+        _samples(lines, name, "code", self.attachment_errors.items())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка каждого HTTP-запроса до конца ответа."""
+
+    def __init__(self, app: Callable[..., Awaitable[None]], metrics: Metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = perf_counter()
+        # Если приложение упадёт до ответа, снаружи ответят 500.
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.observe_request(
+                scope["method"], route_label(scope), status, perf_counter() - started
+            )
+
+
+def _header(lines: List[str], name: str, kind: str, description: str) -> None:
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _samples(
+    lines: List[str], name: str, label: str, values: Iterable[Tuple[str, int]]
+) -> None:
+    for key, value in sorted(values):
+        lines.append(f"{name}{{{_labels(**{label: key})}}} {value}")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,406 @@
+"""Доменные записи и схемы запросов/ответов каталога идей.
+
+Модели не зависят от конкретного хранилища: их используют и in-memory
+IdeaStorage, и SQLite-бэкенд.
+"""
+
+from array import array
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from pydantic import BaseModel, Field, constr, field_validator
+
+from app.problem_details import ApiProblem
+
+MAX_BATCH_SIZE = 500
+MAX_EVALUATION_BATCH_SIZE = 2000
+
+
+class IdeaStatus(str, Enum):
+    """Статус идеи в жизненном цикле каталога."""
+
+    draft = "draft"
+    in_review = "in_review"
+    approved = "approved"
+    archived = "archived"
+
+
+class IdeaSort(str, Enum):
+    """Метрики для сортировки списка: по убыванию, при равенстве — по id."""
+
+    impact = "impact"
+    value = "value"
+    votes = "votes"
+
+
+class AnalyticsGroupBy(str, Enum):
+    """Разрез статистики по оценкам."""
+
+    tag = "tag"
+    status = "status"
+
+
+def parse_status(value: str) -> IdeaStatus:
+    """Переводит строку в IdeaStatus или отдаёт 422 invalid_status."""
+    try:
+        return IdeaStatus(value)
+    except ValueError:
+        raise ApiProblem(
+            code="invalid_status",
+            detail="unsupported status",
+            status=422,
+        )
+
+
+@dataclass(slots=True)
+class Evaluation:
+    value: int
+    effort: int
+    confidence: int
+    comment: Optional[str] = None
+
+
+class PackedEvaluations:
+    """История оценок идеи в компактном виде: по array('B') на метрику.
+
+    Оценки 1..10 занимают байт вместо объекта Evaluation на голос.
+    Комментарии редки и лежат в отдельной таблице «номер оценки -> текст»,
+    которая создаётся только при первом комментарии. Снаружи ведёт себя как
+    список Evaluation: len, итерация, индекс, append и extend.
+    """
+
+    __slots__ = ("value", "effort", "confidence", "comments")
+
+    def __init__(self, entries: Iterable[Evaluation] = ()) -> None:
+        self.value = array("B")
+        self.effort = array("B")
+        self.confidence = array("B")
+        self.comments: Optional[Dict[int, str]] = None
+        self.extend(entries)
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __iter__(self) -> Iterator[Evaluation]:
+        comments = self.comments or {}
+        for index, scores in enumerate(zip(self.value, self.effort, self.confidence)):
+            yield Evaluation(*scores, comment=comments.get(index))
+
+    def __getitem__(self, index: int) -> Evaluation:
+        index = range(len(self))[index]
+        comment = self.comments.get(index) if self.comments else None
+        return Evaluation(
+            self.value[index], self.effort[index], self.confidence[index], comment
+        )
+
+    def append(self, entry: Evaluation) -> None:
+        if entry.comment is not None:
+            if self.comments is None:
+                self.comments = {}
+            self.comments[len(self.value)] = entry.comment
+        self.value.append(entry.value)
+        self.effort.append(entry.effort)
+        self.confidence.append(entry.confidence)
+
+    def extend(self, entries: Iterable[Evaluation]) -> None:
+        for entry in entries:
+            self.append(entry)
+
+
+@dataclass(slots=True)
+class IdeaRecord:
+    id: int
+    title: str
+    description: str
+    # В компактном режиме хранилища — кортеж интернированных строк.
+    tags: Sequence[str]
+    status: IdeaStatus = IdeaStatus.draft
+    evaluations: Union[List[Evaluation], PackedEvaluations] = field(
+        default_factory=list
+    )
+    attachments: List[str] = field(default_factory=list)
+    # Накопленные суммы оценок, чтобы не пересчитывать рейтинг по всей истории.
+    value_total: int = 0
+    effort_total: int = 0
+    confidence_total: int = 0
+    # Растёт на каждой мутации записи; вместе с эпохой хранилища даёт ETag.
+    version: int = 1
+
+    def append_evaluation(self, entry: Evaluation) -> None:
+        """Добавляет оценку и обновляет накопленные суммы за O(1)."""
+        self.evaluations.append(entry)
+        self.value_total += entry.value
+        self.effort_total += entry.effort
+        self.confidence_total += entry.confidence
+
+    def extend_evaluations(self, entries: Sequence[Evaluation]) -> None:
+        """Добавляет пачку оценок, обновляя суммы один раз."""
+        self.evaluations.extend(entries)
+        self.value_total += sum(entry.value for entry in entries)
+        self.effort_total += sum(entry.effort for entry in entries)
+        self.confidence_total += sum(entry.confidence for entry in entries)
+
+    @property
+    def score_value(self) -> Optional[float]:
+        """Средняя ценность с тем же округлением, что и в ScoreSummary.value."""
+        if not self.evaluations:
+            return None
+        return round(self.value_total / len(self.evaluations), 2)
+
+    @property
+    def impact_value(self) -> Optional[float]:
+        """impact с тем же округлением, что и в ScoreSummary.impact."""
+        votes = len(self.evaluations)
+        if not votes:
+            return None
+        return compute_impact(
+            round(self.value_total / votes, 2),
+            round(self.confidence_total / votes, 2),
+            round(self.effort_total / votes, 2),
+        )
+
+    def sort_value(self, sort: "IdeaSort") -> Optional[float]:
+        """Значение метрики сортировки; None — у идеи ещё нет оценок."""
+        if sort is IdeaSort.votes:
+            return len(self.evaluations)
+        if sort is IdeaSort.value:
+            return self.score_value
+        return self.impact_value
+
+
+def compute_impact(value: float, confidence: float, effort: float) -> float:
+    return round((value * confidence) / max(effort, 1), 2)
+
+
+class ScoreSummary(BaseModel):
+    value: Optional[float] = None
+    confidence: Optional[float] = None
+    effort: Optional[float] = None
+    impact: Optional[float] = None
+    votes: int = 0
+
+    @classmethod
+    def from_evaluations(cls, evaluations: List[Evaluation]) -> "ScoreSummary":
+        """Считает усреднённые метрики по всем оценкам идеи."""
+        total_value = 0
+        total_confidence = 0
+        total_effort = 0
+
+        for item in evaluations:
+            total_value += item.value
+            total_confidence += item.confidence
+            total_effort += item.effort
+
+        return cls.from_totals(
+            votes=len(evaluations),
+            total_value=total_value,
+            total_effort=total_effort,
+            total_confidence=total_confidence,
+        )
+
+    @classmethod
+    def from_totals(
+        cls,
+        *,
+        votes: int,
+        total_value: int,
+        total_effort: int,
+        total_confidence: int,
+    ) -> "ScoreSummary":
+        """Считает усреднённые метрики по заранее накопленным суммам."""
+        if not votes:
+            return cls()
+
+        avg_value = round(total_value / votes, 2)
+        avg_confidence = round(total_confidence / votes, 2)
+        avg_effort = round(total_effort / votes, 2)
+        impact = compute_impact(avg_value, avg_confidence, avg_effort)
+
+        return cls(
+            value=avg_value,
+            confidence=avg_confidence,
+            effort=avg_effort,
+            impact=impact,
+            votes=votes,
+        )
+
+
+class IdeaResponse(BaseModel):
+    id: int
+    title: str
+    description: str
+    tags: List[str]
+    status: IdeaStatus
+    score: ScoreSummary
+    attachments: List[str]
+
+    @classmethod
+    def from_record(cls, record: IdeaRecord) -> "IdeaResponse":
+        """Создаёт ответ API на основе состояния в памяти."""
+        score = ScoreSummary.from_totals(
+            votes=len(record.evaluations),
+            total_value=record.value_total,
+            total_effort=record.effort_total,
+            total_confidence=record.confidence_total,
+        )
+        return cls(
+            id=record.id,
+            title=record.title,
+            description=record.description,
+            tags=record.tags,
+            status=record.status,
+            score=score,
+            attachments=list(record.attachments),
+        )
+
+
+class MetricStatistics(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+    # Число голосов за каждую оценку от 1 до 10.
+    histogram: List[int]
+
+
+class GroupStatistics(BaseModel):
+    # None — сводка по всему каталогу.
+    key: Optional[str] = None
+    ideas: int
+    evaluations: int
+    value: MetricStatistics
+    effort: MetricStatistics
+    confidence: MetricStatistics
+
+
+class EvaluationAnalytics(BaseModel):
+    group_by: AnalyticsGroupBy
+    total: GroupStatistics
+    groups: List[GroupStatistics]
+
+
+class IdeaCreate(BaseModel):
+    title: constr(min_length=3, max_length=120)
+    description: constr(min_length=10, max_length=2000)
+    tags: List[constr(min_length=1, max_length=30)] = Field(default_factory=list)
+
+    @field_validator("title")
+    @classmethod
+    def tidy_title(cls, value: str) -> str:
+        cleaned = value.strip()
+        if len(cleaned) < 3:
+            raise ValueError("title must contain at least 3 characters")
+        return cleaned
+
+    @field_validator("description")
+    @classmethod
+    def tidy_description(cls, value: str) -> str:
+        cleaned = value.strip()
+        if len(cleaned) < 10:
+            raise ValueError("description must contain at least 10 characters")
+        return cleaned
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def tidy_tags(cls, value):
+        if value is None:
+            return []
+
+        if not isinstance(value, list):
+            raise ValueError("tags must be a list")
+
+        cleaned: List[str] = []
+        for raw in value:
+            if not isinstance(raw, str):
+                raise ValueError("tags must be strings")
+            tag = raw.strip().lower()
+            if not tag:
+                raise ValueError("tag cannot be blank")
+            cleaned.append(tag)
+        return cleaned
+
+
+class IdeaBatchCreate(BaseModel):
+    # Элементы проверяются по одному в обработчике, чтобы ошибка в одном
+    # не отклоняла всю пачку.
+    items: List[Any] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class IdeaUpdate(BaseModel):
+    title: Optional[constr(min_length=3, max_length=120)] = None
+    description: Optional[constr(min_length=10, max_length=2000)] = None
+    status: Optional[str] = None
+    tags: Optional[List[constr(min_length=1, max_length=30)]] = None
+
+    @field_validator("title")
+    @classmethod
+    def tidy_title(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        cleaned = value.strip()
+        if len(cleaned) < 3:
+            raise ValueError("title must contain at least 3 characters")
+        return cleaned
+
+    @field_validator("description")
+    @classmethod
+    def tidy_description(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        cleaned = value.strip()
+        if len(cleaned) < 10:
+            raise ValueError("description must contain at least 10 characters")
+        return cleaned
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def tidy_tags(cls, value):
+        if value is None:
+            return None
+
+        if not isinstance(value, list):
+            raise ValueError("tags must be a list")
+
+        cleaned: List[str] = []
+        for raw in value:
+            tag = raw.strip().lower()
+            if not tag:
+                raise ValueError("tag cannot be blank")
+            cleaned.append(tag)
+        return cleaned
+
+    @field_validator("status")
+    @classmethod
+    def tidy_status(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        cleaned = value.strip().lower()
+        if not cleaned:
+            raise ValueError("status cannot be blank")
+        return cleaned
+
+
+class EvaluationCreate(BaseModel):
+    value: int = Field(..., ge=1, le=10)
+    effort: int = Field(..., ge=1, le=10)
+    confidence: int = Field(..., ge=1, le=10)
+    comment: Optional[constr(max_length=500)] = None
+
+    @field_validator("comment")
+    @classmethod
+    def tidy_comment(cls, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        cleaned = value.strip()
+        return cleaned or None
+
+
+class EvaluationBatchItem(EvaluationCreate):
+    idea_id: int = Field(..., ge=1)
+
+
+class EvaluationBatchCreate(BaseModel):
+    # Как и в IdeaBatchCreate, элементы проверяются по одному в обработчике.
+    items: List[Any] = Field(min_length=1, max_length=MAX_EVALUATION_BATCH_SIZE)
@@ -32,20 +32,16 @@ def _merge_extras(
     return payload
 
 
-def problem_response(
+def problem_payload(
     *,
     status: int,
     code: str,
     detail: str,
-    request: Optional[Request] = None,
+    correlation_id: str,
     title: Optional[str] = None,
     type_: Optional[str] = None,
     extras: Optional[Dict[str, Any]] = None,
-) -> JSONResponse:
-    correlation_id = str(uuid4())
-    if request is not None:
-        request.state.correlation_id = correlation_id
-
+) -> Dict[str, Any]:
     payload: Dict[str, Any] = {
         "type": type_ or _problem_type(code),
         "title": title or _default_title(code),
@@ -54,8 +50,32 @@ def problem_response(
         "correlation_id": correlation_id,
         "code": code,
     }
-    payload = _merge_extras(payload, extras)
+    return _merge_extras(payload, extras)
 
+
+def problem_response(
+    *,
+    status: int,
+    code: str,
+    detail: str,
+    request: Optional[Request] = None,
+    title: Optional[str] = None,
+    type_: Optional[str] = None,
+    extras: Optional[Dict[str, Any]] = None,
+) -> JSONResponse:
+    correlation_id = str(uuid4())
+    if request is not None:
+        request.state.correlation_id = correlation_id
+
+    payload = problem_payload(
+        status=status,
+        code=code,
+        detail=detail,
+        correlation_id=correlation_id,
+        title=title,
+        type_=type_,
+        extras=extras,
+    )
     response = JSONResponse(payload, status_code=status)
     response.headers["X-Correlation-Id"] = correlation_id
     return response
@@ -80,3 +100,15 @@ class ApiProblem(Exception):
             type_=self.type_,
             extras=self.extras,
         )
+
+    def as_dict(self, correlation_id: str) -> Dict[str, Any]:
+        """Тело проблемы для вложения в ответ (например, элемент пакетного ответа)."""
+        return problem_payload(
+            status=self.status,
+            code=self.code,
+            detail=self.detail,
+            correlation_id=correlation_id,
+            title=self.title,
+            type_=self.type_,
+            extras=self.extras,
+        )
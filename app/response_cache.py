@@ -0,0 +1,84 @@
+"""Кэш готовых JSON-байтов ответа по каждой идее.
+
+Фрагмент хранится вместе с версией записи, от которой он построен: мутация
+увеличивает версию, и следующий запрос просто не узнаёт старый фрагмент.
+Списки собираются склейкой фрагментов, без повторной сборки IdeaResponse и
+валидации через response_model.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from app.models import IdeaResponse
+
+# Ограничение по умолчанию для всех бэкендов: столько последних прочитанных
+# ответов живёт в кэше.
+DEFAULT_CACHE_ENTRIES = 20_000
+ENV_CACHE_ENTRIES = "IDEA_JSON_CACHE_SIZE"
+
+_IDEA_RESPONSE = TypeAdapter(IdeaResponse)
+
+
+def cache_entries_from_env() -> int:
+    """Размер кэша из IDEA_JSON_CACHE_SIZE; опечатка в значении — ошибка старта."""
+    raw = os.getenv(ENV_CACHE_ENTRIES, "").strip()
+    if not raw:
+        return DEFAULT_CACHE_ENTRIES
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        raise ValueError(
+            f"{ENV_CACHE_ENTRIES} must be an integer, got {raw!r}"
+        ) from None
+
+
+def serialize_idea(response: IdeaResponse) -> bytes:
+    return _IDEA_RESPONSE.dump_json(response)
+
+
+def join_json_array(fragments: Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(fragments) + b"]"
+
+
+class ResponseCache:
+    """id идеи -> (версия, JSON-байты); max_entries=None — без ограничения.
+
+    С ограничением вытесняются давно не читанные записи (LRU).
+    """
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[Hashable, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, idea_id: int, version: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(idea_id)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.max_entries is not None:
+                self._entries.move_to_end(idea_id)
+            return entry[1]
+
+    def put(self, idea_id: int, version: Hashable, data: bytes) -> None:
+        with self._lock:
+            self._entries[idea_id] = (version, data)
+            if self.max_entries is not None:
+                self._entries.move_to_end(idea_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
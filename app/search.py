@@ -0,0 +1,230 @@
+"""Полнотекстовый поиск по названию и описанию идей: инвертированный индекс и BM25.
+
+Токенизатор общий для обоих бэкендов: SQLite-бэкенд кладёт в FTS5 уже
+нормализованные токены, поэтому находит ровно то же, что и индекс в памяти.
+"""
+
+import heapq
+import math
+import re
+from collections import Counter
+from typing import AbstractSet, Dict, List, Optional, Set, Tuple
+
+# Параметры BM25 как у FTS5: k1 = 1.2, b = 0.75.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# FTS5 не даёт idf опуститься до нуля и ниже для слов, которые есть почти везде.
+BM25_IDF_FLOOR = 1e-6
+MAX_QUERY_TERMS = 32
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова из букв и цифр любого алфавита в нижнем регистре; «ё» ищется как «е»."""
+    return _TOKEN.findall(text.casefold().replace("ё", "е"))
+
+
+def query_terms(query: str) -> List[str]:
+    """Уникальные токены запроса в исходном порядке (не больше MAX_QUERY_TERMS)."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def idea_text(title: str, description: str) -> str:
+    return f"{title}\n{description}"
+
+
+def bm25_idf(documents: int, frequency: int) -> float:
+    return max(
+        math.log((documents - frequency + 0.5) / (frequency + 0.5)), BM25_IDF_FLOOR
+    )
+
+
+def _by_relevance(item: Tuple[int, float]) -> Tuple[float, int]:
+    return -item[1], item[0]
+
+
+class SearchIndex:
+    """Инвертированный индекс по токенам с ранжированием BM25 (OR-семантика).
+
+    Постинги токена сгруппированы по паре (частота в документе, длина
+    документа): у всех документов группы одинаковый вклад в BM25, поэтому
+    он считается один раз на группу, а группы можно обходить по убыванию
+    вклада и останавливаться, набрав offset + limit результатов.
+
+    Обновляется инкрементально: add/remove трогают только группы токенов
+    самого документа.
+    """
+
+    def __init__(self) -> None:
+        self._groups: Dict[str, Dict[Tuple[int, int], Set[int]]] = {}
+        self._frequencies: Dict[str, int] = {}
+        self._documents: Dict[int, Counter] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, doc_id: int, text: str) -> None:
+        """Индексирует документ; уже проиндексированный заменяется."""
+        if doc_id in self._documents:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        length = len(tokens)
+        counts = Counter(tokens)
+        for token, frequency in counts.items():
+            groups = self._groups.setdefault(token, {})
+            groups.setdefault((frequency, length), set()).add(doc_id)
+            self._frequencies[token] = self._frequencies.get(token, 0) + 1
+        self._documents[doc_id] = counts
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: int) -> None:
+        counts = self._documents.pop(doc_id, None)
+        if counts is None:
+            return
+        length = self._lengths.pop(doc_id)
+        for token, frequency in counts.items():
+            groups = self._groups[token]
+            members = groups[(frequency, length)]
+            members.discard(doc_id)
+            if not members:
+                del groups[(frequency, length)]
+            if self._frequencies[token] == 1:
+                del self._groups[token]
+                del self._frequencies[token]
+            else:
+                self._frequencies[token] -= 1
+        self._total_length -= length
+
+    def clear(self) -> None:
+        self._groups.clear()
+        self._frequencies.clear()
+        self._documents.clear()
+        self._lengths.clear()
+        self._total_length = 0
+
+    def search(
+        self,
+        query: str,
+        *,
+        allowed: Optional[AbstractSet[int]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """(id, оценка) по убыванию релевантности, при равенстве — по возрастанию id.
+
+        allowed ограничивает выдачу уже отфильтрованными id.
+        """
+        documents = len(self._documents)
+        terms = [term for term in query_terms(query) if term in self._groups]
+        if not documents or not terms:
+            return []
+        average_length = self._total_length / documents or 1.0
+        # Знаменатель BM25: tf + k1 * (1 - b + b * len / avgdl) = tf + base + per * len.
+        base = BM25_K1 * (1 - BM25_B)
+        per_token = BM25_K1 * BM25_B / average_length
+
+        # Вклад каждой группы каждого слова и верхняя граница вклада слова.
+        weighted = []
+        for term in terms:
+            weight = bm25_idf(documents, self._frequencies[term]) * (BM25_K1 + 1)
+            contributions = {
+                key: weight * key[0] / (key[0] + base + per_token * key[1])
+                for key in self._groups[term]
+            }
+            weighted.append((max(contributions.values()), term, contributions))
+        wanted = None if limit is None else offset + limit
+
+        if len(weighted) == 1:
+            ranked = self._rank_groups(weighted[0][1], weighted[0][2], allowed, wanted)
+            return ranked[offset:]
+
+        # Один порядок слов для всех путей, чтобы суммы совпадали до бита.
+        weighted.sort(key=lambda item: -item[0])
+        if wanted is not None:
+            return self._top_k(weighted, allowed, wanted)[offset:]
+
+        scores = self._accumulate(weighted, allowed)
+        return sorted(scores.items(), key=_by_relevance)[offset:]
+
+    def _top_k(
+        self,
+        weighted: List[Tuple[float, str, Dict[Tuple[int, int], float]]],
+        allowed: Optional[AbstractSet[int]],
+        wanted: int,
+    ) -> List[Tuple[int, float]]:
+        """Несколько слов: точный top-k без суммирования по всем постингам.
+
+        Документы, где встретилось хотя бы два слова запроса, находятся
+        пересечением множеств и оцениваются целиком. Оценка остальных равна
+        вкладу единственной группы, поэтому от каждого слова достаточно взять
+        первые k таких документов в порядке групп.
+        """
+        documents = []
+        for _, term, _ in weighted:
+            members = set().union(*self._groups[term].values())
+            if allowed is not None:
+                members.intersection_update(allowed)
+            documents.append(members)
+        shared: Set[int] = set()
+        for position, members in enumerate(documents):
+            for other in documents[position + 1 :]:
+                shared |= members & other
+
+        scores = self._accumulate(weighted, shared) if shared else {}
+        candidates = list(scores.items())
+        for _, term, contributions in weighted:
+            candidates.extend(
+                self._rank_groups(term, contributions, allowed, wanted, exclude=shared)
+            )
+        return heapq.nsmallest(wanted, candidates, key=_by_relevance)
+
+    def _accumulate(
+        self,
+        weighted: List[Tuple[float, str, Dict[Tuple[int, int], float]]],
+        allowed: Optional[AbstractSet[int]],
+    ) -> Dict[int, float]:
+        """Полные оценки документов (из allowed, если задано) слово за словом."""
+        scores: Dict[int, float] = {}
+        for position, (_, term, contributions) in enumerate(weighted):
+            for key, members in self._groups[term].items():
+                if allowed is not None:
+                    members = members.intersection(allowed)
+                contribution = contributions[key]
+                if position == 0:
+                    # Документ входит ровно в одну группу слова, поэтому первое
+                    # слово можно записать без сложения.
+                    scores.update(dict.fromkeys(members, contribution))
+                    continue
+                current = scores.get
+                for doc_id in members:
+                    scores[doc_id] = current(doc_id, 0.0) + contribution
+        return scores
+
+    def _rank_groups(
+        self,
+        term: str,
+        contributions: Dict[Tuple[int, int], float],
+        allowed: Optional[AbstractSet[int]],
+        wanted: Optional[int],
+        exclude: AbstractSet[int] = frozenset(),
+    ) -> List[Tuple[int, float]]:
+        """Одно слово: группы по убыванию вклада, внутри равного вклада — по id."""
+        groups = self._groups[term]
+        by_score: Dict[float, List[int]] = {}
+        for key, contribution in contributions.items():
+            by_score.setdefault(contribution, []).extend(groups[key])
+        ranked: List[Tuple[int, float]] = []
+        for contribution in sorted(by_score, reverse=True):
+            members = sorted(by_score[contribution])
+            ranked.extend(
+                (doc_id, contribution)
+                for doc_id in members
+                if (allowed is None or doc_id in allowed) and doc_id not in exclude
+            )
+            if wanted is not None and len(ranked) >= wanted:
+                return ranked[:wanted]
+        return ranked
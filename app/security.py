@@ -1,20 +1,52 @@
 from __future__ import annotations
 
+import asyncio
+import fcntl
+import hashlib
+import math
+import mmap
 import os
+import stat
+import struct
+import threading
 import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from typing import Callable, Iterator, List, Tuple, TypeVar
 
 WINDOW_SECONDS = 60
 ENV_RATE_LIMIT = "IDEA_RATE_LIMIT_PER_MINUTE"
 DEFAULT_RATE_LIMIT = 100
+EVICTIONS_PER_CALL = 32
+ENV_RATE_LIMIT_SHARED_FILE = "IDEA_RATE_LIMIT_SHARED_FILE"
+
+SHARED_MAGIC = b"IDEARL01"
+SHARED_HEADER = struct.Struct("<8sI")
+# хэш ключа, номер окна, запросы в предыдущем окне, запросы в текущем окне
+SHARED_ENTRY = struct.Struct("<QqII")
+SHARED_WAYS = 4
+SHARED_BUCKET_SIZE = SHARED_ENTRY.size * SHARED_WAYS
+SHARED_BUCKETS = 16_384
+SHARED_LOCK_STRIPES = 64
 
 MAX_ATTACHMENT_BYTES = 5_000_000
 PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 JPEG_SOI = b"\xff\xd8"
 JPEG_EOI = b"\xff\xd9"
+SIGNATURE_BYTES = len(PNG_SIGNATURE)
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+TEMP_PREFIX = ".upload-"
+TEMP_SUFFIX = ".part"
+REF_SUFFIX = ".ref"
+CONTENT_TYPES_BY_SUFFIX = {".png": "image/png", ".jpg": "image/jpeg"}
+DEFAULT_IO_WORKERS = 4
+DEFAULT_IO_QUEUE_DEPTH = 64
+
+T = TypeVar("T")
 
 
 class AttachmentValidationError(Exception):
@@ -24,13 +56,227 @@ class AttachmentValidationError(Exception):
         self.detail = detail
 
 
+def _grant(estimate: float, limit: int, count: int) -> int:
+    """Сколько из count запросов уложится в лимит: каждый прибавляет к оценке 1."""
+    if estimate >= limit:
+        return 0
+    return min(count, math.ceil(limit - estimate))
+
+
+class MemoryRateLimitBackend:
+    """Счётчики в памяти процесса.
+
+    Ключи лежат в порядке последнего обращения, и на каждом вызове с головы
+    снимается несколько давно неактивных ключей.
+    """
+
+    def __init__(self) -> None:
+        # key -> [номер окна, запросы в предыдущем окне, запросы в текущем окне]
+        self._hits: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def hit(
+        self, key: str, window: int, previous_weight: float, limit: int, count: int = 1
+    ) -> int:
+        self._evict_idle(window)
+
+        bucket = self._hits.get(key)
+        if bucket is None:
+            bucket = [window, 0, 0]
+            self._hits[key] = bucket
+        else:
+            self._hits.move_to_end(key)
+            if bucket[0] != window:
+                bucket[1] = bucket[2] if bucket[0] == window - 1 else 0
+                bucket[2] = 0
+                bucket[0] = window
+
+        granted = _grant(bucket[1] * previous_weight + bucket[2], limit, count)
+        bucket[2] += granted
+        return granted
+
+    def reset(self) -> None:
+        self._hits.clear()
+
+    def tracked_keys(self) -> int:
+        return len(self._hits)
+
+    def _evict_idle(self, window: int) -> None:
+        """Снимает с головы ключи, которые не трогали дольше двух окон.
+
+        Такие ключи уже ничего не добавляют к оценке. За вызов удаляем не больше
+        EVICTIONS_PER_CALL ключей, чтобы после простоя не платить всё разом.
+        """
+        hits = self._hits
+        for _ in range(EVICTIONS_PER_CALL):
+            if not hits:
+                return
+            oldest = next(iter(hits.values()))
+            if oldest[0] >= window - 1:
+                return
+            hits.popitem(last=False)
+
+
+class SharedMemoryRateLimitBackend:
+    """Таблица счётчиков в mmap-файле, общая для всех воркеров на хосте.
+
+    Файл (например, в /dev/shm) — это заголовок и набор корзин по
+    SHARED_WAYS записей. Запись: 64-битный хэш ключа, номер окна и два
+    счётчика. Ключ попадает в корзину по хэшу; если свободной или устаревшей
+    записи нет, вытесняется запись с самым старым окном. Между процессами
+    корзину защищает fcntl-блокировка её байтового диапазона, между потоками
+    одного процесса — полосатые threading.Lock, так что разные клиенты почти
+    никогда не ждут друг друга.
+    """
+
+    def __init__(self, path: Path | str, buckets: int = SHARED_BUCKETS) -> None:
+        self._path = Path(path)
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = SHARED_HEADER.size + buckets * SHARED_BUCKET_SIZE
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(self._fd).st_size
+            if current == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, SHARED_HEADER.pack(SHARED_MAGIC, buckets), 0)
+            else:
+                magic, existing = SHARED_HEADER.unpack(
+                    os.pread(self._fd, SHARED_HEADER.size, 0)
+                )
+                if magic != SHARED_MAGIC:
+                    raise ValueError(f"{self._path} is not a rate limit table")
+                # Размер задаёт тот процесс, что создал файл первым.
+                buckets = existing
+                size = SHARED_HEADER.size + buckets * SHARED_BUCKET_SIZE
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._buckets = buckets
+        self._map = mmap.mmap(self._fd, size)
+        self._locks = [threading.Lock() for _ in range(SHARED_LOCK_STRIPES)]
+
+    def hit(
+        self, key: str, window: int, previous_weight: float, limit: int, count: int = 1
+    ) -> int:
+        digest = int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), "little"
+        )
+        digest = digest or 1  # ноль помечает пустую запись
+        index = digest % self._buckets
+        offset = SHARED_HEADER.size + index * SHARED_BUCKET_SIZE
+        with self._locks[index % SHARED_LOCK_STRIPES]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SHARED_BUCKET_SIZE, offset)
+            try:
+                return self._hit_bucket(
+                    offset, digest, window, previous_weight, limit, count
+                )
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SHARED_BUCKET_SIZE, offset)
+
+    def reset(self) -> None:
+        """Обнуляет таблицу под теми же блокировками, что и hit: всеми сразу."""
+        table = len(self._map) - SHARED_HEADER.size
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, table, SHARED_HEADER.size)
+            try:
+                self._map[SHARED_HEADER.size :] = bytes(table)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, table, SHARED_HEADER.size)
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def tracked_keys(self) -> int:
+        """Число занятых записей (с учётом ещё не вытесненных устаревших).
+
+        Хэши ключей читаются одним шаговым представлением NumPy поверх mmap,
+        без распаковки каждой записи в Python. NumPy импортируется здесь, чтобы
+        путь проверки лимита его не загружал.
+        """
+        import numpy as np
+
+        digests = np.ndarray(
+            shape=(self._buckets * SHARED_WAYS,),
+            dtype="<u8",
+            buffer=self._map,
+            offset=SHARED_HEADER.size,
+            strides=(SHARED_ENTRY.size,),
+        )
+        return int(np.count_nonzero(digests))
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def _hit_bucket(
+        self,
+        offset: int,
+        digest: int,
+        window: int,
+        previous_weight: float,
+        limit: int,
+        count: int,
+    ) -> int:
+        victim = None
+        victim_window = None
+        entry = None
+        for way in range(SHARED_WAYS):
+            position = offset + way * SHARED_ENTRY.size
+            stored = SHARED_ENTRY.unpack_from(self._map, position)
+            if stored[0] == digest:
+                entry = (position, stored)
+                break
+            if victim is None or stored[1] < victim_window:
+                victim, victim_window = position, stored[1]
+
+        if entry is None:
+            position, (_, stored_window, previous, current) = victim, (
+                digest,
+                window,
+                0,
+                0,
+            )
+        else:
+            position, (_, stored_window, previous, current) = entry
+            if stored_window != window:
+                previous = current if stored_window == window - 1 else 0
+                current = 0
+
+        granted = _grant(previous * previous_weight + current, limit, count)
+        current += granted
+        SHARED_ENTRY.pack_into(self._map, position, digest, window, previous, current)
+        return granted
+
+
 class RateLimiter:
-    def __init__(self, window_seconds: int = WINDOW_SECONDS) -> None:
+    """Лимит запросов на ключ по алгоритму sliding window counter.
+
+    На ключ хранится три числа: номер текущего окна и счётчики запросов в
+    текущем и предыдущем окне. Оценка числа запросов за последние
+    window_seconds — взвешенная сумма этих счётчиков, так что память и время
+    на вызов не зависят от лимита. Сами счётчики живут в backend: в памяти
+    процесса (по умолчанию) или в общей для воркеров mmap-таблице.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int = WINDOW_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        backend: MemoryRateLimitBackend | SharedMemoryRateLimitBackend | None = None,
+    ) -> None:
         self.window_seconds = window_seconds
-        self._hits: Dict[str, List[float]] = {}
+        self._clock = clock
+        self._backend = backend or MemoryRateLimitBackend()
+
+    @property
+    def backend(self) -> MemoryRateLimitBackend | SharedMemoryRateLimitBackend:
+        return self._backend
 
     def reset(self) -> None:
-        self._hits.clear()
+        self._backend.reset()
+
+    def tracked_keys(self) -> int:
+        return self._backend.tracked_keys()
 
     def resolve_limit(self) -> int:
         raw = os.getenv(ENV_RATE_LIMIT)
@@ -43,18 +289,24 @@ class RateLimiter:
         return max(1, parsed)
 
     def allow(self, key: str, limit: int | None = None) -> bool:
-        now = time.monotonic()
-        bucket = self._hits.setdefault(key, [])
-        threshold = now - self.window_seconds
-        bucket = [stamp for stamp in bucket if stamp > threshold]
+        return self.allow_many(key, 1, limit) == 1
+
+    def allow_many(self, key: str, count: int, limit: int | None = None) -> int:
+        """Списывает до count запросов за один проход; возвращает, сколько разрешено.
+
+        Разрешаются первые запросы пачки, пока оценка не упрётся в лимит, —
+        ровно столько же пропустили бы count последовательных вызовов allow.
+        """
+        if count <= 0:
+            return 0
         if limit is None:
             limit = self.resolve_limit()
-        if len(bucket) >= limit:
-            self._hits[key] = bucket
-            return False
-        bucket.append(now)
-        self._hits[key] = bucket
-        return True
+        # CLOCK_MONOTONIC в Linux общий для всех процессов, поэтому номера окон
+        # у воркеров совпадают и с общим backend.
+        window, offset = divmod(self._clock(), self.window_seconds)
+        # Доля предыдущего окна, которая ещё попадает в скользящее окно.
+        previous_weight = 1.0 - offset / self.window_seconds
+        return self._backend.hit(key, int(window), previous_weight, limit, count)
 
 
 @dataclass
@@ -62,11 +314,61 @@ class AttachmentResult:
     filename: str
     content_type: str
     path: Path
+    deduplicated: bool = False
+
+
+@dataclass
+class StoredAttachment:
+    """Готовый к отдаче файл вложения: путь, тип, размер и сильный ETag."""
+
+    path: Path
+    content_type: str
+    size: int
+    etag: str
 
 
 class AttachmentStorage:
-    def __init__(self, base_dir: Path | str) -> None:
+    """Хранилище вложений на диске.
+
+    Синхронные методы блокируют вызывающий поток. Для async-обработчиков есть
+    open_writer_async/delete_async: они выполняют файловые операции в
+    отдельном пуле из io_workers потоков, а если в очереди уже больше
+    io_queue_depth операций, сразу отвечают attachment_storage_busy. При
+    io_workers=0 операции выполняются прямо в вызывающем потоке.
+
+    С content_addressed=True файл называется SHA-256 содержимого. Повторная
+    загрузка того же файла не создаёт копию, а увеличивает счётчик ссылок в
+    соседнем файле `<имя>.ref`; delete удаляет блоб, только когда ссылок
+    не осталось.
+
+    С sharded=True файлы раскладываются по двум уровням подкаталогов из первых
+    hex-символов имени (`ab/cd/abcd….png`), чтобы каталоги не разрастались до
+    миллионов записей. Файлы, ещё лежащие в корне, по-прежнему находятся.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path | str,
+        *,
+        io_workers: int = DEFAULT_IO_WORKERS,
+        io_queue_depth: int = DEFAULT_IO_QUEUE_DEPTH,
+        content_addressed: bool = False,
+        sharded: bool = False,
+    ) -> None:
         self._base_dir = self._prepare_dir(base_dir)
+        self.content_addressed = content_addressed
+        self.sharded = sharded
+        self._io_workers = io_workers
+        self._io_queue_depth = io_queue_depth
+        self._io_executor = (
+            ThreadPoolExecutor(
+                max_workers=io_workers, thread_name_prefix="attachment-io"
+            )
+            if io_workers > 0
+            else None
+        )
+        self._io_in_flight = 0
+        self._io_lock = threading.Lock()
 
     @property
     def base_dir(self) -> Path:
@@ -83,32 +385,148 @@ class AttachmentStorage:
     def delete(self, filename: str) -> None:
         """Удаляет вложение, если оно лежит внутри базовой директории."""
         try:
-            path = (self._base_dir / filename).resolve()
-        except (OSError, RuntimeError):
+            if self.content_addressed:
+                self._release_blob(filename)
+            else:
+                self._locate(filename).unlink(missing_ok=True)
+        except (AttachmentValidationError, OSError, RuntimeError):
+            # Чужие пути игнорируем, а при гонке с параллельным удалением
+            # ничего делать не нужно.
             return
 
-        if not str(path).startswith(str(self._base_dir)):
-            return
+    def remove_orphan(self, filename: str, min_age: float) -> bool:
+        """Удаляет файл, на который не ссылается ни одна идея.
 
-        try:
-            path.unlink(missing_ok=True)
-        except OSError:
-            # При гонке с параллельным удалением ничего делать не нужно.
-            return
+        Файл не трогаем, если он менялся меньше min_age секунд назад: так
+        сборщик не гоняется со свежими загрузками, которые ещё не записаны в
+        идею. Для хранилища по содержимому проверка идёт под блокировкой блоба.
+        """
+        if not self.content_addressed:
+            return _unlink_if_stale(self._locate(filename), min_age)
+        with self._locked_blob(filename) as (path, _fd):
+            if not _unlink_if_stale(path, min_age):
+                return False
+            path.with_name(path.name + REF_SUFFIX).unlink(missing_ok=True)
+            return True
 
-    def save(self, data: bytes) -> AttachmentResult:
-        if len(data) > MAX_ATTACHMENT_BYTES:
+    def shard_flat_files(self) -> Tuple[int, int]:
+        """Переносит файлы из корня в шарды; возвращает (перенесено, пропущено).
+
+        Перенос блоба и его `.ref` идёт под той же блокировкой, что и подсчёт
+        ссылок, поэтому миграцию можно запускать на работающем сервисе.
+        """
+        if not self.sharded:
+            raise ValueError("shard_flat_files requires sharded=True")
+        with os.scandir(self._base_dir) as entries:
+            names = [
+                entry.name
+                for entry in entries
+                if entry.is_file(follow_symlinks=False)
+                and Path(entry.name).suffix in CONTENT_TYPES_BY_SUFFIX
+            ]
+        moved = skipped = 0
+        for name in names:
+            flat = self._base_dir / name
+            target = self._base_dir / self._relative_path(name)
+            ref_path = flat.with_name(name + REF_SUFFIX)
+            fd = None
+            if ref_path.exists():
+                fd = os.open(ref_path, os.O_RDWR)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if target.exists() or not flat.exists():
+                    skipped += 1
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(flat, target)
+                if fd is not None:
+                    os.replace(ref_path, target.with_name(ref_path.name))
+                moved += 1
+            finally:
+                if fd is not None:
+                    os.close(fd)
+        return moved, skipped
+
+    def open_writer(self) -> "AttachmentWriter":
+        """Начинает потоковую запись вложения во временный файл внутри base_dir."""
+        temp_path = self._resolve_inside(
+            f"{TEMP_PREFIX}{uuid.uuid4().hex}{TEMP_SUFFIX}"
+        )
+        return AttachmentWriter(self, temp_path)
+
+    def lookup(self, filename: str) -> StoredAttachment:
+        """Находит сохранённое вложение с теми же проверками пути, что и при записи."""
+        content_type = CONTENT_TYPES_BY_SUFFIX.get(Path(filename).suffix)
+        if content_type is None:
             raise AttachmentValidationError(
-                code="attachment_too_large",
-                detail="attachment exceeds size limit",
+                code="attachment_path_violation",
+                detail="not an attachment file name",
             )
-        content_type = self._sniff_content_type(data)
-        if content_type is None:
+        path = self._locate(filename)
+        try:
+            stat_result = path.stat()
+        except FileNotFoundError:
+            stat_result = None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
             raise AttachmentValidationError(
-                code="attachment_bad_type",
-                detail="unsupported attachment type",
+                code="attachment_not_found",
+                detail="attachment file not found",
+            )
+        digest = path.stem
+        if len(digest) != 64 or not all(char in "0123456789abcdef" for char in digest):
+            # Файлы с uuid-именами не переписываются, поэтому inode+mtime+size
+            # однозначно определяют содержимое.
+            digest = "{:x}-{:x}-{:x}".format(
+                stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
             )
-        filename = self._generate_name(content_type)
+        return StoredAttachment(
+            path=path,
+            content_type=content_type,
+            size=stat_result.st_size,
+            etag=f'"{digest}"',
+        )
+
+    async def open_writer_async(self) -> "AsyncAttachmentWriter":
+        writer = await self.run_io(self.open_writer)
+        return AsyncAttachmentWriter(self, writer)
+
+    async def delete_async(self, filename: str) -> None:
+        await self.run_io(self.delete, filename)
+
+    async def run_io(
+        self, func: Callable[..., T], *args, queue_limit: bool = True
+    ) -> T:
+        """Выполняет блокирующую файловую операцию вне event loop.
+
+        queue_limit=False — для уборки (удаление временного файла): её нельзя
+        отклонить с attachment_storage_busy, она встаёт в очередь пула.
+        """
+        if self._io_executor is None:
+            return func(*args)
+        with self._io_lock:
+            if (
+                queue_limit
+                and self._io_in_flight >= self._io_workers + self._io_queue_depth
+            ):
+                raise AttachmentValidationError(
+                    code="attachment_storage_busy",
+                    detail="attachment storage is overloaded, retry later",
+                )
+            self._io_in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._io_executor, func, *args)
+        finally:
+            with self._io_lock:
+                self._io_in_flight -= 1
+
+    def save(self, data: bytes) -> AttachmentResult:
+        with self.open_writer() as writer:
+            writer.write(data)
+            return writer.commit()
+
+    def _resolve_inside(self, filename: str) -> Path:
+        """Путь внутри base_dir с проверками на выход из корня и symlink."""
         path = (self._base_dir / filename).resolve()
         if not str(path).startswith(str(self._base_dir)):
             raise AttachmentValidationError(
@@ -120,17 +538,213 @@ class AttachmentStorage:
                 code="attachment_symlink_detected",
                 detail="symlink detected in storage path",
             )
-        with path.open("wb") as handle:
-            handle.write(data)
-        return AttachmentResult(filename=filename, content_type=content_type, path=path)
+        return path
+
+    def _relative_path(self, filename: str) -> str:
+        if not self.sharded:
+            return filename
+        return f"{filename[:2]}/{filename[2:4]}/{filename}"
 
-    def _generate_name(self, content_type: str) -> str:
+    def _locate(self, filename: str) -> Path:
+        """Путь к вложению: в шарде, а для ещё не перенесённых файлов — в корне."""
+        if not filename or "/" in filename or filename.startswith("."):
+            raise AttachmentValidationError(
+                code="attachment_path_violation",
+                detail="not an attachment file name",
+            )
+        path = self._resolve_inside(self._relative_path(filename))
+        if self.sharded and not path.exists():
+            flat = self._resolve_inside(filename)
+            if flat.exists():
+                return flat
+        return path
+
+    def _generate_name(self, content_type: str, digest: str | None = None) -> str:
         suffix = ".png" if content_type == "image/png" else ".jpg"
-        return f"{uuid.uuid4()}{suffix}"
+        return f"{digest or uuid.uuid4()}{suffix}"
+
+    def _link_blob(self, temp_path: Path, filename: str) -> Tuple[Path, bool]:
+        """Кладёт блоб на место и берёт ссылку; True, если такой уже был."""
+        with self._locked_blob(filename) as (path, fd):
+            existed = path.exists()
+            if existed:
+                temp_path.unlink()
+                # Свежий mtime не даст сборщику сирот удалить блоб, пока
+                # ссылка на него ещё не записана в идею.
+                os.utime(path)
+            else:
+                os.replace(temp_path, path)
+            # Файлы без .ref (сохранённые до включения режима) считаем одной ссылкой.
+            count = _read_refcount(fd) or int(existed)
+            _write_refcount(fd, count + 1)
+        return path, existed
+
+    def _release_blob(self, filename: str) -> None:
+        with self._locked_blob(filename) as (path, fd):
+            count = _read_refcount(fd)
+            if count > 1:
+                _write_refcount(fd, count - 1)
+                return
+            path.unlink(missing_ok=True)
+            path.with_name(path.name + REF_SUFFIX).unlink(missing_ok=True)
 
-    def _sniff_content_type(self, data: bytes) -> str | None:
-        if data.startswith(PNG_SIGNATURE):
+    @contextmanager
+    def _locked_blob(self, filename: str) -> Iterator[Tuple[Path, int]]:
+        """Путь блоба и открытый `<блоб>.ref` под flock, общим для потоков и процессов."""
+        while True:
+            path = self._locate(filename)
+            ref_path = path.with_name(path.name + REF_SUFFIX)
+            ref_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(ref_path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                # Пока ждали блокировку, другой процесс мог удалить этот .ref
+                # или миграция перенести блоб в шард.
+                if (
+                    os.fstat(fd).st_ino == os.stat(ref_path).st_ino
+                    and self._locate(filename) == path
+                ):
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        try:
+            yield path, fd
+        finally:
+            os.close(fd)
+
+    def _sniff_content_type(self, head: bytes, tail: bytes) -> str | None:
+        """Определяет тип по первым байтам и двум последним байтам файла."""
+        if head.startswith(PNG_SIGNATURE):
             return "image/png"
-        if data.startswith(JPEG_SOI) and data.endswith(JPEG_EOI):
+        if head.startswith(JPEG_SOI) and tail.endswith(JPEG_EOI):
             return "image/jpeg"
         return None
+
+
+def _unlink_if_stale(path: Path, min_age: float) -> bool:
+    try:
+        if time.time() - path.stat().st_mtime < min_age:
+            return False
+        path.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _read_refcount(fd: int) -> int:
+    raw = os.pread(fd, 32, 0).strip()
+    return int(raw) if raw.isdigit() else 0
+
+
+def _write_refcount(fd: int, count: int) -> None:
+    data = f"{count}\n".encode()
+    os.pwrite(fd, data, 0)
+    os.ftruncate(fd, len(data))
+
+
+class AttachmentWriter:
+    """Потоковая запись вложения: проверки по ходу чтения, атомарный rename в конце.
+
+    В памяти держим только текущий чанк, первые байты для сигнатуры и два
+    последних байта для маркера конца JPEG. Если сигнатура не подходит или
+    размер превысил лимит, временный файл сразу удаляется.
+    """
+
+    def __init__(self, storage: AttachmentStorage, temp_path: Path) -> None:
+        self._storage = storage
+        self._temp_path = temp_path
+        self._handle = temp_path.open("xb")
+        self._size = 0
+        self._head = b""
+        self._tail = b""
+        self._done = False
+        self._hasher = hashlib.sha256() if storage.content_addressed else None
+
+    def __enter__(self) -> "AttachmentWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self._done:
+            self.abort()
+
+    def write(self, chunk: bytes) -> None:
+        self._size += len(chunk)
+        if self._size > MAX_ATTACHMENT_BYTES:
+            self.abort()
+            raise AttachmentValidationError(
+                code="attachment_too_large",
+                detail="attachment exceeds size limit",
+            )
+        if len(self._head) < SIGNATURE_BYTES:
+            self._head += chunk[: SIGNATURE_BYTES - len(self._head)]
+            if len(self._head) == SIGNATURE_BYTES and not self._signature_allowed():
+                self._reject_type()
+        self._tail = (self._tail + chunk[-len(JPEG_EOI) :])[-len(JPEG_EOI) :]
+        if self._hasher is not None:
+            self._hasher.update(chunk)
+        self._handle.write(chunk)
+
+    def commit(self) -> AttachmentResult:
+        """Проверяет итоговый тип и переносит файл на постоянное имя."""
+        content_type = self._storage._sniff_content_type(self._head, self._tail)
+        if content_type is None:
+            self._reject_type()
+        digest = self._hasher.hexdigest() if self._hasher is not None else None
+        try:
+            self._handle.close()
+            filename = self._storage._generate_name(content_type, digest)
+            if digest is None:
+                path = self._storage._locate(filename)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(self._temp_path, path)
+                deduplicated = False
+            else:
+                path, deduplicated = self._storage._link_blob(self._temp_path, filename)
+        except BaseException:
+            self.abort()
+            raise
+        self._done = True
+        return AttachmentResult(
+            filename=filename,
+            content_type=content_type,
+            path=path,
+            deduplicated=deduplicated,
+        )
+
+    def abort(self) -> None:
+        self._done = True
+        self._handle.close()
+        self._temp_path.unlink(missing_ok=True)
+
+    def _signature_allowed(self) -> bool:
+        return self._head.startswith(PNG_SIGNATURE) or self._head.startswith(JPEG_SOI)
+
+    def _reject_type(self) -> None:
+        self.abort()
+        raise AttachmentValidationError(
+            code="attachment_bad_type",
+            detail="unsupported attachment type",
+        )
+
+
+class AsyncAttachmentWriter:
+    """Async-обёртка над AttachmentWriter: каждая операция идёт через run_io."""
+
+    def __init__(self, storage: AttachmentStorage, writer: AttachmentWriter) -> None:
+        self._storage = storage
+        self._writer = writer
+
+    async def __aenter__(self) -> "AsyncAttachmentWriter":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if not self._writer._done:
+            # Удаление временного файла не должно упираться в лимит очереди.
+            await self._storage.run_io(self._writer.abort, queue_limit=False)
+
+    async def write(self, chunk: bytes) -> None:
+        await self._storage.run_io(self._writer.write, chunk)
+
+    async def commit(self) -> AttachmentResult:
+        return await self._storage.run_io(self._writer.commit)
@@ -0,0 +1,676 @@
+"""Шардированное in-memory хранилище: каталог делится между процессами по id.
+
+Каждый шард — отдельный процесс со своим IdeaStorage (или журналом), который
+слушает Unix-сокет и выполняет методы хранилища по RPC. Шард k из N выдаёт
+id k + 1, k + 1 + N, ..., поэтому идея с id лежит на шарде (id - 1) % N, и
+get/update/оценки идут ровно в один шард. Списки, поиск и сортировки
+рассылаются во все шарды сразу (scatter), а ответы сливаются (gather): по id,
+по ключу сортировки или по BM25. Все воркеры uvicorn ходят в одни и те же
+шарды и видят один каталог.
+
+Запуск шардов (IDEA_SHARD_AUTHKEY обязателен и у шардов, и у воркеров):
+
+    IDEA_SHARD_AUTHKEY=... python -m app.sharding --shards 4
+
+Транспорт — multiprocessing.connection: рамки сообщений, pickle и проверка
+общего ключа (HMAC) из стандартной библиотеки. BM25 считается по статистике
+своего шарда, поэтому при неравномерных шардах порядок поиска может немного
+отличаться от одного хранилища.
+"""
+
+import argparse
+import dataclasses
+import hashlib
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from multiprocessing.connection import (
+    AuthenticationError,
+    Client,
+    Connection,
+    Listener,
+    answer_challenge,
+    deliver_challenge,
+)
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.analytics import analytics_from_counts, merge_group_counts
+from app.journal import JournaledIdeaStorage
+from app.models import (
+    AnalyticsGroupBy,
+    EvaluationAnalytics,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaResponse,
+    IdeaSort,
+    IdeaStatus,
+    IdeaUpdate,
+    ScoreSummary,
+)
+from app.problem_details import ApiProblem
+from app.response_cache import cache_entries_from_env
+from app.storage import IdeaStorage
+
+logger = logging.getLogger(__name__)
+
+ENV_SHARD_AUTHKEY = "IDEA_SHARD_AUTHKEY"
+DEFAULT_SOCKET_DIR = Path("var/shards")
+# Сколько секунд ждать ответа шарда; зависший шард не должен занимать потоки
+# storage-io навсегда.
+DEFAULT_SHARD_TIMEOUT = 10
+
+# Что шард готов выполнить по запросу клиента; всё остальное — ошибка.
+SHARD_METHODS = frozenset(
+    {
+        "create",
+        "create_many",
+        "update",
+        "add_evaluation",
+        "add_evaluations",
+        "add_attachment",
+        "clear",
+        "get",
+        "get_json",
+        "ensure_exists",
+        "record_etag",
+        "list_etag",
+        "totals",
+        "list",
+        "list_json",
+        "search_scored_json",
+        "ranked_keyed_json",
+        "evaluations",
+        "evaluations_many",
+        "evaluation_counts",
+        "referenced_attachments",
+    }
+)
+SHARD_PROPERTIES = frozenset({"version"})
+
+
+def default_shard_count() -> int:
+    return os.cpu_count() or 1
+
+
+def shard_socket(directory: Path | str, index: int) -> Path:
+    return Path(directory) / f"shard-{index}.sock"
+
+
+def shard_of(idea_id: int, shards: int) -> int:
+    """Номер шарда, который выдал (и хранит) идею с этим id."""
+    return (idea_id - 1) % shards
+
+
+def shard_authkey() -> bytes:
+    key = os.getenv(ENV_SHARD_AUTHKEY, "")
+    if not key:
+        raise ValueError(f"{ENV_SHARD_AUTHKEY} must be set for sharded storage")
+    return key.encode()
+
+
+def wait_for_shards(
+    directory: Path | str, shards: int, *, authkey: bytes, timeout: float = 10.0
+) -> None:
+    """Ждёт, пока каждый шард примет соединение (файл сокета появляется раньше)."""
+    deadline = time.monotonic() + timeout
+    for index in range(shards):
+        while True:
+            try:
+                address = str(shard_socket(directory, index))
+                Client(address, family="AF_UNIX", authkey=authkey).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.02)
+
+
+class ShardServer:
+    """Отдаёт методы хранилища storage по Unix-сокету address.
+
+    Соединения обслуживаются в отдельных потоках; согласованность между ними
+    обеспечивает блокировка самого IdeaStorage. Рукопожатие с authkey тоже идёт
+    в потоке соединения и не дольше handshake_timeout секунд: клиент, который
+    подключился и замолчал, не задерживает accept для остальных.
+    """
+
+    def __init__(
+        self,
+        storage: IdeaStorage,
+        address: Path | str,
+        *,
+        authkey: bytes,
+        handshake_timeout: float = DEFAULT_SHARD_TIMEOUT,
+    ):
+        self.storage = storage
+        self.address = Path(address)
+        self.address.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # Сокет, оставшийся от упавшего процесса, мешает bind.
+        self.address.unlink(missing_ok=True)
+        # Без authkey: Listener.accept проверял бы ключ прямо в цикле accept.
+        self._listener = Listener(str(self.address), family="AF_UNIX")
+        self._authkey = authkey
+        self._handshake_timeout = handshake_timeout
+        self._closed = threading.Event()
+
+    def serve_forever(self) -> None:
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed.is_set():
+                    return
+                raise
+            if self._closed.is_set():
+                # Пробуждение из close.
+                conn.close()
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def close(self) -> None:
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        # accept в другом потоке не просыпается от закрытия сокета — будим его
+        # пустым подключением.
+        try:
+            with socket.socket(socket.AF_UNIX) as wake:
+                wake.connect(str(self.address))
+        except OSError:
+            pass
+        self._listener.close()
+
+    def _serve(self, conn: Connection) -> None:
+        with conn:
+            if not self._handshake(conn):
+                return
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    # Клиент закрыл соединение, например не дождавшись
+                    # ответа после ошибки другого шарда.
+                    return
+                except Exception as exc:
+                    # Битый pickle (UnpicklingError, AttributeError, ...):
+                    # рамки дальше не синхронизированы, соединение закрываем.
+                    logger.warning(
+                        "shard %s: unreadable request: %r", self.address, exc
+                    )
+                    return
+                try:
+                    method, args, kwargs = request
+                    reply = self._call(method, args, kwargs)
+                except (TypeError, ValueError) as exc:
+                    logger.warning("shard %s: malformed request: %r", self.address, exc)
+                    return
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+                except Exception as exc:
+                    # Ответ не сериализуется pickle; клиент без ответа всё равно
+                    # закроет соединение по таймауту.
+                    logger.warning("shard %s: unsendable reply: %r", self.address, exc)
+                    return
+
+    def _handshake(self, conn: Connection) -> bool:
+        """Проверяет authkey клиента, как Listener.accept, но с таймаутом."""
+        sock = socket.socket(fileno=conn.fileno())
+        try:
+            _set_io_timeout(sock, self._handshake_timeout)
+            deliver_challenge(conn, self._authkey)
+            answer_challenge(conn, self._authkey)
+            # Соединения из пула клиента подолгу простаивают между запросами.
+            _set_io_timeout(sock, 0)
+        except (AuthenticationError, EOFError, OSError):
+            # Чужой клиент без ключа, замолчавший клиент или пробуждение из close.
+            return False
+        finally:
+            sock.detach()
+        return True
+
+    def _call(self, method: str, args: Sequence[Any], kwargs: Dict[str, Any]) -> Tuple:
+        if method in SHARD_PROPERTIES:
+            return True, getattr(self.storage, method)
+        if method not in SHARD_METHODS:
+            return False, ("error", f"unknown shard method: {method}")
+        try:
+            return True, getattr(self.storage, method)(*args, **kwargs)
+        except ApiProblem as exc:
+            # Исключение-датакласс не переживает pickle, передаём его поля.
+            return False, ("problem", dataclasses.asdict(exc))
+        except ValueError as exc:
+            return False, ("value", str(exc))
+        except Exception as exc:
+            # Клиент поднимет RuntimeError с описанием ошибки шарда.
+            return False, ("error", repr(exc))
+
+
+class ShardedIdeaStorage:
+    """Клиент шардов с интерфейсом IdeaStorage (в объёме, нужном API).
+
+    Соединения с каждым шардом открываются лениво и переиспользуются через
+    пул, как соединения SQLiteIdeaStorage. Запросы ко всем шардам сначала
+    отправляются, а потом читаются ответы — шарды работают параллельно.
+    """
+
+    # Каждый вызов ждёт ответ другого процесса по сокету.
+    blocking_reads = True
+    blocking_writes = True
+
+    def __init__(
+        self,
+        addresses: Sequence[Path | str],
+        *,
+        authkey: bytes,
+        timeout: float = DEFAULT_SHARD_TIMEOUT,
+    ) -> None:
+        if not addresses:
+            raise ValueError("sharded storage needs at least one shard")
+        self._addresses = [str(address) for address in addresses]
+        self._authkey = authkey
+        self._timeout = timeout
+        self._pools: List["queue.LifoQueue[Connection]"] = [
+            queue.LifoQueue() for _ in self._addresses
+        ]
+        # Новые идеи раскладываются по шардам по кругу.
+        self._placement = itertools.count()
+
+    @classmethod
+    def from_directory(
+        cls,
+        directory: Path | str,
+        shards: int,
+        *,
+        authkey: bytes,
+        timeout: float = DEFAULT_SHARD_TIMEOUT,
+    ) -> "ShardedIdeaStorage":
+        return cls(
+            [shard_socket(directory, index) for index in range(shards)],
+            authkey=authkey,
+            timeout=timeout,
+        )
+
+    @property
+    def shards(self) -> int:
+        return len(self._addresses)
+
+    def create(self, payload: IdeaCreate) -> IdeaResponse:
+        return self._call(self._next_shard(), "create", payload)
+
+    def create_many(self, payloads: Sequence[IdeaCreate]) -> List[int]:
+        """Раскладывает пачку по шардам по кругу; id возвращаются в порядке payloads."""
+        start = self._next_shard()
+        positions: Dict[int, List[int]] = {}
+        for position in range(len(payloads)):
+            positions.setdefault((start + position) % self.shards, []).append(position)
+        requests = {
+            shard: ("create_many", ([payloads[position] for position in members],), {})
+            for shard, members in positions.items()
+        }
+        ids: List[int] = [0] * len(payloads)
+        for shard, created in self._scatter(requests).items():
+            for position, idea_id in zip(positions[shard], created):
+                ids[position] = idea_id
+        return ids
+
+    def update(self, idea_id: int, payload: IdeaUpdate) -> IdeaResponse:
+        return self._call(self._shard(idea_id), "update", idea_id, payload)
+
+    def add_evaluation(self, idea_id: int, payload: EvaluationCreate) -> IdeaResponse:
+        return self._call(self._shard(idea_id), "add_evaluation", idea_id, payload)
+
+    def add_evaluations(
+        self, batches: Dict[int, Sequence[EvaluationCreate]]
+    ) -> Dict[int, ScoreSummary]:
+        by_shard: Dict[int, Dict[int, Sequence[EvaluationCreate]]] = {}
+        for idea_id, payloads in batches.items():
+            by_shard.setdefault(self._shard(idea_id), {})[idea_id] = payloads
+        scores: Dict[int, ScoreSummary] = {}
+        requests = {
+            shard: ("add_evaluations", (part,), {}) for shard, part in by_shard.items()
+        }
+        for part in self._scatter(requests).values():
+            scores.update(part)
+        # Порядок — как у batches, как и у одного хранилища.
+        return {idea_id: scores[idea_id] for idea_id in batches if idea_id in scores}
+
+    def add_attachment(self, idea_id: int, attachment: str) -> List[str]:
+        return self._call(self._shard(idea_id), "add_attachment", idea_id, attachment)
+
+    def clear(self) -> None:
+        self._broadcast("clear")
+        # Как у одного хранилища: после clear id снова начинаются с 1.
+        self._placement = itertools.count()
+
+    def get(self, idea_id: int) -> IdeaResponse:
+        return self._call(self._shard(idea_id), "get", idea_id)
+
+    def get_json(self, idea_id: int) -> bytes:
+        return self._call(self._shard(idea_id), "get_json", idea_id)
+
+    def ensure_exists(self, idea_id: int) -> None:
+        self._call(self._shard(idea_id), "ensure_exists", idea_id)
+
+    def record_etag(self, idea_id: int) -> str:
+        return self._call(self._shard(idea_id), "record_etag", idea_id)
+
+    @property
+    def version(self) -> int:
+        """Сумма версий шардов: растёт при любой мутации любого шарда."""
+        return sum(self._broadcast("version"))
+
+    def totals(self) -> Tuple[int, int]:
+        ideas = evaluations = 0
+        for shard_ideas, shard_evaluations in self._broadcast("totals"):
+            ideas += shard_ideas
+            evaluations += shard_evaluations
+        return ideas, evaluations
+
+    def list_etag(self) -> str:
+        """ETag списков: меняется, когда меняется ETag любого шарда."""
+        etags = "|".join(self._broadcast("list_etag"))
+        return f'"{hashlib.blake2b(etags.encode(), digest_size=12).hexdigest()}"'
+
+    def list(self, **filters: Any) -> List[IdeaResponse]:
+        """Фильтры и keyset-страница — как у IdeaStorage.list."""
+        pages = self._broadcast("list", **filters)
+        merged = heapq.merge(*pages, key=lambda idea: idea.id)
+        return list(itertools.islice(merged, filters.get("limit")))
+
+    def list_json(
+        self,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        # Каждый шард отдаёт свою страницу после after_id; общая страница —
+        # первые limit из слияния по id.
+        pages = self._broadcast(
+            "list_json",
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=after_id,
+            limit=limit,
+        )
+        return list(itertools.islice(heapq.merge(*pages), limit))
+
+    def search_json(
+        self,
+        query: str,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        pages = self._broadcast(
+            "search_scored_json",
+            query,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            limit=None if limit is None else offset + limit,
+        )
+        return _merge_keyed(pages, offset, limit)
+
+    def ranked_json(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        pages = self._broadcast(
+            "ranked_keyed_json",
+            sort,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            limit=None if limit is None else offset + limit,
+        )
+        return _merge_keyed(pages, offset, limit)
+
+    def evaluations(self, idea_id: int) -> List[Dict[str, object]]:
+        return self._call(self._shard(idea_id), "evaluations", idea_id)
+
+    def evaluations_many(
+        self, idea_ids: Iterable[int]
+    ) -> Dict[int, List[Dict[str, object]]]:
+        """Один запрос на шард вместо запроса на каждую идею."""
+        ids = list(idea_ids)
+        by_shard: Dict[int, List[int]] = {}
+        for idea_id in ids:
+            by_shard.setdefault(self._shard(idea_id), []).append(idea_id)
+        histories: Dict[int, List[Dict[str, object]]] = {}
+        requests = {
+            shard: ("evaluations_many", (part,), {}) for shard, part in by_shard.items()
+        }
+        for part in self._scatter(requests).values():
+            histories.update(part)
+        return {idea_id: histories[idea_id] for idea_id in ids if idea_id in histories}
+
+    def evaluation_analytics(self, group_by: AnalyticsGroupBy) -> EvaluationAnalytics:
+        counts = self._broadcast("evaluation_counts", group_by)
+        return analytics_from_counts(group_by, *merge_group_counts(counts))
+
+    def referenced_attachments(self, names: Iterable[str]) -> Set[str]:
+        names = list(names)
+        referenced: Set[str] = set()
+        for part in self._broadcast("referenced_attachments", names):
+            referenced |= part
+        return referenced
+
+    def close(self) -> None:
+        """Закрывает все соединения пула."""
+        for pool in self._pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    def _next_shard(self) -> int:
+        return next(self._placement) % self.shards
+
+    def _shard(self, idea_id: int) -> int:
+        return shard_of(idea_id, self.shards)
+
+    def _call(self, shard: int, method: str, *args: Any, **kwargs: Any) -> Any:
+        return self._scatter({shard: (method, args, kwargs)})[shard]
+
+    def _broadcast(self, method: str, *args: Any, **kwargs: Any) -> List[Any]:
+        requests = {shard: (method, args, kwargs) for shard in range(self.shards)}
+        replies = self._scatter(requests)
+        return [replies[shard] for shard in range(self.shards)]
+
+    def _scatter(self, requests: Dict[int, Tuple[str, Tuple, Dict]]) -> Dict[int, Any]:
+        """Отправляет все запросы, затем собирает ответы; ошибку шарда поднимает.
+
+        На все ответы отводится timeout секунд. Соединение, на котором обмен
+        оборвался или ответ не пришёл вовремя, закрывается: опоздавший ответ
+        иначе достался бы следующему запросу.
+        """
+        connections: Dict[int, Connection] = {}
+        replies: Dict[int, Tuple[bool, Any]] = {}
+        deadline = time.monotonic() + self._timeout
+        try:
+            for shard, request in requests.items():
+                connections[shard] = self._checkout(shard)
+                connections[shard].send(request)
+            for shard, conn in connections.items():
+                if not conn.poll(max(0.0, deadline - time.monotonic())):
+                    raise TimeoutError(f"shard {shard} did not reply")
+                replies[shard] = conn.recv()
+        except (OSError, EOFError, AuthenticationError):
+            for shard, conn in connections.items():
+                if shard in replies:
+                    self._pools[shard].put(conn)
+                else:
+                    conn.close()
+            raise _unavailable()
+        for shard, conn in connections.items():
+            self._pools[shard].put(conn)
+        results: Dict[int, Any] = {}
+        for shard, (ok, payload) in replies.items():
+            if not ok:
+                _raise_remote(shard, payload)
+            results[shard] = payload
+        return results
+
+    def _checkout(self, shard: int) -> Connection:
+        try:
+            return self._pools[shard].get_nowait()
+        except queue.Empty:
+            return self._connect(shard)
+
+    def _connect(self, shard: int) -> Connection:
+        """Как Client(), но с таймаутом на connect и рукопожатие.
+
+        Остановленный шард принимает соединение в очередь listen и молчит, и
+        без таймаута рукопожатие ждало бы вечно. Таймауты чтения и записи
+        выставлены на самом сокете (SO_RCVTIMEO, SO_SNDTIMEO), потому что
+        Connection читает дескриптор напрямую.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            _set_io_timeout(sock, self._timeout)
+            sock.connect(self._addresses[shard])
+            conn = Connection(sock.detach())
+        finally:
+            sock.close()
+        try:
+            answer_challenge(conn, self._authkey)
+            deliver_challenge(conn, self._authkey)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+
+def _set_io_timeout(sock: socket.socket, timeout: float) -> None:
+    """Таймаут чтения и записи на уровне сокета (0 — без таймаута).
+
+    Connection читает дескриптор напрямую, мимо socket.settimeout.
+    """
+    seconds, fraction = divmod(timeout, 1)
+    timeval = struct.pack("ll", int(seconds), int(fraction * 1_000_000))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeval)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+
+
+def _merge_keyed(
+    pages: Iterable[List[Tuple[Tuple, bytes]]], offset: int, limit: Optional[int]
+) -> List[Tuple[int, bytes]]:
+    """Сливает выдачи шардов по ключу порядка; последний элемент ключа — id."""
+    merged = heapq.merge(*pages, key=lambda item: item[0])
+    stop = None if limit is None else offset + limit
+    return [(key[-1], data) for key, data in itertools.islice(merged, offset, stop)]
+
+
+def _unavailable() -> ApiProblem:
+    return ApiProblem(
+        code="storage_unavailable",
+        detail="storage shard is unavailable",
+        status=503,
+    )
+
+
+def _raise_remote(shard: int, error: Tuple[str, Any]) -> None:
+    kind, payload = error
+    if kind == "problem":
+        raise ApiProblem(**payload)
+    if kind == "value":
+        raise ValueError(payload)
+    raise RuntimeError(f"shard {shard}: {payload}")
+
+
+def run_shard(
+    index: int,
+    shards: int,
+    socket_dir: Path | str,
+    authkey: bytes,
+    *,
+    journal_dir: Optional[Path | str] = None,
+    compact: bool = False,
+) -> None:
+    """Точка входа процесса шарда index из shards; работает до SIGTERM."""
+    ids = {
+        "id_start": index + 1,
+        "id_step": shards,
+        "json_cache_size": cache_entries_from_env(),
+    }
+    if journal_dir:
+        # Число шардов менять нельзя: id в журнале уже разложены по модулю.
+        storage: IdeaStorage = JournaledIdeaStorage(
+            Path(journal_dir) / f"shard-{index}", compact=compact, **ids
+        )
+    else:
+        storage = IdeaStorage(compact=compact, **ids)
+    server = ShardServer(storage, shard_socket(socket_dir, index), authkey=authkey)
+    signal.signal(signal.SIGTERM, lambda *_: server.close())
+    try:
+        server.serve_forever()
+    finally:
+        if isinstance(storage, JournaledIdeaStorage):
+            storage.close()
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser(description="Run idea storage shard processes")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=int(os.getenv("IDEA_SHARD_COUNT", "0")) or default_shard_count(),
+    )
+    parser.add_argument(
+        "--socket-dir",
+        default=os.getenv("IDEA_SHARD_SOCKET_DIR", str(DEFAULT_SOCKET_DIR)),
+    )
+    parser.add_argument(
+        "--journal-dir",
+        default=os.getenv("IDEA_SHARD_JOURNAL_DIR") or None,
+        help="keep every shard in a journal under this directory",
+    )
+    args = parser.parse_args()
+    authkey = shard_authkey()
+    compact = os.getenv("IDEA_STORAGE_COMPACT", "0") != "0"
+
+    processes = [
+        multiprocessing.Process(
+            target=run_shard,
+            args=(index, args.shards, args.socket_dir, authkey),
+            kwargs={"journal_dir": args.journal_dir, "compact": compact},
+            name=f"idea-shard-{index}",
+        )
+        for index in range(args.shards)
+    ]
+    for process in processes:
+        process.start()
+    signal.signal(
+        signal.SIGTERM, lambda *_: [process.terminate() for process in processes]
+    )
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,884 @@
+"""SQLite-бэкенд с тем же интерфейсом, что и in-memory IdeaStorage.
+
+Все запросы — фиксированные строки с параметрами, поэтому sqlite3 переиспользует
+подготовленные выражения из кэша соединения. Соединения живут в пуле, размер
+которого по умолчанию совпадает с потоковым пулом FastAPI/anyio.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from app.analytics import HISTOGRAM_COLUMNS, build_analytics, histograms_from_rows
+from app.models import (
+    AnalyticsGroupBy,
+    EvaluationAnalytics,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaResponse,
+    IdeaSort,
+    IdeaStatus,
+    IdeaUpdate,
+    ScoreSummary,
+    parse_status,
+)
+from app.problem_details import ApiProblem
+from app.response_cache import DEFAULT_CACHE_ENTRIES, ResponseCache, serialize_idea
+from app.search import idea_text, query_terms, tokenize
+from app.storage import new_epoch
+
+# anyio по умолчанию выполняет синхронные обработчики FastAPI в 40 потоках.
+DEFAULT_POOL_SIZE = 40
+POOL_TIMEOUT_SECONDS = 5.0
+STATEMENT_CACHE_SIZE = 256
+
+_SORT_COLUMNS = {
+    IdeaSort.impact: "ideas.impact",
+    IdeaSort.value: "ideas.score_value",
+    IdeaSort.votes: "ideas.votes",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ideas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    status TEXT NOT NULL,
+    votes INTEGER NOT NULL DEFAULT 0,
+    value_total INTEGER NOT NULL DEFAULT 0,
+    effort_total INTEGER NOT NULL DEFAULT 0,
+    confidence_total INTEGER NOT NULL DEFAULT 0,
+    score_value REAL,
+    version INTEGER NOT NULL DEFAULT 1,
+    impact REAL
+);
+CREATE INDEX IF NOT EXISTS ideas_status_idx ON ideas (status, id);
+CREATE INDEX IF NOT EXISTS ideas_score_idx ON ideas (score_value, id);
+-- Индексы для sort: NULL в порядке DESC идут последними, то есть идеи без
+-- оценок оказываются в конце, а при равных значениях порядок задаёт id.
+CREATE INDEX IF NOT EXISTS ideas_impact_rank_idx ON ideas (impact DESC, id);
+CREATE INDEX IF NOT EXISTS ideas_value_rank_idx ON ideas (score_value DESC, id);
+CREATE INDEX IF NOT EXISTS ideas_votes_rank_idx ON ideas (votes DESC, id);
+
+CREATE TABLE IF NOT EXISTS idea_tags (
+    tag TEXT NOT NULL,
+    idea_id INTEGER NOT NULL REFERENCES ideas (id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, idea_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idea_tags_idea_idx ON idea_tags (idea_id, tag);
+
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    idea_id INTEGER NOT NULL REFERENCES ideas (id) ON DELETE CASCADE,
+    value INTEGER NOT NULL,
+    effort INTEGER NOT NULL,
+    confidence INTEGER NOT NULL,
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS evaluations_idea_idx ON evaluations (idea_id, id);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    id INTEGER PRIMARY KEY,
+    idea_id INTEGER NOT NULL REFERENCES ideas (id) ON DELETE CASCADE,
+    filename TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attachments_idea_idx ON attachments (idea_id, id);
+CREATE INDEX IF NOT EXISTS attachments_filename_idx ON attachments (filename);
+
+-- Глобальная версия (растёт в каждой пишущей транзакции) и эпоха для ETag.
+CREATE TABLE IF NOT EXISTS storage_meta (
+    key TEXT PRIMARY KEY,
+    value NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO storage_meta (key, value) VALUES ('version', 0);
+
+-- Полнотекстовый индекс: rowid = ideas.id, body — токены app.search.tokenize
+-- через пробел, поэтому нормализация та же, что у индекса в памяти.
+CREATE VIRTUAL TABLE IF NOT EXISTS ideas_fts USING fts5(
+    body, tokenize = 'unicode61 remove_diacritics 0'
+);
+"""
+
+_IDEA_COLUMNS = (
+    "ideas.id, ideas.title, ideas.description, ideas.status, ideas.votes, "
+    "ideas.value_total, ideas.effort_total, ideas.confidence_total"
+)
+_SELECT_IDEA = f"SELECT {_IDEA_COLUMNS} FROM ideas WHERE id = ?"
+# Для кэша JSON: версия записи и эпоха хранилища в том же снимке, что и строка.
+# Эпоха нужна, потому что после clear id и версии начинаются заново.
+_JSON_COLUMNS = (
+    f"{_IDEA_COLUMNS}, ideas.version, "
+    "(SELECT value FROM storage_meta WHERE key = 'epoch')"
+)
+_SELECT_IDEA_JSON = f"SELECT {_JSON_COLUMNS} FROM ideas WHERE id = ?"
+_SELECT_TOTALS = (
+    "SELECT votes, value_total, effort_total, confidence_total FROM ideas WHERE id = ?"
+)
+_SELECT_EXISTS = "SELECT 1 FROM ideas WHERE id = ?"
+# Теги и вложения страницы подтягиваем одним выражением: список id передаётся
+# JSON-массивом, поэтому текст запроса не зависит от размера страницы.
+_SELECT_TAGS = (
+    "SELECT idea_id, tag FROM idea_tags "
+    "WHERE idea_id IN (SELECT value FROM json_each(?)) ORDER BY idea_id, tag"
+)
+_SELECT_ATTACHMENTS = (
+    "SELECT idea_id, filename FROM attachments "
+    "WHERE idea_id IN (SELECT value FROM json_each(?)) ORDER BY idea_id, id"
+)
+_INSERT_IDEA = "INSERT INTO ideas (title, description, status) VALUES (?, ?, ?)"
+_INSERT_TAG = "INSERT INTO idea_tags (tag, idea_id) VALUES (?, ?)"
+_DELETE_TAGS = "DELETE FROM idea_tags WHERE idea_id = ?"
+_INSERT_EVALUATION = (
+    "INSERT INTO evaluations (idea_id, value, effort, confidence, comment) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_UPDATE_TOTALS = (
+    "UPDATE ideas SET votes = ?, value_total = ?, effort_total = ?, "
+    "confidence_total = ?, score_value = ?, impact = ?, version = version + 1 "
+    "WHERE id = ?"
+)
+_TOUCH_IDEA = "UPDATE ideas SET version = version + 1 WHERE id = ?"
+_BUMP_VERSION = "UPDATE storage_meta SET value = value + 1 WHERE key = 'version'"
+_SET_EPOCH = "INSERT OR REPLACE INTO storage_meta (key, value) VALUES ('epoch', ?)"
+_SELECT_META = "SELECT key, value FROM storage_meta WHERE key IN ('version', 'epoch')"
+_SELECT_SIZES = (
+    "SELECT (SELECT COUNT(*) FROM ideas), (SELECT COUNT(*) FROM evaluations)"
+)
+_SELECT_RECORD_ETAG = (
+    "SELECT (SELECT value FROM storage_meta WHERE key = 'epoch'), version "
+    "FROM ideas WHERE id = ?"
+)
+_SELECT_EVALUATIONS = (
+    "SELECT value, effort, confidence, comment FROM evaluations "
+    "WHERE idea_id = ? ORDER BY id"
+)
+_SELECT_EVALUATIONS_MANY = (
+    "SELECT idea_id, value, effort, confidence, comment FROM evaluations "
+    "WHERE idea_id IN (SELECT value FROM json_each(?)) ORDER BY idea_id, id"
+)
+_INSERT_FTS = "INSERT INTO ideas_fts (rowid, body) VALUES (?, ?)"
+_DELETE_FTS = "DELETE FROM ideas_fts WHERE rowid = ?"
+_SELECT_TEXT = "SELECT title, description FROM ideas WHERE id = ?"
+# Гистограммы оценок по идеям одним проходом по evaluations.
+_SELECT_HISTOGRAMS = (
+    f"SELECT idea_id, {HISTOGRAM_COLUMNS} FROM evaluations GROUP BY idea_id"
+)
+_SELECT_GROUPS = {
+    AnalyticsGroupBy.tag: "SELECT tag, idea_id FROM idea_tags",
+    AnalyticsGroupBy.status: "SELECT status, id FROM ideas",
+}
+_INSERT_ATTACHMENT = "INSERT INTO attachments (idea_id, filename) VALUES (?, ?)"
+_SELECT_REFERENCED = (
+    "SELECT DISTINCT filename FROM attachments "
+    "WHERE filename IN (SELECT value FROM json_each(?))"
+)
+_SELECT_IDEA_ATTACHMENTS = (
+    "SELECT filename FROM attachments WHERE idea_id = ? ORDER BY id"
+)
+
+
+def search_body(title: str, description: str) -> str:
+    return " ".join(tokenize(idea_text(title, description)))
+
+
+def fts_match(query: str) -> Optional[str]:
+    """Запрос FTS5 с OR между токенами; None, если в запросе нет слов."""
+    terms = query_terms(query)
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class SQLiteIdeaStorage:
+    """Хранилище идей в SQLite (WAL) с пулом соединений."""
+
+    # Каждый вызов ждёт соединение из пула и диск.
+    blocking_reads = True
+    blocking_writes = True
+
+    def __init__(
+        self,
+        path: Path | str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        json_cache_size: int = DEFAULT_CACHE_ENTRIES,
+    ) -> None:
+        db_path = Path(path).expanduser()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = str(db_path)
+        self._pool_size = max(1, pool_size)
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        self._json = ResponseCache(max_entries=max(1, json_cache_size))
+        # (эпоха, версия) -> гистограммы по идеям: полный проход по
+        # evaluations повторяется только после записи.
+        self._histograms: Optional[Tuple[Tuple[str, int], Dict]] = None
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO storage_meta (key, value) VALUES ('epoch', ?)",
+                (new_epoch(),),
+            )
+
+    def create(self, payload: IdeaCreate) -> IdeaResponse:
+        """Создаёт идею и возвращает её состояние."""
+        tags = sorted({tag for tag in payload.tags})
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                _INSERT_IDEA,
+                (
+                    payload.title.strip(),
+                    payload.description.strip(),
+                    IdeaStatus.draft.value,
+                ),
+            )
+            idea_id = cursor.lastrowid
+            conn.executemany(_INSERT_TAG, [(tag, idea_id) for tag in tags])
+            conn.execute(
+                _INSERT_FTS,
+                (
+                    idea_id,
+                    search_body(payload.title.strip(), payload.description.strip()),
+                ),
+            )
+            return self._load(conn, idea_id)
+
+    def create_many(self, payloads: Sequence[IdeaCreate]) -> List[int]:
+        """Создаёт идеи пачкой в одной транзакции и возвращает их id."""
+        rows = [
+            (
+                payload.title.strip(),
+                payload.description.strip(),
+                IdeaStatus.draft.value,
+            )
+            for payload in payloads
+        ]
+        with self._transaction() as conn:
+            ids = [conn.execute(_INSERT_IDEA, row).lastrowid for row in rows]
+            conn.executemany(
+                _INSERT_TAG,
+                [
+                    (tag, idea_id)
+                    for idea_id, payload in zip(ids, payloads)
+                    for tag in sorted(set(payload.tags))
+                ],
+            )
+            conn.executemany(
+                _INSERT_FTS,
+                [
+                    (idea_id, search_body(title, description))
+                    for idea_id, (title, description, _) in zip(ids, rows)
+                ],
+            )
+        return ids
+
+    def list(
+        self,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[IdeaResponse]:
+        """Идеи по возрастанию id; after_id и limit задают keyset-страницу."""
+        sql, params = self._list_query(
+            _IDEA_COLUMNS,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=after_id,
+            limit=limit,
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return self._build_responses(conn, rows)
+
+    def list_json(
+        self,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        """То же, что list, но пары (id, JSON-байты ответа).
+
+        Теги и вложения дочитываются только для записей, которых нет в кэше.
+        """
+        sql, params = self._list_query(
+            _JSON_COLUMNS,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=after_id,
+            limit=limit,
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return self._rows_json(conn, rows)
+
+    def search(
+        self,
+        query: str,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[IdeaResponse]:
+        """Идеи, подходящие под запрос, по убыванию BM25 (при равенстве — по id)."""
+        match = fts_match(query)
+        if match is None:
+            return []
+        sql, params = self._list_query(
+            _IDEA_COLUMNS,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=None,
+            limit=limit,
+            match=match,
+            offset=offset,
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return self._build_responses(conn, rows)
+
+    def search_json(
+        self,
+        query: str,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        """То же, что search, но пары (id, JSON-байты ответа)."""
+        match = fts_match(query)
+        if match is None:
+            return []
+        sql, params = self._list_query(
+            _JSON_COLUMNS,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=None,
+            limit=limit,
+            match=match,
+            offset=offset,
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return self._rows_json(conn, rows)
+
+    def ranked(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[IdeaResponse]:
+        """Идеи по убыванию метрики sort, при равенстве — по id; без оценок — в конце.
+
+        Порядок отдают индексы RANKING_INDEXES, так что первые K строк читаются
+        без сортировки всей таблицы.
+        """
+        sql, params = self._list_query(
+            _IDEA_COLUMNS,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=None,
+            limit=limit,
+            sort=sort,
+            offset=offset,
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return self._build_responses(conn, rows)
+
+    def ranked_json(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        """То же, что ranked, но пары (id, JSON-байты ответа)."""
+        sql, params = self._list_query(
+            _JSON_COLUMNS,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            after_id=None,
+            limit=limit,
+            sort=sort,
+            offset=offset,
+        )
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return self._rows_json(conn, rows)
+
+    def _list_query(
+        self,
+        columns: str,
+        *,
+        tag: Optional[str],
+        status: Optional[IdeaStatus],
+        min_score: Optional[float],
+        after_id: Optional[int],
+        limit: Optional[int],
+        match: Optional[str] = None,
+        sort: Optional[IdeaSort] = None,
+        offset: int = 0,
+    ) -> Tuple[str, List[object]]:
+        params: List[object] = []
+        if match is None:
+            sql = [f"SELECT {columns} FROM ideas"]
+        else:
+            sql = [
+                f"SELECT {columns} FROM ideas_fts "
+                "JOIN ideas ON ideas.id = ideas_fts.rowid"
+            ]
+        if tag:
+            sql.append(
+                "JOIN idea_tags ON idea_tags.idea_id = ideas.id AND idea_tags.tag = ?"
+            )
+            params.append(tag.lower())
+        sql.append("WHERE ideas.id > ?")
+        params.append(after_id or 0)
+        if match is not None:
+            sql.append("AND ideas_fts MATCH ?")
+            params.append(match)
+        if status:
+            sql.append("AND ideas.status = ?")
+            params.append(status.value)
+        if min_score is not None:
+            sql.append("AND ideas.score_value >= ?")
+            params.append(min_score)
+        if match is not None:
+            sql.append("ORDER BY bm25(ideas_fts), ideas.id LIMIT ? OFFSET ?")
+        elif sort is not None:
+            # NULL в SQLite меньше любого числа, поэтому при DESC идеи без
+            # оценок оказываются в конце — как и в хранилище в памяти.
+            sql.append(f"ORDER BY {_SORT_COLUMNS[sort]} DESC, ideas.id")
+            sql.append("LIMIT ? OFFSET ?")
+        else:
+            sql.append("ORDER BY ideas.id LIMIT ? OFFSET ?")
+        params.extend([-1 if limit is None else limit, offset])
+        return " ".join(sql), params
+
+    @property
+    def version(self) -> int:
+        with self._connection() as conn:
+            return int(dict(conn.execute(_SELECT_META).fetchall())["version"])
+
+    def totals(self) -> Tuple[int, int]:
+        """Число идей и оценок (для /metrics)."""
+        with self._connection() as conn:
+            ideas, evaluations = conn.execute(_SELECT_SIZES).fetchone()
+        return ideas, evaluations
+
+    def list_etag(self) -> str:
+        """ETag для списков: меняется при любой пишущей транзакции."""
+        with self._connection() as conn:
+            meta = dict(conn.execute(_SELECT_META).fetchall())
+        return f'"{meta["epoch"]}-{meta["version"]}"'
+
+    def record_etag(self, idea_id: int) -> str:
+        """ETag одной идеи (или 404), без сборки IdeaResponse."""
+        with self._connection() as conn:
+            row = conn.execute(_SELECT_RECORD_ETAG, (idea_id,)).fetchone()
+        if row is None:
+            raise self._not_found()
+        epoch, version = row
+        return f'"{epoch}-{idea_id}-{version}"'
+
+    def get(self, idea_id: int) -> IdeaResponse:
+        """Возвращает идею по идентификатору или отдаёт 404."""
+        with self._connection() as conn:
+            return self._load(conn, idea_id)
+
+    def get_json(self, idea_id: int) -> bytes:
+        """JSON-байты ответа для идеи (или 404), из кэша, если запись не менялась."""
+        with self._connection() as conn:
+            row = conn.execute(_SELECT_IDEA_JSON, (idea_id,)).fetchone()
+            if row is None:
+                raise self._not_found()
+            return self._rows_json(conn, [row])[0][1]
+
+    def ensure_exists(self, idea_id: int) -> None:
+        """Проверяет, что идея существует (без аллокаций ответа)."""
+        with self._connection() as conn:
+            self._ensure_exists(conn, idea_id)
+
+    def update(self, idea_id: int, payload: IdeaUpdate) -> IdeaResponse:
+        """Обновляет только те поля, которые передал клиент."""
+        with self._transaction() as conn:
+            self._ensure_exists(conn, idea_id)
+            new_status: Optional[IdeaStatus] = None
+            if payload.status is not None:
+                new_status = parse_status(payload.status)
+            if payload.title is not None:
+                conn.execute(
+                    "UPDATE ideas SET title = ? WHERE id = ?",
+                    (payload.title.strip(), idea_id),
+                )
+            if payload.description is not None:
+                conn.execute(
+                    "UPDATE ideas SET description = ? WHERE id = ?",
+                    (payload.description.strip(), idea_id),
+                )
+            if payload.title is not None or payload.description is not None:
+                title, description = conn.execute(_SELECT_TEXT, (idea_id,)).fetchone()
+                conn.execute(_DELETE_FTS, (idea_id,))
+                conn.execute(_INSERT_FTS, (idea_id, search_body(title, description)))
+            if new_status is not None:
+                conn.execute(
+                    "UPDATE ideas SET status = ? WHERE id = ?",
+                    (new_status.value, idea_id),
+                )
+            if payload.tags is not None:
+                conn.execute(_DELETE_TAGS, (idea_id,))
+                tags = sorted({tag for tag in payload.tags})
+                conn.executemany(_INSERT_TAG, [(tag, idea_id) for tag in tags])
+            conn.execute(_TOUCH_IDEA, (idea_id,))
+            return self._load(conn, idea_id)
+
+    def add_evaluation(self, idea_id: int, payload: EvaluationCreate) -> IdeaResponse:
+        """Добавляет новую оценку и возвращает идею с пересчитанным рейтингом."""
+        with self._transaction() as conn:
+            row = conn.execute(_SELECT_TOTALS, (idea_id,)).fetchone()
+            if row is None:
+                raise self._not_found()
+            votes, value_total, effort_total, confidence_total = row
+            conn.execute(
+                _INSERT_EVALUATION,
+                (
+                    idea_id,
+                    payload.value,
+                    payload.effort,
+                    payload.confidence,
+                    payload.comment,
+                ),
+            )
+            votes += 1
+            value_total += payload.value
+            effort_total += payload.effort
+            confidence_total += payload.confidence
+            score = ScoreSummary.from_totals(
+                votes=votes,
+                total_value=value_total,
+                total_effort=effort_total,
+                total_confidence=confidence_total,
+            )
+            conn.execute(
+                _UPDATE_TOTALS,
+                (
+                    votes,
+                    value_total,
+                    effort_total,
+                    confidence_total,
+                    score.value,
+                    score.impact,
+                    idea_id,
+                ),
+            )
+            return self._load(conn, idea_id)
+
+    def add_evaluations(
+        self, batches: Dict[int, Sequence[EvaluationCreate]]
+    ) -> Dict[int, ScoreSummary]:
+        """Добавляет оценки, сгруппированные по идеям, в одной транзакции.
+
+        На идею — один executemany по оценкам и одно обновление сумм.
+        Несуществующие идеи пропускаются и в результат не попадают.
+        """
+        scores: Dict[int, ScoreSummary] = {}
+        with self._transaction() as conn:
+            for idea_id, payloads in batches.items():
+                row = conn.execute(_SELECT_TOTALS, (idea_id,)).fetchone()
+                if row is None or not payloads:
+                    continue
+                votes, value_total, effort_total, confidence_total = row
+                conn.executemany(
+                    _INSERT_EVALUATION,
+                    [
+                        (
+                            idea_id,
+                            payload.value,
+                            payload.effort,
+                            payload.confidence,
+                            payload.comment,
+                        )
+                        for payload in payloads
+                    ],
+                )
+                votes += len(payloads)
+                value_total += sum(payload.value for payload in payloads)
+                effort_total += sum(payload.effort for payload in payloads)
+                confidence_total += sum(payload.confidence for payload in payloads)
+                score = ScoreSummary.from_totals(
+                    votes=votes,
+                    total_value=value_total,
+                    total_effort=effort_total,
+                    total_confidence=confidence_total,
+                )
+                conn.execute(
+                    _UPDATE_TOTALS,
+                    (
+                        votes,
+                        value_total,
+                        effort_total,
+                        confidence_total,
+                        score.value,
+                        score.impact,
+                        idea_id,
+                    ),
+                )
+                scores[idea_id] = score
+        return scores
+
+    def evaluations(self, idea_id: int) -> List[Dict[str, object]]:
+        """История оценок для детального просмотра в интерфейсе/тестах."""
+        with self._connection() as conn:
+            self._ensure_exists(conn, idea_id)
+            rows = conn.execute(_SELECT_EVALUATIONS, (idea_id,)).fetchall()
+        return [
+            {
+                "value": value,
+                "effort": effort,
+                "confidence": confidence,
+                "comment": comment,
+            }
+            for value, effort, confidence, comment in rows
+        ]
+
+    def evaluations_many(
+        self, idea_ids: Iterable[int]
+    ) -> Dict[int, List[Dict[str, object]]]:
+        """Истории оценок пачки идей одним запросом; нет идеи — нет ключа."""
+        ids = list(idea_ids)
+        with self._connection() as conn:
+            existing = conn.execute(
+                "SELECT id FROM ideas WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),),
+            ).fetchall()
+            rows = conn.execute(_SELECT_EVALUATIONS_MANY, (json.dumps(ids),)).fetchall()
+        histories: Dict[int, List[Dict[str, object]]] = {
+            idea_id: [] for (idea_id,) in existing
+        }
+        for idea_id, value, effort, confidence, comment in rows:
+            histories[idea_id].append(
+                {
+                    "value": value,
+                    "effort": effort,
+                    "confidence": confidence,
+                    "comment": comment,
+                }
+            )
+        return histories
+
+    def evaluation_analytics(self, group_by: AnalyticsGroupBy) -> EvaluationAnalytics:
+        """Среднее, перцентили и гистограммы оценок по тегам или статусам."""
+        with self._connection() as conn:
+            meta = dict(conn.execute(_SELECT_META).fetchall())
+            stamp = (meta["epoch"], int(meta["version"]))
+            cached = self._histograms
+            if cached is not None and cached[0] == stamp:
+                histograms = cached[1]
+            else:
+                rows = conn.execute(_SELECT_HISTOGRAMS).fetchall()
+                histograms = histograms_from_rows(rows)
+                self._histograms = (stamp, histograms)
+            groups: Dict[str, List[int]] = {}
+            for key, idea_id in conn.execute(_SELECT_GROUPS[group_by]):
+                groups.setdefault(key, []).append(idea_id)
+            (ideas,) = conn.execute("SELECT COUNT(*) FROM ideas").fetchone()
+        return build_analytics(group_by, histograms, groups, ideas)
+
+    def clear(self) -> None:
+        """Сбрасывает состояние. Используется в тестах."""
+        with self._transaction() as conn:
+            for table in (
+                "attachments",
+                "evaluations",
+                "idea_tags",
+                "ideas_fts",
+                "ideas",
+            ):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'ideas'")
+            # id начнутся заново, поэтому и старые ETag не должны совпасть.
+            conn.execute(_SET_EPOCH, (new_epoch(),))
+        self._json.clear()
+
+    def add_attachment(self, idea_id: int, attachment: str) -> List[str]:
+        with self._transaction() as conn:
+            self._ensure_exists(conn, idea_id)
+            conn.execute(_INSERT_ATTACHMENT, (idea_id, attachment))
+            conn.execute(_TOUCH_IDEA, (idea_id,))
+            rows = conn.execute(_SELECT_IDEA_ATTACHMENTS, (idea_id,)).fetchall()
+        return [filename for (filename,) in rows]
+
+    def referenced_attachments(self, names: Iterable[str]) -> Set[str]:
+        """Какие из имён файлов записаны во вложения хотя бы одной идеи."""
+        with self._connection() as conn:
+            rows = conn.execute(_SELECT_REFERENCED, (json.dumps(list(names)),))
+            return {filename for (filename,) in rows}
+
+    def close(self) -> None:
+        """Закрывает все соединения пула."""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._opened -= 1
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Берёт соединение из пула; новые открываются, пока не упрёмся в pool_size."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._opened < self._pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except sqlite3.Error:
+                    with self._pool_lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    conn = self._pool.get(timeout=POOL_TIMEOUT_SECONDS)
+                except queue.Empty:
+                    raise ApiProblem(
+                        code="storage_busy",
+                        detail="storage connection pool exhausted",
+                        status=503,
+                    )
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Пишущая транзакция: BEGIN IMMEDIATE сразу берёт блокировку записи."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute(_BUMP_VERSION)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _ensure_exists(self, conn: sqlite3.Connection, idea_id: int) -> None:
+        if conn.execute(_SELECT_EXISTS, (idea_id,)).fetchone() is None:
+            raise self._not_found()
+
+    def _load(self, conn: sqlite3.Connection, idea_id: int) -> IdeaResponse:
+        row = conn.execute(_SELECT_IDEA, (idea_id,)).fetchone()
+        if row is None:
+            raise self._not_found()
+        return self._build_responses(conn, [row])[0]
+
+    def _rows_json(
+        self, conn: sqlite3.Connection, rows: Sequence[Sequence]
+    ) -> List[Tuple[int, bytes]]:
+        fragments: Dict[int, bytes] = {}
+        missing = []
+        for row in rows:
+            data = self._json.get(row[0], (row[-1], row[-2]))
+            if data is None:
+                missing.append(row)
+            else:
+                fragments[row[0]] = data
+        responses = self._build_responses(conn, [row[:-2] for row in missing])
+        for row, response in zip(missing, responses):
+            data = serialize_idea(response)
+            self._json.put(row[0], (row[-1], row[-2]), data)
+            fragments[row[0]] = data
+        return [(row[0], fragments[row[0]]) for row in rows]
+
+    def _build_responses(
+        self, conn: sqlite3.Connection, rows: Sequence[Sequence]
+    ) -> List[IdeaResponse]:
+        if not rows:
+            return []
+        ids = json.dumps([row[0] for row in rows])
+        tags: Dict[int, List[str]] = {}
+        for idea_id, tag in conn.execute(_SELECT_TAGS, (ids,)):
+            tags.setdefault(idea_id, []).append(tag)
+        attachments: Dict[int, List[str]] = {}
+        for idea_id, filename in conn.execute(_SELECT_ATTACHMENTS, (ids,)):
+            attachments.setdefault(idea_id, []).append(filename)
+
+        responses = []
+        for (
+            idea_id,
+            title,
+            description,
+            status,
+            votes,
+            value_total,
+            effort_total,
+            confidence_total,
+        ) in rows:
+            responses.append(
+                IdeaResponse(
+                    id=idea_id,
+                    title=title,
+                    description=description,
+                    tags=tags.get(idea_id, []),
+                    status=IdeaStatus(status),
+                    score=ScoreSummary.from_totals(
+                        votes=votes,
+                        total_value=value_total,
+                        total_effort=effort_total,
+                        total_confidence=confidence_total,
+                    ),
+                    attachments=attachments.get(idea_id, []),
+                )
+            )
+        return responses
+
+    @staticmethod
+    def _not_found() -> ApiProblem:
+        return ApiProblem(code="idea_not_found", detail="idea not found", status=404)
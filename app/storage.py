@@ -0,0 +1,824 @@
+"""In-memory хранилище идей со вторичными индексами."""
+
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from functools import partial
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from uuid import uuid4
+
+from app.analytics import (
+    EvaluationColumns,
+    GroupCounts,
+    PackedHistograms,
+    analytics_from_counts,
+    group_counts,
+)
+from app.locks import ReadWriteLock
+from app.models import (
+    AnalyticsGroupBy,
+    Evaluation,
+    EvaluationAnalytics,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaRecord,
+    IdeaResponse,
+    IdeaSort,
+    IdeaStatus,
+    IdeaUpdate,
+    PackedEvaluations,
+    ScoreSummary,
+    parse_status,
+)
+from app.problem_details import ApiProblem
+from app.response_cache import DEFAULT_CACHE_ENTRIES, ResponseCache, serialize_idea
+from app.search import SearchIndex, idea_text
+
+
+def new_epoch() -> str:
+    return uuid4().hex[:12]
+
+
+def _evaluation_history(record: IdeaRecord) -> List[Dict[str, object]]:
+    return [
+        {
+            "value": item.value,
+            "effort": item.effort,
+            "confidence": item.confidence,
+            "comment": item.comment,
+        }
+        for item in record.evaluations
+    ]
+
+
+def _discard_sorted(ids: List[int], idea_id: int) -> None:
+    """Убирает idea_id из отсортированного списка, если он там есть."""
+    position = bisect_left(ids, idea_id)
+    if position < len(ids) and ids[position] == idea_id:
+        del ids[position]
+
+
+class IdeaStorage:
+    """Миниатюрное in-memory хранилище для идей.
+
+    В продакшене здесь будет база данных, но интерфейс оставим тем же самым.
+
+    compact=True экономит память на больших каталогах: оценки записи
+    упаковываются в PackedEvaluations, теги — в кортеж строк из общего
+    словаря, а гистограммы analytics досчитываются прямо по новым упакованным
+    оценкам, без отдельной колоночной копии.
+
+    json_cache_size ограничивает кэш готовых JSON-байтов ответа (LRU): без
+    ограничения после одного полного экспорта он держал бы копию каждой идеи.
+
+    id_start и id_step задают арифметическую прогрессию id: шард k из N
+    (app/sharding.py) выдаёт id k + 1, k + 1 + N, ..., чтобы id не
+    пересекались между шардами, а шард находился по самому id.
+    """
+
+    # Для AsyncIdeaStorage: операции не ждут ввода-вывода, их можно звать
+    # прямо из event loop.
+    blocking_reads = False
+    blocking_writes = False
+
+    def __init__(
+        self,
+        *,
+        compact: bool = False,
+        id_start: int = 1,
+        id_step: int = 1,
+        json_cache_size: int = DEFAULT_CACHE_ENTRIES,
+    ) -> None:
+        # Публичные методы берут блокировку сами: чтения идут параллельно,
+        # мутации — по одной. Внутренние _методы ожидают, что она уже взята.
+        self._lock = ReadWriteLock()
+        self._compact_records = compact
+        # Компактный режим: одна строка на каждый встреченный тег.
+        self._tag_names: Dict[str, str] = {}
+        self._ideas: Dict[int, IdeaRecord] = {}
+        self._evaluation_count = 0
+        self._id_start = id_start
+        self._id_step = id_step
+        self._next_id = id_start
+        # id выдаются по возрастанию, поэтому список остаётся отсортированным
+        # и годится для keyset-пагинации через bisect.
+        self._ids: List[int] = []
+        # Вторичные индексы для фильтров list: тег -> id, статус -> id (оба
+        # отсортированы, как self._ids, чтобы страница начиналась с bisect),
+        # и отсортированные пары (средняя ценность, id) для min_score.
+        self._by_tag: Dict[str, List[int]] = {}
+        self._by_status: Dict[IdeaStatus, List[int]] = {}
+        self._by_score: List[Tuple[float, int]] = []
+        # Для sort: по каждой метрике пары (-значение, id) по возрастанию, то
+        # есть лучшие впереди, а при равенстве — меньший id. Идеи без оценок
+        # (без value и impact, 0 голосов) лежат отдельно по id и идут в конце.
+        self._rankings: Dict[IdeaSort, List[Tuple[float, int]]] = {
+            sort: [] for sort in IdeaSort
+        }
+        self._unrated: List[int] = []
+        # Сколько раз каждое имя файла встречается во вложениях идей.
+        self._attachment_refs: Dict[str, int] = {}
+        # Глобальная версия растёт на каждой мутации. Эпоха отличает этот
+        # экземпляр (и каждый clear), чтобы ETag не совпали после рестарта.
+        self._version = 0
+        self._epoch = new_epoch()
+        self._json = ResponseCache(max_entries=max(1, json_cache_size))
+        # Полнотекстовый индекс по названию и описанию для search.
+        self._search = SearchIndex()
+        # Источник гистограмм для analytics: колоночная копия оценок, а в
+        # компактном режиме — сворачивание новых упакованных оценок.
+        # Строки гистограмм идут по позиции id в прогрессии, а не по самому id.
+        positions = {"id_start": id_start, "id_step": id_step}
+        self._columns: EvaluationColumns | PackedHistograms = (
+            PackedHistograms(self._ideas, **positions)
+            if compact
+            else EvaluationColumns(**positions)
+        )
+
+    def create(self, payload: IdeaCreate) -> IdeaResponse:
+        """Создаёт идею и возвращает её состояние."""
+        with self._lock.write:
+            record = self._new_record(payload)
+            self._insert(record)
+            return IdeaResponse.from_record(record)
+
+    def create_many(self, payloads: Sequence[IdeaCreate]) -> List[int]:
+        """Создаёт идеи пачкой и возвращает их id, не собирая IdeaResponse."""
+        with self._lock.write:
+            ids: List[int] = []
+            for payload in payloads:
+                record = self._new_record(payload)
+                self._insert(record)
+                ids.append(record.id)
+            return ids
+
+    def list(
+        self,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[IdeaResponse]:
+        """Идеи по возрастанию id; after_id и limit задают keyset-страницу."""
+        with self._lock.read:
+            ids = self._matching_ids(
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                after_id=after_id,
+                limit=limit,
+            )
+            return [IdeaResponse.from_record(self._ideas[idea_id]) for idea_id in ids]
+
+    def list_json(
+        self,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        """То же, что list, но пары (id, JSON-байты ответа) из кэша."""
+        with self._lock.read:
+            ids = self._matching_ids(
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                after_id=after_id,
+                limit=limit,
+            )
+            return [
+                (idea_id, self._record_json(self._ideas[idea_id])) for idea_id in ids
+            ]
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def totals(self) -> Tuple[int, int]:
+        """Число идей и оценок (для /metrics)."""
+        return len(self._ideas), self._evaluation_count
+
+    def list_etag(self) -> str:
+        """ETag для списков: меняется при любой мутации хранилища."""
+        return f'"{self._epoch}-{self._version}"'
+
+    def record_etag(self, idea_id: int) -> str:
+        """ETag одной идеи (или 404), без сборки IdeaResponse."""
+        with self._lock.read:
+            record = self._get_or_raise(idea_id)
+            return f'"{self._epoch}-{idea_id}-{record.version}"'
+
+    def get(self, idea_id: int) -> IdeaResponse:
+        """Возвращает идею по идентификатору или отдаёт 404."""
+        with self._lock.read:
+            record = self._get_or_raise(idea_id)
+            return IdeaResponse.from_record(record)
+
+    def search(
+        self,
+        query: str,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[IdeaResponse]:
+        """Идеи, подходящие под запрос, по убыванию BM25 (при равенстве — по id)."""
+        with self._lock.read:
+            ids = self._search_ids(
+                query,
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                offset=offset,
+                limit=limit,
+            )
+            return [IdeaResponse.from_record(self._ideas[idea_id]) for idea_id in ids]
+
+    def search_json(
+        self,
+        query: str,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        """То же, что search, но пары (id, JSON-байты ответа) из кэша."""
+        with self._lock.read:
+            ids = self._search_ids(
+                query,
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                offset=offset,
+                limit=limit,
+            )
+            return [
+                (idea_id, self._record_json(self._ideas[idea_id])) for idea_id in ids
+            ]
+
+    def search_scored_json(
+        self,
+        query: str,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[Tuple[float, int], bytes]]:
+        """Первые limit результатов search_json с ключом порядка (-BM25, id).
+
+        По ключам выдачи нескольких хранилищ сливаются в одну.
+        """
+        with self._lock.read:
+            hits = self._search_hits(
+                query,
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                offset=0,
+                limit=limit,
+            )
+            return [
+                ((-score, idea_id), self._record_json(self._ideas[idea_id]))
+                for idea_id, score in hits
+            ]
+
+    def ranked(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[IdeaResponse]:
+        """Идеи по убыванию метрики sort; при равенстве по id, без оценок — в конце."""
+        with self._lock.read:
+            ids = self._ranked_ids(
+                sort,
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                offset=offset,
+                limit=limit,
+            )
+            return [IdeaResponse.from_record(self._ideas[idea_id]) for idea_id in ids]
+
+    def ranked_json(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[int, bytes]]:
+        """То же, что ranked, но пары (id, JSON-байты ответа) из кэша."""
+        with self._lock.read:
+            ids = self._ranked_ids(
+                sort,
+                tag=tag,
+                status=status,
+                min_score=min_score,
+                offset=offset,
+                limit=limit,
+            )
+            return [
+                (idea_id, self._record_json(self._ideas[idea_id])) for idea_id in ids
+            ]
+
+    def ranked_keyed_json(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str] = None,
+        status: Optional[IdeaStatus] = None,
+        min_score: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[Tuple[int, float, int], bytes]]:
+        """Первые limit результатов ranked_json с ключом порядка, как search_scored_json."""
+        with self._lock.read:
+            ids = self._ranked_ids(
+                sort, tag=tag, status=status, min_score=min_score, offset=0, limit=limit
+            )
+            return [
+                (self._rank_key(sort, idea_id), self._record_json(self._ideas[idea_id]))
+                for idea_id in ids
+            ]
+
+    def get_json(self, idea_id: int) -> bytes:
+        """JSON-байты ответа для идеи (или 404), из кэша, если запись не менялась."""
+        with self._lock.read:
+            return self._record_json(self._get_or_raise(idea_id))
+
+    def ensure_exists(self, idea_id: int) -> None:
+        """Проверяет, что идея существует (без аллокаций ответа)."""
+        with self._lock.read:
+            self._get_or_raise(idea_id)
+
+    def update(self, idea_id: int, payload: IdeaUpdate) -> IdeaResponse:
+        """Обновляет только те поля, которые передал клиент."""
+        with self._lock.write:
+            record = self._get_or_raise(idea_id)
+            # Статус проверяется до любых изменений: 422 не должен оставить
+            # запись и поисковый индекс наполовину обновлёнными.
+            new_status = None
+            if payload.status is not None:
+                new_status = parse_status(payload.status)
+
+            if payload.title is not None or payload.description is not None:
+                self._set_text(
+                    record,
+                    title=None if payload.title is None else payload.title.strip(),
+                    description=(
+                        None
+                        if payload.description is None
+                        else payload.description.strip()
+                    ),
+                )
+            if new_status is not None:
+                self._set_status(record, new_status)
+            if payload.tags is not None:
+                self._set_tags(record, sorted({tag for tag in payload.tags}))
+            self._touch(record)
+
+            return IdeaResponse.from_record(record)
+
+    def add_evaluation(self, idea_id: int, payload: EvaluationCreate) -> IdeaResponse:
+        """Добавляет новую оценку и возвращает идею с пересчитанным рейтингом."""
+        with self._lock.write:
+            record = self._get_or_raise(idea_id)
+            entry = Evaluation(
+                value=payload.value,
+                effort=payload.effort,
+                confidence=payload.confidence,
+                comment=payload.comment,
+            )
+            self._record_evaluation(record, entry)
+            return IdeaResponse.from_record(record)
+
+    def add_evaluations(
+        self, batches: Dict[int, Sequence[EvaluationCreate]]
+    ) -> Dict[int, ScoreSummary]:
+        """Добавляет оценки, сгруппированные по идеям; возвращает новые оценки идей.
+
+        Суммы и индекс по оценке обновляются один раз на идею. Несуществующие
+        идеи пропускаются и в результат не попадают.
+        """
+        with self._lock.write:
+            scores: Dict[int, ScoreSummary] = {}
+            for idea_id, payloads in batches.items():
+                record = self._ideas.get(idea_id)
+                if record is None or not payloads:
+                    continue
+                entries = [
+                    Evaluation(
+                        value=payload.value,
+                        effort=payload.effort,
+                        confidence=payload.confidence,
+                        comment=payload.comment,
+                    )
+                    for payload in payloads
+                ]
+                self._record_evaluations(record, entries)
+                scores[idea_id] = ScoreSummary.from_totals(
+                    votes=len(record.evaluations),
+                    total_value=record.value_total,
+                    total_effort=record.effort_total,
+                    total_confidence=record.confidence_total,
+                )
+            return scores
+
+    def evaluations(self, idea_id: int) -> List[Dict[str, object]]:
+        """История оценок для детального просмотра в интерфейсе/тестах."""
+        with self._lock.read:
+            return _evaluation_history(self._get_or_raise(idea_id))
+
+    def evaluations_many(
+        self, idea_ids: Iterable[int]
+    ) -> Dict[int, List[Dict[str, object]]]:
+        """Истории оценок сразу для пачки идей (для экспорта); нет идеи — нет ключа."""
+        with self._lock.read:
+            return {
+                idea_id: _evaluation_history(self._ideas[idea_id])
+                for idea_id in idea_ids
+                if idea_id in self._ideas
+            }
+
+    def evaluation_analytics(self, group_by: AnalyticsGroupBy) -> EvaluationAnalytics:
+        """Среднее, перцентили и гистограммы оценок по тегам или статусам."""
+        return analytics_from_counts(group_by, *self.evaluation_counts(group_by))
+
+    def evaluation_counts(
+        self, group_by: AnalyticsGroupBy
+    ) -> Tuple[GroupCounts, Dict[str, GroupCounts]]:
+        """Счётчики для evaluation_analytics; складываются через merge_group_counts."""
+        # Под блокировкой — только снимок: копии списков id и досворачивание
+        # колонок. Суммы по группам считаются уже без неё, писатели не ждут.
+        with self._lock.read:
+            if group_by is AnalyticsGroupBy.tag:
+                groups = {tag: list(ids) for tag, ids in self._by_tag.items()}
+            else:
+                groups = {
+                    status.value: list(ids) for status, ids in self._by_status.items()
+                }
+            histograms = self._columns.histograms()
+            ideas = len(self._ideas)
+        return group_counts(
+            histograms, groups, ideas, id_start=self._id_start, id_step=self._id_step
+        )
+
+    def clear(self) -> None:
+        """Сбрасывает состояние. Используется в тестах."""
+        with self._lock.write:
+            self._ideas.clear()
+            self._evaluation_count = 0
+            self._ids.clear()
+            self._next_id = self._id_start
+            self._by_tag.clear()
+            self._by_status.clear()
+            self._by_score.clear()
+            for ranking in self._rankings.values():
+                ranking.clear()
+            self._unrated.clear()
+            self._attachment_refs.clear()
+            self._version += 1
+            self._epoch = new_epoch()
+            self._json.clear()
+            self._search.clear()
+            self._tag_names.clear()
+            self._columns.clear()
+
+    def add_attachment(self, idea_id: int, attachment: str) -> List[str]:
+        with self._lock.write:
+            record = self._get_or_raise(idea_id)
+            self._record_attachment(record, attachment)
+            return list(record.attachments)
+
+    def referenced_attachments(self, names: Iterable[str]) -> Set[str]:
+        """Какие из имён файлов записаны во вложения хотя бы одной идеи."""
+        with self._lock.read:
+            return {name for name in names if name in self._attachment_refs}
+
+    def _new_record(self, payload: IdeaCreate) -> IdeaRecord:
+        return IdeaRecord(
+            id=self._next_id,
+            title=payload.title.strip(),
+            description=payload.description.strip(),
+            tags=sorted({tag for tag in payload.tags}),
+        )
+
+    def _insert(self, record: IdeaRecord, *, index_score: bool = True) -> None:
+        """Кладёт готовую запись в хранилище и индексы (и при восстановлении тоже)."""
+        if self._compact_records:
+            record.tags = self._intern_tags(record.tags)
+            if not isinstance(record.evaluations, PackedEvaluations):
+                record.evaluations = PackedEvaluations(record.evaluations)
+        self._ideas[record.id] = record
+        self._evaluation_count += len(record.evaluations)
+        self._ids.append(record.id)
+        self._next_id = max(self._next_id, record.id + self._id_step)
+        self._index_tags(record.id, record.tags)
+        insort(self._by_status.setdefault(record.status, []), record.id)
+        self._search.add(record.id, idea_text(record.title, record.description))
+        if record.evaluations:
+            self._columns.append(record.id, record.evaluations)
+        self._version += 1
+        for attachment in record.attachments:
+            self._count_attachment(attachment)
+        if index_score:
+            if record.score_value is not None:
+                insort(self._by_score, (record.score_value, record.id))
+            self._rank(record)
+
+    def _record_json(self, record: IdeaRecord) -> bytes:
+        # Версию читаем до сборки: если запись меняется параллельно, фрагмент
+        # окажется под устаревшей версией и просто не будет найден.
+        version = record.version
+        data = self._json.get(record.id, version)
+        if data is None:
+            data = serialize_idea(IdeaResponse.from_record(record))
+            self._json.put(record.id, version, data)
+        return data
+
+    def _rebuild_score_index(self) -> None:
+        """Строит индексы по оценкам заново одной сортировкой (для массовой загрузки)."""
+        rated = [record for record in self._ideas.values() if record.evaluations]
+        self._by_score = sorted((record.score_value, record.id) for record in rated)
+        self._rankings = {
+            sort: sorted((-record.sort_value(sort), record.id) for record in rated)
+            for sort in IdeaSort
+        }
+        self._unrated = sorted(
+            record.id for record in self._ideas.values() if not record.evaluations
+        )
+
+    def _rank(self, record: IdeaRecord) -> None:
+        if not record.evaluations:
+            insort(self._unrated, record.id)
+            return
+        for sort, ranking in self._rankings.items():
+            insort(ranking, (-record.sort_value(sort), record.id))
+
+    def _unrank(self, record: IdeaRecord) -> None:
+        if not record.evaluations:
+            del self._unrated[bisect_left(self._unrated, record.id)]
+            return
+        for sort, ranking in self._rankings.items():
+            del ranking[bisect_left(ranking, (-record.sort_value(sort), record.id))]
+
+    def _set_status(self, record: IdeaRecord, status: IdeaStatus) -> None:
+        _discard_sorted(self._by_status[record.status], record.id)
+        insort(self._by_status.setdefault(status, []), record.id)
+        record.status = status
+
+    def _set_text(
+        self,
+        record: IdeaRecord,
+        *,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> None:
+        if title is not None:
+            record.title = title
+        if description is not None:
+            record.description = description
+        self._search.add(record.id, idea_text(record.title, record.description))
+
+    def _set_tags(self, record: IdeaRecord, tags: List[str]) -> None:
+        self._unindex_tags(record.id, record.tags)
+        record.tags = self._intern_tags(tags) if self._compact_records else tags
+        self._index_tags(record.id, record.tags)
+
+    def _intern_tags(self, tags: Iterable[str]) -> Tuple[str, ...]:
+        names = self._tag_names
+        return tuple(names.setdefault(tag, tag) for tag in tags)
+
+    def _record_evaluation(self, record: IdeaRecord, entry: Evaluation) -> None:
+        self._record_evaluations(record, [entry])
+
+    def _record_evaluations(
+        self, record: IdeaRecord, entries: List[Evaluation]
+    ) -> None:
+        previous_score = record.score_value
+        self._unrank(record)
+        if len(entries) == 1:
+            record.append_evaluation(entries[0])
+        else:
+            record.extend_evaluations(entries)
+        self._evaluation_count += len(entries)
+        self._columns.append(record.id, entries)
+        if previous_score is not None:
+            position = bisect_left(self._by_score, (previous_score, record.id))
+            del self._by_score[position]
+        insort(self._by_score, (record.score_value, record.id))
+        self._rank(record)
+        self._touch(record)
+
+    def _record_attachment(self, record: IdeaRecord, attachment: str) -> None:
+        record.attachments.append(attachment)
+        self._count_attachment(attachment)
+        self._touch(record)
+
+    def _count_attachment(self, attachment: str) -> None:
+        self._attachment_refs[attachment] = self._attachment_refs.get(attachment, 0) + 1
+
+    def _touch(self, record: IdeaRecord) -> None:
+        record.version += 1
+        self._version += 1
+
+    def _index_tags(self, idea_id: int, tags: Iterable[str]) -> None:
+        for tag in tags:
+            insort(self._by_tag.setdefault(tag, []), idea_id)
+
+    def _unindex_tags(self, idea_id: int, tags: Iterable[str]) -> None:
+        for tag in tags:
+            bucket = self._by_tag.get(tag)
+            if bucket is None:
+                continue
+            _discard_sorted(bucket, idea_id)
+            if not bucket:
+                del self._by_tag[tag]
+
+    def _matching_ids(
+        self,
+        *,
+        tag: Optional[str],
+        status: Optional[IdeaStatus],
+        min_score: Optional[float],
+        after_id: Optional[int],
+        limit: Optional[int],
+    ) -> List[int]:
+        """Отбирает id по индексам в порядке возрастания.
+
+        Индексы по тегу и статусу отсортированы по id, поэтому страница
+        начинается с bisect по after_id в самом маленьком из них и кончается
+        на limit-м совпадении; остальные условия проверяем по записи. Если
+        min_score пропускает мало идей, их дешевле взять из индекса по оценке
+        и отобрать кучей. Без фильтров страница берётся срезом из self._ids.
+        """
+        tag_key = tag.lower() if tag else None
+        buckets: List[List[int]] = []
+        if tag_key:
+            buckets.append(self._by_tag.get(tag_key, []))
+        if status:
+            buckets.append(self._by_status.get(status, []))
+        ordered = min(buckets, key=len, default=self._ids)
+        start = 0 if after_id is None else bisect_right(ordered, after_id)
+        if not buckets and min_score is None:
+            stop = None if limit is None else start + limit
+            return ordered[start:stop]
+
+        if min_score is not None:
+            score_start = bisect_left(self._by_score, (min_score, 0))
+            scored = len(self._by_score) - score_start
+            # Как в _ranked_ids: обход по id до limit совпадений стоит в среднем
+            # limit * len(ordered) / scored шагов, отбор по оценке — scored.
+            if (
+                scored < len(ordered) - start
+                if limit is None
+                else limit * len(ordered) >= scored * scored
+            ):
+                matched = [
+                    idea_id
+                    for _, idea_id in self._by_score[score_start:]
+                    if (after_id is None or idea_id > after_id)
+                    and self._matches(idea_id, tag_key, status, None)
+                ]
+                if limit is not None:
+                    return heapq.nsmallest(limit, matched)
+                matched.sort()
+                return matched
+
+        matched = []
+        for position in range(start, len(ordered)):
+            idea_id = ordered[position]
+            if self._matches(idea_id, tag_key, status, min_score):
+                matched.append(idea_id)
+                if len(matched) == limit:
+                    break
+        return matched
+
+    def _matches(
+        self,
+        idea_id: int,
+        tag_key: Optional[str],
+        status: Optional[IdeaStatus],
+        min_score: Optional[float],
+    ) -> bool:
+        record = self._ideas[idea_id]
+        if tag_key and tag_key not in record.tags:
+            return False
+        if status and record.status != status:
+            return False
+        if min_score is not None:
+            current_score = record.score_value
+            if current_score is None or current_score < min_score:
+                return False
+        return True
+
+    def _search_ids(
+        self,
+        query: str,
+        *,
+        tag: Optional[str],
+        status: Optional[IdeaStatus],
+        min_score: Optional[float],
+        offset: int,
+        limit: Optional[int],
+    ) -> List[int]:
+        hits = self._search_hits(
+            query,
+            tag=tag,
+            status=status,
+            min_score=min_score,
+            offset=offset,
+            limit=limit,
+        )
+        return [idea_id for idea_id, _ in hits]
+
+    def _search_hits(
+        self,
+        query: str,
+        *,
+        tag: Optional[str],
+        status: Optional[IdeaStatus],
+        min_score: Optional[float],
+        offset: int,
+        limit: Optional[int],
+    ) -> List[Tuple[int, float]]:
+        allowed: Optional[Set[int]] = None
+        if tag or status or min_score is not None:
+            allowed = set(
+                self._matching_ids(
+                    tag=tag,
+                    status=status,
+                    min_score=min_score,
+                    after_id=None,
+                    limit=None,
+                )
+            )
+        return self._search.search(query, allowed=allowed, offset=offset, limit=limit)
+
+    def _ranked_ids(
+        self,
+        sort: IdeaSort,
+        *,
+        tag: Optional[str],
+        status: Optional[IdeaStatus],
+        min_score: Optional[float],
+        offset: int,
+        limit: Optional[int],
+    ) -> List[int]:
+        stop = None if limit is None else offset + limit
+        if not (tag or status or min_score is not None):
+            # Без фильтров страница — просто срез готового порядка: O(offset + K).
+            ranking = self._rankings[sort]
+            ids = [idea_id for _, idea_id in ranking[offset:stop]]
+            if stop is None or stop > len(ranking):
+                tail_stop = None if stop is None else stop - len(ranking)
+                ids.extend(self._unrated[max(0, offset - len(ranking)) : tail_stop])
+            return ids
+
+        matched = self._matching_ids(
+            tag=tag, status=status, min_score=min_score, after_id=None, limit=None
+        )
+        if stop is not None and stop * len(self._ideas) < len(matched) ** 2:
+            # Фильтр пропускает много идей: идём по готовому порядку, пока не
+            # наберём stop подходящих, — в среднем stop * N / M шагов.
+            allowed = set(matched)
+            ids = []
+            ranking = (idea_id for _, idea_id in self._rankings[sort])
+            for idea_id in chain(ranking, self._unrated):
+                if idea_id in allowed:
+                    ids.append(idea_id)
+                    if len(ids) == stop:
+                        break
+            return ids[offset:]
+        key = partial(self._rank_key, sort)
+        if stop is None:
+            return sorted(matched, key=key)[offset:]
+        # Ограниченная куча: O(M log K) по отфильтрованным id.
+        return heapq.nsmallest(stop, matched, key=key)[offset:]
+
+    def _rank_key(self, sort: IdeaSort, idea_id: int) -> Tuple[int, float, int]:
+        metric = self._ideas[idea_id].sort_value(sort)
+        if metric is None:
+            return 1, 0.0, idea_id
+        return 0, -metric, idea_id
+
+    def _get_or_raise(self, idea_id: int) -> IdeaRecord:
+        """Утилита, чтобы не дублировать проверку на существование."""
+        if idea_id not in self._ideas:
+            raise ApiProblem(code="idea_not_found", detail="idea not found", status=404)
+        return self._ideas[idea_id]
@@ -0,0 +1,154 @@
+"""Бенчмарк /ideas/analytics: колоночные агрегаты против цикла по IdeaRecord.evaluations.
+
+Эталон — прежний подход: по каждой группе собрать оценки из списков
+Evaluation в Python, отсортировать и посчитать среднее и перцентили.
+Замеряются первый запрос (сворачивание всех колонок), повторный после
+небольшой пачки новых оценок, то же в компактном режиме (сворачиваются
+упакованные оценки) и SQLite-бэкенд (один GROUP BY по evaluations).
+
+    python scripts/bench_analytics.py --ideas 100000 --evaluations 10000000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models import AnalyticsGroupBy, EvaluationCreate, IdeaCreate  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+TAGS = [f"team-{index}" for index in range(20)]
+IDEAS_PER_BATCH = 2000
+
+
+def fill(storage, ideas: int, evaluations: int, seed: int = 13) -> None:
+    rng = random.Random(seed)
+    for offset in range(0, ideas, 1000):
+        storage.create_many(
+            [
+                IdeaCreate(
+                    title=f"Idea {index}",
+                    description="Catalogue entry for the analytics benchmark.",
+                    tags=rng.sample(TAGS, 2),
+                )
+                for index in range(offset, min(offset + 1000, ideas))
+            ]
+        )
+    # Одни и те же объекты запроса переиспользуются: хранилище всё равно
+    # создаёт на каждую оценку свою запись.
+    pool = [
+        EvaluationCreate(
+            value=rng.randint(1, 10),
+            effort=rng.randint(1, 10),
+            confidence=rng.randint(1, 10),
+        )
+        for _ in range(1000)
+    ]
+    # Оценки поровну на идею, пачками по IDEAS_PER_BATCH идей.
+    per_idea = max(1, evaluations // ideas)
+    for offset in range(1, ideas + 1, IDEAS_PER_BATCH):
+        storage.add_evaluations(
+            {
+                idea_id: pool[idea_id % 97 : idea_id % 97 + per_idea]
+                for idea_id in range(offset, min(offset + IDEAS_PER_BATCH, ideas + 1))
+            }
+        )
+
+
+def percentile(ordered: list, share: float) -> float:
+    position = (len(ordered) - 1) * share
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (position - lower) * (ordered[upper] - ordered[lower])
+
+
+def python_loop(storage: IdeaStorage) -> dict:
+    """Прежний подход: списки оценок по группам, сортировка, перцентили."""
+    result = {}
+    for tag, ids in storage._by_tag.items():
+        stats = {}
+        for metric in ("value", "effort", "confidence"):
+            scores = sorted(
+                getattr(entry, metric)
+                for idea_id in ids
+                for entry in storage._ideas[idea_id].evaluations
+            )
+            if scores:
+                stats[metric] = (
+                    statistics.fmean(scores),
+                    [percentile(scores, share) for share in (0.5, 0.9, 0.99)],
+                )
+        result[tag] = stats
+    return result
+
+
+def timed(call) -> float:
+    started = time.perf_counter()
+    call()
+    return time.perf_counter() - started
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=100_000)
+    parser.add_argument("--evaluations", type=int, default=10_000_000)
+    parser.add_argument("--skip-sqlite", action="store_true")
+    args = parser.parse_args()
+
+    extra = {
+        1: [EvaluationCreate(value=5, effort=5, confidence=5)] * 1000,
+    }
+    tag = AnalyticsGroupBy.tag
+
+    memory = IdeaStorage()
+    started = time.perf_counter()
+    fill(memory, args.ideas, args.evaluations)
+    print(
+        f"memory: {len(memory._columns)} evaluations loaded "
+        f"in {time.perf_counter() - started:.1f} s"
+    )
+    print(f"  python loop over records     {timed(lambda: python_loop(memory)):8.3f} s")
+    cold = timed(lambda: memory.evaluation_analytics(tag))
+    print(f"  columnar, first request      {cold:8.3f} s")
+    warm = timed(lambda: memory.evaluation_analytics(tag))
+    print(f"  columnar, repeated           {warm:8.3f} s")
+    memory.add_evaluations(extra)
+    after = timed(lambda: memory.evaluation_analytics(tag))
+    print(f"  columnar, +1000 evaluations  {after:8.3f} s")
+    memory.clear()
+
+    # Компактный режим: колонок нет, сворачиваются хвосты упакованных оценок.
+    # Первый запрос сворачивает всё — столько раньше стоил каждый запрос.
+    compact = IdeaStorage(compact=True)
+    fill(compact, args.ideas, args.evaluations)
+    cold = timed(lambda: compact.evaluation_analytics(tag))
+    print(f"compact: first request         {cold:8.3f} s")
+    warm = timed(lambda: compact.evaluation_analytics(tag))
+    print(f"  repeated                     {warm:8.3f} s")
+    compact.add_evaluations(extra)
+    after = timed(lambda: compact.evaluation_analytics(tag))
+    print(f"  +1000 evaluations            {after:8.3f} s")
+    compact.clear()
+
+    if args.skip_sqlite:
+        return
+    with tempfile.TemporaryDirectory() as raw:
+        sqlite = SQLiteIdeaStorage(Path(raw) / "ideas.db")
+        started = time.perf_counter()
+        fill(sqlite, args.ideas, args.evaluations)
+        print(f"sqlite: loaded in {time.perf_counter() - started:.1f} s")
+        cold = timed(lambda: sqlite.evaluation_analytics(tag))
+        print(f"  GROUP BY + numpy             {cold:8.3f} s")
+        warm = timed(lambda: sqlite.evaluation_analytics(tag))
+        print(f"  repeated, no writes          {warm:8.3f} s")
+        sqlite.close()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,133 @@
+"""Бенчмарк пропускной способности: async-обработчики против прежних def.
+
+Эталон — отдельное приложение с теми же маршрутами, но обычными def: каждый
+запрос уходит в пул потоков anyio (40 слотов). Обе версии получают
+--connections одновременных клиентов через httpx.ASGITransport, то есть
+без сети — измеряется только диспетчеризация и работа хранилища. Нагрузка:
+карточка идеи, страница списка и оценка (--writes процентов).
+
+    python scripts/bench_async.py --connections 1000 --requests 20000
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import main  # noqa: E402
+from app.models import EvaluationCreate, IdeaCreate, IdeaResponse  # noqa: E402
+from app.response_cache import join_json_array  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+reference = FastAPI()
+
+
+@reference.get("/ideas")
+def reference_list(limit: int = 100, tag: Optional[str] = None):
+    ideas = main.storage.list_json(tag=tag, limit=limit)
+    body = join_json_array(data for _, data in ideas)
+    return Response(content=body, media_type="application/json")
+
+
+@reference.get("/ideas/{idea_id}")
+def reference_get(idea_id: int):
+    headers = {"ETag": main.storage.record_etag(idea_id)}
+    body = main.storage.get_json(idea_id)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@reference.post("/ideas/{idea_id}/evaluations", response_model=IdeaResponse)
+def reference_evaluate(idea_id: int, payload: EvaluationCreate):
+    return main.storage.add_evaluation(idea_id, payload)
+
+
+def fill(storage, ideas: int) -> None:
+    storage.clear()
+    storage.create_many(
+        [
+            IdeaCreate(
+                title=f"Idea {index}",
+                description="Catalogue entry for the async benchmark.",
+                tags=[f"team-{index % 20}"],
+            )
+            for index in range(ideas)
+        ]
+    )
+
+
+async def client_loop(
+    client: httpx.AsyncClient, seed: int, ideas: int, writes: float, todo: list
+) -> None:
+    rng = random.Random(seed)
+    evaluation = {"value": 7, "effort": 3, "confidence": 6}
+    while todo:
+        todo.pop()
+        action = rng.random()
+        if action < writes:
+            url = f"/ideas/{rng.randint(1, ideas)}/evaluations"
+            response = await client.post(url, json=evaluation)
+        elif action < 0.5:
+            response = await client.get(f"/ideas?tag=team-{rng.randrange(20)}&limit=20")
+        else:
+            response = await client.get(f"/ideas/{rng.randint(1, ideas)}")
+        assert response.status_code == 200, response.text
+
+
+async def run(app: FastAPI, args: argparse.Namespace) -> float:
+    transport = httpx.ASGITransport(app=app)
+    limits = httpx.Limits(max_connections=args.connections)
+    todo = [None] * args.requests
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", limits=limits
+    ) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                client_loop(client, seed, args.ideas, args.writes / 100, todo)
+                for seed in range(args.connections)
+            )
+        )
+        return time.perf_counter() - started
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=10_000)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--writes", type=float, default=10.0, help="percent")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "memory": IdeaStorage(),
+            "sqlite": SQLiteIdeaStorage(Path(tmp) / "ideas.db"),
+        }
+        for name, storage in backends.items():
+            main.storage = storage
+            fill(storage, args.ideas)
+            results = {}
+            for label, app in (("def", reference), ("async", main.app)):
+                elapsed = asyncio.run(run(app, args))
+                results[label] = args.requests / elapsed
+                print(
+                    f"{name:<6} {label:<5} {args.connections} connections: "
+                    f"{results[label]:8.0f} req/s"
+                )
+            print(f"{name:<6} speedup: x{results['async'] / results['def']:.2f}")
+            if name == "sqlite":
+                storage.close()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,105 @@
+"""Бенчмарк: задержка лёгких запросов во время параллельных загрузок вложений.
+
+Приложение запускается в одном event loop через ASGI-транспорт httpx. Пока
+N клиентов по кругу грузят PNG, отдельная корутина последовательно дёргает
+`/health` и `GET /ideas` и собирает p50/p99. Сравниваются два режима
+AttachmentStorage: файловые операции прямо в event loop (io_workers=0, как
+было раньше) и в отдельном пуле потоков.
+
+    python scripts/bench_attachment_io.py --uploads 50 --size-mb 4 --seconds 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import main  # noqa: E402
+from app.models import IdeaCreate  # noqa: E402
+from app.security import DEFAULT_IO_QUEUE_DEPTH, AttachmentStorage  # noqa: E402
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(io_workers: int, uploads: int, payload: bytes, seconds: float) -> None:
+    with tempfile.TemporaryDirectory() as raw:
+        main.attachment_storage = AttachmentStorage(
+            Path(raw),
+            io_workers=io_workers,
+            io_queue_depth=max(DEFAULT_IO_QUEUE_DEPTH, uploads),
+        )
+        main.storage.clear()
+        main.rate_limiter.reset()
+        for index in range(200):
+            main.storage.create(
+                IdeaCreate(
+                    title=f"Idea {index}", description="Benchmark idea.", tags=["bench"]
+                )
+            )
+
+        transport = httpx.ASGITransport(app=main.app)
+        deadline = time.perf_counter() + seconds
+        latencies = {"/health": [], "/ideas": []}
+        statuses = {}
+
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+
+            async def uploader(idea_id: int) -> None:
+                while time.perf_counter() < deadline:
+                    response = await client.post(
+                        f"/ideas/{idea_id}/attachments",
+                        files={"file": ("bench.png", payload, "image/png")},
+                    )
+                    statuses[response.status_code] = (
+                        statuses.get(response.status_code, 0) + 1
+                    )
+
+            async def prober() -> None:
+                while time.perf_counter() < deadline:
+                    for path in latencies:
+                        started = time.perf_counter()
+                        await client.get(path)
+                        latencies[path].append(time.perf_counter() - started)
+                    await asyncio.sleep(0.005)
+
+            await asyncio.gather(
+                prober(), *(uploader(1 + index) for index in range(uploads))
+            )
+
+    mode = "event loop" if io_workers == 0 else f"executor ({io_workers} threads)"
+    print(f"{mode}: uploads by status {dict(sorted(statuses.items()))}")
+    for path, samples in latencies.items():
+        print(
+            f"  GET {path:<8} n={len(samples):<5} "
+            f"p50 {statistics.median(samples) * 1e3:7.2f} ms  "
+            f"p99 {percentile(samples, 0.99) * 1e3:7.2f} ms"
+        )
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    payload = b"\x89PNG\r\n\x1a\n" + b"\x00" * int(args.size_mb * 1024 * 1024)
+    for io_workers in (0, args.workers):
+        asyncio.run(run(io_workers, args.uploads, payload, args.seconds))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,77 @@
+"""Бенчмарк импорта: по одной идее через POST /ideas против POST /ideas/batch.
+
+Запросы идут через TestClient, поэтому в замер входят маршрутизация,
+валидация, лимитер и сериализация ответа, но не сеть.
+
+    python scripts/bench_batch_create.py --ideas 10000 --batch 500
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import main  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+
+def payload(index: int) -> dict:
+    return {
+        "title": f"Imported idea {index}",
+        "description": "Row from the legacy spreadsheet importer.",
+        "tags": ["import", f"team-{index % 20}"],
+    }
+
+
+def run(client: TestClient, ideas: int, batch: int) -> float:
+    started = time.perf_counter()
+    if batch == 1:
+        for index in range(ideas):
+            assert client.post("/ideas", json=payload(index)).status_code == 201
+    else:
+        for offset in range(0, ideas, batch):
+            items = [
+                payload(index) for index in range(offset, min(ideas, offset + batch))
+            ]
+            body = client.post("/ideas/batch", json={"items": items}).json()
+            assert body["created"] == len(items)
+    return time.perf_counter() - started
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=10_000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    os.environ["IDEA_RATE_LIMIT_PER_MINUTE"] = str(10**9)
+
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as raw:
+        backends = [
+            ("memory", IdeaStorage),
+            ("sqlite", lambda: SQLiteIdeaStorage(Path(raw) / "ideas.db")),
+        ]
+        for name, factory in backends:
+            timings = {}
+            for batch in (1, args.batch):
+                main.storage = factory()
+                main.storage.clear()
+                main.rate_limiter.reset()
+                timings[batch] = run(client, args.ideas, batch)
+            single, batched = timings[1], timings[args.batch]
+            print(
+                f"{name:<7} single: {args.ideas / single:8.0f} ideas/s   "
+                f"batch of {args.batch}: {args.ideas / batched:8.0f} ideas/s   "
+                f"x{single / batched:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    cli()
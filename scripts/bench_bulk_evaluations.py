@@ -0,0 +1,91 @@
+"""Бенчмарк оценок: POST /ideas/{id}/evaluations по одной против пакетного эндпойнта.
+
+Голосование — N оценок, случайно разбросанных по M идеям. Запросы идут через
+TestClient, так что в замер входят валидация, хранилище и сериализация ответа.
+
+    python scripts/bench_bulk_evaluations.py --evaluations 20000 --ideas 200
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import main  # noqa: E402
+from app.models import IdeaCreate  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+
+def votes(evaluations: int, ideas: int, seed: int = 5) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "idea_id": rng.randint(1, ideas),
+            "value": rng.randint(1, 10),
+            "effort": rng.randint(1, 10),
+            "confidence": rng.randint(1, 10),
+        }
+        for _ in range(evaluations)
+    ]
+
+
+def run(client: TestClient, items: list, batch: int) -> float:
+    started = time.perf_counter()
+    if batch == 1:
+        for item in items:
+            body = {key: value for key, value in item.items() if key != "idea_id"}
+            response = client.post(f"/ideas/{item['idea_id']}/evaluations", json=body)
+            assert response.status_code == 200
+    else:
+        for offset in range(0, len(items), batch):
+            chunk = items[offset : offset + batch]
+            response = client.post("/ideas/evaluations/batch", json={"items": chunk})
+            assert response.json()["applied"] == len(chunk)
+    return time.perf_counter() - started
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluations", type=int, default=20_000)
+    parser.add_argument("--ideas", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    items = votes(args.evaluations, args.ideas)
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as raw:
+        backends = [
+            ("memory", IdeaStorage),
+            ("sqlite", lambda: SQLiteIdeaStorage(Path(raw) / "ideas.db")),
+        ]
+        for name, factory in backends:
+            timings = {}
+            for batch in (1, args.batch):
+                main.storage = factory()
+                main.storage.clear()
+                main.storage.create_many(
+                    [
+                        IdeaCreate(
+                            title=f"Idea {index}", description="Voting session idea."
+                        )
+                        for index in range(args.ideas)
+                    ]
+                )
+                timings[batch] = run(client, items, batch)
+            single, batched = timings[1], timings[args.batch]
+            print(
+                f"{name:<7} per request: {args.evaluations / single:8.0f} evals/s   "
+                f"batch of {args.batch}: {args.evaluations / batched:8.0f} evals/s   "
+                f"x{single / batched:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    cli()
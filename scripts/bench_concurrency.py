@@ -0,0 +1,136 @@
+"""Бенчмарк конкурентного доступа к IdeaStorage: RW-блокировка против одного мьютекса.
+
+N потоков (как пул FastAPI) в течение --seconds выполняют смешанную
+нагрузку: --writes процентов операций — создание идеи, оценка или PATCH,
+остальное — страница списка с фильтром, ranked и поиск. Эталон — тот же
+код, но с одним threading.Lock и на чтение, и на запись.
+
+    python scripts/bench_concurrency.py --ideas 20000 --threads 1 4 16 40
+"""
+
+import argparse
+import contextlib
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models import EvaluationCreate, IdeaCreate, IdeaSort, IdeaUpdate  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+TAGS = ["ai", "ops", "ux", "infra", "mobile"]
+STATUSES = ["draft", "in_review", "approved", "archived"]
+
+
+class ExclusiveLock:
+    """Эталон: один мьютекс и для чтения, и для записи."""
+
+    def __init__(self) -> None:
+        mutex = threading.Lock()
+        self.read = mutex
+        self.write = mutex
+
+
+class NoLock:
+    """Без синхронизации — только чтобы увидеть цену блокировки в один поток."""
+
+    def __init__(self) -> None:
+        self.read = self.write = contextlib.nullcontext()
+
+
+LOCKS = {"rw lock": None, "mutex": ExclusiveLock, "no lock": NoLock}
+
+
+def build(ideas: int, lock: str) -> IdeaStorage:
+    storage = IdeaStorage()
+    if LOCKS[lock] is not None:
+        storage._lock = LOCKS[lock]()
+    storage.create_many(
+        [
+            IdeaCreate(
+                title=f"Idea {index}",
+                description="Catalogue entry for the concurrency benchmark.",
+                tags=[TAGS[index % len(TAGS)]],
+            )
+            for index in range(ideas)
+        ]
+    )
+    return storage
+
+
+def worker(storage, seed: int, writes: float, deadline: float, counts: list) -> None:
+    rng = random.Random(seed)
+    evaluation = EvaluationCreate(value=7, effort=3, confidence=6)
+    reads = done = 0
+    while time.perf_counter() < deadline:
+        action = rng.random()
+        if action < writes:
+            kind = rng.randrange(3)
+            if kind == 0:
+                storage.create(
+                    IdeaCreate(
+                        title="Concurrent idea",
+                        description="Created during the concurrency benchmark.",
+                        tags=[rng.choice(TAGS)],
+                    )
+                )
+            elif kind == 1:
+                storage.add_evaluation(rng.randint(1, 1000), evaluation)
+            else:
+                storage.update(
+                    rng.randint(1, 1000),
+                    IdeaUpdate(status=rng.choice(STATUSES)),
+                )
+        else:
+            kind = rng.randrange(3)
+            if kind == 0:
+                storage.list_json(tag=rng.choice(TAGS), limit=50)
+            elif kind == 1:
+                storage.ranked_json(IdeaSort.votes, limit=20)
+            else:
+                storage.search_json(str(rng.randrange(1000)), limit=20)
+            reads += 1
+        done += 1
+    counts.append((done, reads))
+
+
+def run(storage, threads: int, writes: float, seconds: float) -> tuple:
+    counts: list = []
+    deadline = time.perf_counter() + seconds
+    pool = [
+        threading.Thread(target=worker, args=(storage, seed, writes, deadline, counts))
+        for seed in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    done = sum(total for total, _ in counts)
+    reads = sum(read for _, read in counts)
+    return done / seconds, reads / seconds
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=20_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 40])
+    parser.add_argument("--writes", type=float, default=10.0, help="percent")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    for label in LOCKS:
+        # Без блокировки параллельный прогон небезопасен, поэтому только один поток.
+        for threads in [1] if label == "no lock" else args.threads:
+            storage = build(args.ideas, label)
+            total, reads = run(storage, threads, args.writes / 100, args.seconds)
+            print(
+                f"{label:<8} {threads:>3} threads: {total:8.0f} ops/s "
+                f"({reads:8.0f} reads/s)"
+            )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,96 @@
+"""Бенчмарк восстановления JournaledIdeaStorage.
+
+Генерирует журнал из N записей (10% create, остальное — оценки) и меряет:
+полное проигрывание журнала, запись снапшота и старт со снапшота + хвоста.
+
+    python scripts/bench_journal_recovery.py --entries 1000000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.journal import JournaledIdeaStorage, _dump, _segment_path  # noqa: E402
+from app.models import EvaluationCreate  # noqa: E402
+
+
+def write_journal(directory: Path, entries: int, seed: int = 7) -> int:
+    rng = random.Random(seed)
+    ideas = 0
+    with _segment_path(directory, 1).open("wb") as handle:
+        for index in range(entries):
+            if index % 10 == 0:
+                ideas += 1
+                entry = {
+                    "op": "create",
+                    "id": ideas,
+                    "title": f"Idea {ideas}",
+                    "description": "Generated for the recovery benchmark.",
+                    "tags": ["bench", f"t{ideas % 50}"],
+                }
+            else:
+                entry = {
+                    "op": "evaluate",
+                    "id": rng.randint(1, ideas),
+                    "value": rng.randint(1, 10),
+                    "effort": rng.randint(1, 10),
+                    "confidence": rng.randint(1, 10),
+                    "comment": None,
+                }
+            handle.write(_dump(entry))
+    return ideas
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<40} {time.perf_counter() - started:8.2f} s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as raw:
+        directory = Path(raw)
+        ideas = timed(
+            "generate journal", lambda: write_journal(directory, args.entries)
+        )
+        size = sum(path.stat().st_size for path in directory.iterdir())
+        print(f"{args.entries} entries, {ideas} ideas, {size / 1e6:.1f} MB on disk")
+
+        store = timed(
+            "recover: full journal replay",
+            lambda: JournaledIdeaStorage(directory, fsync=False, snapshot_every=0),
+        )
+        timed("compact: write snapshot", store.compact)
+        rng = random.Random(11)
+        payload = EvaluationCreate(value=5, effort=5, confidence=5)
+        for _ in range(args.tail):
+            store.add_evaluation(rng.randint(1, ideas), payload)
+        store.close()
+
+        restored = timed(
+            f"recover: snapshot + {args.tail} tail entries",
+            lambda: JournaledIdeaStorage(directory, fsync=False, snapshot_every=0),
+        )
+        restored.compact()
+        restored.close()
+        timed(
+            "recover: snapshot only",
+            lambda: JournaledIdeaStorage(
+                directory, fsync=False, snapshot_every=0
+            ).close(),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Бенчмарк чтения: кэш JSON-фрагментов против сборки ответа через response_model.
+
+Эталон — отдельное приложение с прежним обработчиком: storage.list собирает
+IdeaResponse, FastAPI валидирует их по response_model и сериализует заново.
+Оба варианта читают одно хранилище через TestClient; листаются все страницы
+каталога, затем читаются отдельные карточки.
+
+    python scripts/bench_list_cache.py --ideas 10000 --limit 500
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import main  # noqa: E402
+from app.models import EvaluationCreate, IdeaCreate, IdeaResponse  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+reference = FastAPI()
+
+
+@reference.get("/ideas", response_model=List[IdeaResponse])
+def reference_list(limit: int, after: Optional[int] = None):
+    return main.storage.list(after_id=after, limit=limit)
+
+
+@reference.get("/ideas/{idea_id}", response_model=IdeaResponse)
+def reference_get(idea_id: int):
+    return main.storage.get(idea_id)
+
+
+def fill(storage, ideas: int, seed: int = 3) -> None:
+    rng = random.Random(seed)
+    storage.clear()
+    storage.create_many(
+        [
+            IdeaCreate(
+                title=f"Idea {index}",
+                description="Catalogue entry for the listing benchmark.",
+                tags=[f"team-{index % 20}", "bench"],
+            )
+            for index in range(ideas)
+        ]
+    )
+    storage.add_evaluations(
+        {
+            idea_id: [
+                EvaluationCreate(
+                    value=rng.randint(1, 10),
+                    effort=rng.randint(1, 10),
+                    confidence=rng.randint(1, 10),
+                )
+            ]
+            for idea_id in range(1, ideas + 1, 2)
+        }
+    )
+
+
+def list_all(client: TestClient, limit: int, cached: bool) -> float:
+    started = time.perf_counter()
+    after, url = 0, f"/ideas?limit={limit}"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        if cached:
+            cursor = response.headers.get("x-next-cursor")
+            url = f"/ideas?limit={limit}&cursor={cursor}" if cursor else ""
+        else:
+            page = response.json()
+            after = page[-1]["id"] if len(page) == limit else 0
+            url = f"/ideas?limit={limit}&after={after}" if after else ""
+    return time.perf_counter() - started
+
+
+def get_many(client: TestClient, ids: list) -> float:
+    started = time.perf_counter()
+    for idea_id in ids:
+        assert client.get(f"/ideas/{idea_id}").status_code == 200
+    return time.perf_counter() - started
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--gets", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    ids = random.Random(1).choices(range(1, args.ideas + 1), k=args.gets)
+    clients = {
+        "response_model": (TestClient(reference), False),
+        "cached json": (TestClient(main.app), True),
+    }
+    with tempfile.TemporaryDirectory() as raw:
+        backends = [
+            ("memory", IdeaStorage),
+            ("sqlite", lambda: SQLiteIdeaStorage(Path(raw) / "ideas.db")),
+        ]
+        for name, factory in backends:
+            main.storage = factory()
+            fill(main.storage, args.ideas)
+            for label, (client, cached) in clients.items():
+                # Первый проход прогревает кэш, дальше берём лучший из rounds.
+                cold = list_all(client, args.limit, cached)
+                warm = min(
+                    list_all(client, args.limit, cached) for _ in range(args.rounds)
+                )
+                gets = get_many(client, ids)
+                print(
+                    f"{name:<7} {label:<15} full list: cold {cold * 1000:7.1f} ms, "
+                    f"warm {warm * 1000:7.1f} ms   "
+                    f"GET /ideas/{{id}}: {args.gets / gets:7.0f} req/s"
+                )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,117 @@
+"""Бенчмарк памяти: обычные записи IdeaStorage против компактного режима.
+
+Каталог — 100 тысяч идей по 50 оценок (1% с комментарием), два тега из
+тридцати на идею. tracemalloc считает всё, что хранилище держит после
+загрузки: записи, индексы, кэши и массивы NumPy.
+
+    python scripts/bench_memory.py --ideas 100000 --votes 50
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models import AnalyticsGroupBy, EvaluationCreate, IdeaCreate  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+TAGS = [f"team-{index}" for index in range(30)]
+IDEAS_PER_BATCH = 1000
+# Где выделяется память: записи и оценки (models, storage, колонки analytics)
+# и полнотекстовый индекс, который от режима не зависит.
+RECORD_MODULES = ("models.py", "storage.py", "analytics.py")
+MODULES = RECORD_MODULES + ("search.py",)
+
+
+def fill(storage: IdeaStorage, ideas: int, votes: int, seed: int = 17) -> None:
+    rng = random.Random(seed)
+    for offset in range(0, ideas, IDEAS_PER_BATCH):
+        storage.create_many(
+            [
+                IdeaCreate(
+                    title=f"Idea {index}",
+                    description="Catalogue entry for the memory benchmark.",
+                    # Теги приходят из JSON, то есть новыми строками на каждую идею.
+                    tags=["".join(tag) for tag in rng.sample(TAGS, 2)],
+                )
+                for index in range(offset, min(offset + IDEAS_PER_BATCH, ideas))
+            ]
+        )
+    pool = [
+        EvaluationCreate(
+            value=rng.randint(1, 10),
+            effort=rng.randint(1, 10),
+            confidence=rng.randint(1, 10),
+            comment="Looks useful" if index % 100 == 0 else None,
+        )
+        for index in range(1000)
+    ]
+    for offset in range(1, ideas + 1, IDEAS_PER_BATCH):
+        storage.add_evaluations(
+            {
+                idea_id: pool[idea_id % 500 : idea_id % 500 + votes]
+                for idea_id in range(offset, min(offset + IDEAS_PER_BATCH, ideas + 1))
+            }
+        )
+
+
+def measure(compact: bool, ideas: int, votes: int) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    storage = IdeaStorage(compact=compact)
+    fill(storage, ideas, votes)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    by_module = {
+        Path(stat.traceback[0].filename).name: stat.size
+        for stat in tracemalloc.take_snapshot().statistics("filename")
+    }
+    tracemalloc.stop()
+    # Без трассировки: скорость чтения из упакованных оценок.
+    started = time.perf_counter()
+    storage.evaluation_analytics(AnalyticsGroupBy.tag)
+    analytics = time.perf_counter() - started
+    started = time.perf_counter()
+    for idea_id in range(1, 1001):
+        storage.evaluations(idea_id)
+    history = time.perf_counter() - started
+    storage.clear()
+    return current, by_module, elapsed, analytics, history
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=100_000)
+    parser.add_argument("--votes", type=int, default=50)
+    args = parser.parse_args()
+
+    results = {}
+    for compact in (False, True):
+        label = "compact" if compact else "regular"
+        current, by_module, elapsed, analytics, history = measure(
+            compact, args.ideas, args.votes
+        )
+        results[label] = (current, by_module)
+        print(
+            f"{label:<8} {current / 2**20:8.1f} MiB traced   "
+            f"load {elapsed:5.1f} s   analytics {analytics * 1000:6.1f} ms   "
+            f"1000 histories {history * 1000:6.1f} ms"
+        )
+        for module in MODULES:
+            print(f"  {module:<14} {by_module.get(module, 0) / 2**20:8.1f} MiB")
+    regular, compact = results["regular"], results["compact"]
+    print(f"total reduction: x{regular[0] / compact[0]:.1f}")
+    records = sum(regular[1].get(module, 0) for module in RECORD_MODULES)
+    packed = sum(compact[1].get(module, 0) for module in RECORD_MODULES)
+    print(f"records and evaluations: x{records / packed:.1f}")
+
+
+if __name__ == "__main__":
+    cli()
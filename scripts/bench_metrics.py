@@ -0,0 +1,82 @@
+"""Бенчмарк накладных расходов MetricsMiddleware на один запрос.
+
+Запросы подаются прямо в ASGI-приложение, без сети и без HTTP-клиента:
+роутер FastAPI с маршрутом --path вызывается --requests раз сам по себе и
+обёрнутый в MetricsMiddleware. Разница времени на запрос — цена
+инструментирования (два perf_counter, поиск гистограммы, bisect по корзинам).
+Замеры чередуются --rounds раз, берётся лучший из каждого варианта.
+
+    python scripts/bench_metrics.py --requests 50000 --path /health
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import main  # noqa: E402
+from app.metrics import Metrics, MetricsMiddleware  # noqa: E402
+
+
+def make_scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+        "app": main.app,
+    }
+
+
+async def receive() -> dict:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message) -> None:
+    if message["type"] == "http.response.start":
+        assert message["status"] == 200, message
+
+
+async def run(app, path: str, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(make_scope(path), receive, send)
+    return time.perf_counter() - started
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--path", default="/health")
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    variants = {
+        "plain": main.app.router,
+        "metrics": MetricsMiddleware(main.app.router, metrics),
+    }
+    best = {label: float("inf") for label in variants}
+    for _ in range(args.rounds):
+        for label, app in variants.items():
+            elapsed = asyncio.run(run(app, args.path, args.requests))
+            best[label] = min(best[label], elapsed / args.requests)
+    for label, seconds in best.items():
+        print(f"{label:<8} {seconds * 1e6:7.2f} us/request")
+    print(f"overhead {(best['metrics'] - best['plain']) * 1e6:7.2f} us/request")
+    print(f"series   {len(metrics.requests)}")
+
+
+if __name__ == "__main__":
+    cli()
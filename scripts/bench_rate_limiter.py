@@ -0,0 +1,120 @@
+"""Бенчмарк RateLimiter: миллион разных клиентов и один «горячий» клиент.
+
+Сравнивает текущий sliding window counter (в памяти процесса и в общей
+mmap-таблице) с прежней реализацией на списках временных меток. Время
+подставляется искусственными часами, чтобы прогнать несколько минут трафика
+за секунды.
+
+    python scripts/bench_rate_limiter.py --clients 1000000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.security import RateLimiter, SharedMemoryRateLimitBackend  # noqa: E402
+
+
+class LegacyRateLimiter:
+    """Прежний алгоритм: список меток на ключ, ключи не удаляются."""
+
+    def __init__(self, clock, window_seconds: int = 60) -> None:
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._hits = {}
+
+    def allow(self, key: str, limit: int) -> bool:
+        now = self._clock()
+        bucket = self._hits.setdefault(key, [])
+        threshold = now - self.window_seconds
+        bucket = [stamp for stamp in bucket if stamp > threshold]
+        if len(bucket) >= limit:
+            self._hits[key] = bucket
+            return False
+        bucket.append(now)
+        self._hits[key] = bucket
+        return True
+
+    def tracked_keys(self) -> int:
+        return len(self._hits)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def distinct_clients(factory, clients: int, minutes: int) -> None:
+    step = 60.0 * minutes / clients
+
+    def run():
+        clock = Clock()
+        limiter = factory(clock)
+        for index in range(clients):
+            limiter.allow(f"client-{index}", limit=100)
+            clock.now += step
+        return limiter
+
+    started = time.perf_counter()
+    limiter = run()
+    elapsed = time.perf_counter() - started
+    keys = limiter.tracked_keys()
+    del limiter
+
+    # Отдельный прогон под tracemalloc: он сильно замедляет аллокации.
+    tracemalloc.start()
+    limiter = run()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del limiter
+    print(
+        f"  {clients} clients over {minutes} min: {elapsed / clients * 1e6:.2f} us/call, "
+        f"tracked keys {keys}, retained {retained / 1e6:.1f} MB"
+    )
+
+
+def hot_client(factory, calls: int) -> None:
+    clock = Clock()
+    limiter = factory(clock)
+    started = time.perf_counter()
+    for _ in range(calls):
+        limiter.allow("hot", limit=100)
+        clock.now += 0.01
+    elapsed = time.perf_counter() - started
+    print(f"  hot client at limit 100: {elapsed / calls * 1e6:.2f} us/call")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1_000_000)
+    parser.add_argument("--minutes", type=int, default=10)
+    args = parser.parse_args()
+
+    shared_dir = tempfile.TemporaryDirectory()
+    shared_files = iter(range(1_000))
+
+    def shared(clock):
+        path = Path(shared_dir.name) / f"table-{next(shared_files)}.bin"
+        return RateLimiter(clock=clock, backend=SharedMemoryRateLimitBackend(path))
+
+    for name, factory in [
+        ("legacy timestamps", lambda clock: LegacyRateLimiter(clock)),
+        ("sliding window counter", lambda clock: RateLimiter(clock=clock)),
+        ("shared mmap table", shared),
+    ]:
+        print(name)
+        distinct_clients(factory, args.clients, args.minutes)
+        hot_client(factory, 200_000)
+    shared_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
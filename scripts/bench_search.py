@@ -0,0 +1,103 @@
+"""Бенчмарк полнотекстового поиска: задержка запроса `q` на большом каталоге.
+
+Тексты собираются из словаря с распределением Ципфа, поэтому в наборе есть и
+редкие слова, и слова, встречающиеся в каждой второй идее. Замеряется
+search_json (поиск + сборка страницы из кэша), без HTTP.
+
+    python scripts/bench_search.py --ideas 100000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models import IdeaCreate  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+SYLLABLES = ["ка", "ро", "ми", "на", "ле", "то", "ви", "за", "ба", "ду", "пе", "со"]
+
+
+def vocabulary(size: int, rng: random.Random) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def payloads(ideas: int, words: list, rng: random.Random) -> list:
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return [
+        IdeaCreate(
+            title=" ".join(rng.choices(words, weights, k=4)).capitalize(),
+            description=" ".join(rng.choices(words, weights, k=rng.randint(15, 40))),
+            tags=[f"team-{index % 20}"],
+        )
+        for index in range(ideas)
+    ]
+
+
+def measure(storage, queries: list, rounds: int, **filters) -> tuple:
+    timings = []
+    for _ in range(rounds):
+        for query in queries:
+            started = time.perf_counter()
+            storage.search_json(query, limit=20, **filters)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return (
+        statistics.median(timings) * 1000,
+        timings[int(len(timings) * 0.99) - 1] * 1000,
+    )
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    words = vocabulary(args.words, rng)
+    items = payloads(args.ideas, words, rng)
+    # Частые слова из головы распределения, средние и редкие из хвоста.
+    # Первые слова словаря есть почти в каждой идее — это аналог стоп-слов.
+    buckets = {
+        "common": [words[0], words[1], words[2]],
+        "medium": words[50:53],
+        "rare": words[-3:],
+        "3 words": [" ".join(words[index : index + 3]) for index in (10, 40, 400)],
+        "3 stopwords": [" ".join(words[0:3])],
+    }
+
+    with tempfile.TemporaryDirectory() as raw:
+        backends = [
+            ("memory", IdeaStorage),
+            ("sqlite", lambda: SQLiteIdeaStorage(Path(raw) / "ideas.db")),
+        ]
+        for name, factory in backends:
+            storage = factory()
+            started = time.perf_counter()
+            for offset in range(0, len(items), 1000):
+                storage.create_many(items[offset : offset + 1000])
+            print(
+                f"{name}: indexed {args.ideas} ideas in {time.perf_counter() - started:.1f} s"
+            )
+            for label, queries in buckets.items():
+                for filters in ({}, {"tag": "team-3"}):
+                    p50, p99 = measure(storage, queries, args.rounds, **filters)
+                    suffix = " +tag" if filters else ""
+                    print(
+                        f"  {label + suffix:<17} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms"
+                    )
+
+
+if __name__ == "__main__":
+    cli()
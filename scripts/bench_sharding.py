@@ -0,0 +1,124 @@
+"""Бенчмарк шардирования: пропускная способность от числа шардов и воркеров.
+
+Для каждого N из --shards запускаются N процессов-шардов и N процессов-
+клиентов (как воркеры uvicorn с IDEA_STORAGE_BACKEND=sharded). Клиенты
+--seconds секунд гоняют смешанную нагрузку: карточка идеи, страница списка
+с фильтром (scatter/gather по всем шардам) и --writes процентов оценок.
+Эталон — один процесс с IdeaStorage без RPC, то есть нынешний --workers 1.
+Рост с N ограничен числом ядер машины (os.cpu_count()).
+
+    python scripts/bench_sharding.py --ideas 20000 --shards 1 2 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models import EvaluationCreate, IdeaCreate  # noqa: E402
+from app.sharding import ShardedIdeaStorage, run_shard, wait_for_shards  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+AUTHKEY = b"bench-shards"
+TAGS = [f"team-{index}" for index in range(20)]
+
+
+def fill(storage, ideas: int) -> None:
+    for offset in range(0, ideas, 1000):
+        storage.create_many(
+            [
+                IdeaCreate(
+                    title=f"Idea {index}",
+                    description="Catalogue entry for the sharding benchmark.",
+                    tags=[TAGS[index % len(TAGS)]],
+                )
+                for index in range(offset, min(offset + 1000, ideas))
+            ]
+        )
+
+
+def workload(storage, ideas: int, writes: float, seconds: float, seed: int) -> int:
+    rng = random.Random(seed)
+    evaluation = EvaluationCreate(value=7, effort=3, confidence=6)
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        action = rng.random()
+        if action < writes:
+            storage.add_evaluation(rng.randint(1, ideas), evaluation)
+        elif action < 0.5:
+            storage.list_json(tag=rng.choice(TAGS), limit=20)
+        else:
+            storage.get_json(rng.randint(1, ideas))
+        done += 1
+    return done
+
+
+def client(directory, shards, args, seed, results) -> None:
+    storage = ShardedIdeaStorage.from_directory(directory, shards, authkey=AUTHKEY)
+    results.put(workload(storage, args.ideas, args.writes / 100, args.seconds, seed))
+    storage.close()
+
+
+def run_sharded(shards: int, args: argparse.Namespace) -> float:
+    directory = Path(tempfile.mkdtemp(prefix="shards-"))
+    servers = [
+        multiprocessing.Process(
+            target=run_shard, args=(index, shards, directory, AUTHKEY), daemon=True
+        )
+        for index in range(shards)
+    ]
+    for server in servers:
+        server.start()
+    try:
+        wait_for_shards(directory, shards, authkey=AUTHKEY)
+        loader = ShardedIdeaStorage.from_directory(directory, shards, authkey=AUTHKEY)
+        fill(loader, args.ideas)
+        loader.close()
+        results: multiprocessing.Queue = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(
+                target=client, args=(directory, shards, args, seed, results)
+            )
+            for seed in range(shards)
+        ]
+        for process in clients:
+            process.start()
+        done = sum(results.get() for _ in clients)
+        for process in clients:
+            process.join()
+        return done / args.seconds
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=20_000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--writes", type=float, default=10.0, help="percent")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"cpu cores: {os.cpu_count()}")
+    storage = IdeaStorage()
+    fill(storage, args.ideas)
+    single = workload(storage, args.ideas, args.writes / 100, args.seconds, 0)
+    print(f"single process, no RPC:      {single / args.seconds:8.0f} ops/s")
+    for shards in args.shards:
+        throughput = run_sharded(shards, args)
+        print(f"{shards} shards x {shards} workers:     {throughput:8.0f} ops/s")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,100 @@
+"""Бенчмарк `sort`/`top`: первые K идей по метрике против полной сортировки каталога.
+
+Эталон — сортировка всех id по тому же ключу и срез (O(N log N) на запрос).
+Замеряется ranked_json без HTTP: без фильтров и с тегом, который есть у
+каждой двадцатой идеи.
+
+    python scripts/bench_top_k.py --ideas 100000 --top 20
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.models import EvaluationCreate, IdeaCreate, IdeaSort  # noqa: E402
+from app.sqlite_storage import SQLiteIdeaStorage  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
+
+
+def fill(storage, ideas: int, seed: int = 11) -> None:
+    rng = random.Random(seed)
+    for offset in range(0, ideas, 1000):
+        storage.create_many(
+            [
+                IdeaCreate(
+                    title=f"Idea {index}",
+                    description="Catalogue entry for the ranking benchmark.",
+                    tags=[f"team-{index % 20}"],
+                )
+                for index in range(offset, min(offset + 1000, ideas))
+            ]
+        )
+    # Каждая десятая идея остаётся без оценок.
+    storage.add_evaluations(
+        {
+            idea_id: [
+                EvaluationCreate(
+                    value=rng.randint(1, 10),
+                    effort=rng.randint(1, 10),
+                    confidence=rng.randint(1, 10),
+                )
+                for _ in range(rng.randint(1, 5))
+            ]
+            for idea_id in range(1, ideas + 1)
+            if idea_id % 10
+        }
+    )
+
+
+def best_of(rounds: int, call) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def full_sort(storage: IdeaStorage, sort: IdeaSort, top: int) -> list:
+    return sorted(storage._ideas, key=partial(storage._rank_key, sort))[:top]
+
+
+def cli() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ideas", type=int, default=100_000)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as raw:
+        backends = [
+            ("memory", IdeaStorage),
+            ("sqlite", lambda: SQLiteIdeaStorage(Path(raw) / "ideas.db")),
+        ]
+        for name, factory in backends:
+            storage = factory()
+            fill(storage, args.ideas)
+            for sort in IdeaSort:
+                for filters in ({}, {"tag": "team-3"}):
+                    ranked = best_of(
+                        args.rounds,
+                        lambda: storage.ranked_json(sort, limit=args.top, **filters),
+                    )
+                    line = f"{name:<7} {sort.value:<7} {'+tag' if filters else '':<5}"
+                    line += f" top-{args.top}: {ranked:8.3f} ms"
+                    if name == "memory" and not filters:
+                        baseline = best_of(
+                            args.rounds, lambda: full_sort(storage, sort, args.top)
+                        )
+                        line += f"   full sort: {baseline:8.3f} ms"
+                    print(line)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,38 @@
+"""Переносит вложения из плоского каталога в шардированную раскладку `ab/cd/<имя>`.
+
+Можно запускать на работающем сервисе: файлы, ещё не перенесённые в шарды,
+отдаются из корня, а `.ref` переносится под той же блокировкой, что и подсчёт
+ссылок. Повторный запуск безопасен.
+
+    python scripts/migrate_attachments_layout.py --dir var/uploads
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.security import AttachmentStorage  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dir", default=os.getenv("IDEA_ATTACHMENT_DIR", "var/uploads")
+    )
+    args = parser.parse_args()
+
+    storage = AttachmentStorage(args.dir, io_workers=0, sharded=True)
+    started = time.perf_counter()
+    moved, skipped = storage.shard_flat_files()
+    print(
+        f"{storage.base_dir}: moved {moved}, skipped {skipped} "
+        f"in {time.perf_counter() - started:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
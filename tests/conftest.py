@@ -1,23 +1,65 @@
 # tests/conftest.py
+import shutil
 import sys
+import tempfile
+import threading
 from pathlib import Path
 
 import pytest
 
 try:
-    from app.main import attachment_storage, rate_limiter, storage
+    from app.main import attachment_storage, metrics, rate_limiter, storage
 except ModuleNotFoundError:  # pragma: no cover - fallback for CI env
     ROOT = Path(__file__).resolve().parents[1]  # корень репозитория
     if str(ROOT) not in sys.path:
         sys.path.insert(0, str(ROOT))
-    from app.main import attachment_storage, rate_limiter, storage
+    from app.main import attachment_storage, metrics, rate_limiter, storage
+
+from app.sharding import ShardedIdeaStorage, ShardServer, shard_socket  # noqa: E402
+from app.storage import IdeaStorage  # noqa: E402
 
 
 @pytest.fixture(autouse=True)
 def reset_state(tmp_path):
     storage.clear()
     rate_limiter.reset()
+    metrics.reset()
     attachment_storage.configure(tmp_path / "uploads")
     yield
     storage.clear()
     rate_limiter.reset()
+
+
+@pytest.fixture
+def shard_authkey():
+    return b"test-shards"
+
+
+@pytest.fixture
+def shard_servers(shard_authkey):
+    """Три шарда в потоках этого процесса; протокол тот же, что между процессами."""
+    # Короткий каталог: путь Unix-сокета ограничен ~100 байтами.
+    directory = Path(tempfile.mkdtemp(prefix="shards-"))
+    servers = [
+        ShardServer(
+            IdeaStorage(id_start=index + 1, id_step=3),
+            shard_socket(directory, index),
+            authkey=shard_authkey,
+        )
+        for index in range(3)
+    ]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield servers
+    for server in servers:
+        server.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def sharded_storage(shard_servers, shard_authkey):
+    backend = ShardedIdeaStorage(
+        [server.address for server in shard_servers], authkey=shard_authkey
+    )
+    yield backend
+    backend.close()
@@ -0,0 +1,178 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.analytics import EvaluationColumns, metric_statistics
+from app.models import (
+    AnalyticsGroupBy,
+    Evaluation,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaStatus,
+    IdeaUpdate,
+)
+from app.sqlite_storage import SQLiteIdeaStorage
+from app.storage import IdeaStorage
+
+
+def test_statistics_from_histogram_match_raw_scores():
+    rng = random.Random(4)
+    for size in [1, 2, 7, 100, 1001]:
+        scores = np.array([rng.randint(1, 10) for _ in range(size)])
+        stats = metric_statistics(np.bincount(scores, minlength=11))
+        assert stats.count == size
+        assert stats.mean == round(float(scores.mean()), 2)
+        expected = np.percentile(scores, [50, 90, 99])
+        assert [stats.p50, stats.p90, stats.p99] == [
+            round(float(value), 2) for value in expected
+        ]
+        assert stats.histogram == np.bincount(scores, minlength=11)[1:].tolist()
+
+    empty = metric_statistics(np.zeros(11, dtype=np.int64))
+    assert (empty.count, empty.mean, empty.p50) == (0, None, None)
+
+
+def test_columns_fold_new_rows_incrementally():
+    columns = EvaluationColumns()
+    columns.append(3, [Evaluation(value=7, effort=2, confidence=5)])
+    first = columns.histograms()
+    assert first["value"].shape == (4, 11)
+    assert first["value"][3, 7] == 1
+
+    # Больше начальной ёмкости, чтобы колонки выросли.
+    columns.append(9, [Evaluation(value=7, effort=1, confidence=1)] * 1500)
+    columns.append(3, [Evaluation(value=1, effort=2, confidence=3)])
+    folded = columns.histograms()
+    assert len(columns) == 1502
+    assert folded["value"].shape == (10, 11)
+    assert folded["value"][3].tolist() == [0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0]
+    assert folded["value"][9, 7] == 1500
+    assert folded["effort"][3, 2] == 2
+
+    columns.clear()
+    assert columns.histograms()["value"].shape == (0, 11)
+
+
+def test_histograms_snapshot_is_not_changed_by_later_folds():
+    columns = EvaluationColumns()
+    columns.append(3, [Evaluation(value=7, effort=2, confidence=5)])
+    snapshot = columns.histograms()
+    # Хранилище суммирует снимок уже без блокировки: следующее сворачивание
+    # не должно менять его массивы.
+    columns.append(3, [Evaluation(value=7, effort=2, confidence=5)])
+    assert columns.histograms()["value"][3, 7] == 2
+    assert snapshot["value"][3, 7] == 1
+
+
+def test_compact_analytics_fold_only_new_evaluations():
+    regular = IdeaStorage()
+    compact = IdeaStorage(compact=True)
+    payloads = [
+        IdeaCreate(
+            title=f"Idea {index}",
+            description="Compact analytics check.",
+            tags=["ai"] if index % 2 else ["ops"],
+        )
+        for index in range(6)
+    ]
+    for store in (regular, compact):
+        store.create_many(payloads)
+    rng = random.Random(3)
+    # Каждый запрос досчитывает оценки, добавленные после предыдущего.
+    for _ in range(3):
+        batches = {
+            idea_id: [
+                EvaluationCreate(
+                    value=rng.randint(1, 10),
+                    effort=rng.randint(1, 10),
+                    confidence=rng.randint(1, 10),
+                )
+                for _ in range(rng.randint(1, 3))
+            ]
+            for idea_id in rng.sample(range(1, 7), 3)
+        }
+        for store in (regular, compact):
+            store.add_evaluations(batches)
+            store.add_evaluation(1, EvaluationCreate(value=2, effort=9, confidence=4))
+        for group_by in AnalyticsGroupBy:
+            assert compact.evaluation_analytics(
+                group_by
+            ) == regular.evaluation_analytics(group_by)
+
+    histograms = compact._columns.histograms()
+    assert int(histograms["value"].sum()) == compact.totals()[1]
+
+
+def test_memory_analytics_match_sqlite(tmp_path):
+    rng = random.Random(8)
+    memory = IdeaStorage()
+    sqlite = SQLiteIdeaStorage(tmp_path / "ideas.db")
+    try:
+        payloads = [
+            IdeaCreate(
+                title=f"Idea {index}",
+                description="Analytics consistency check.",
+                tags=rng.sample(["ai", "ops", "ux"], index % 3),
+            )
+            for index in range(40)
+        ]
+        for store in (memory, sqlite):
+            store.create_many(payloads)
+        batches = {
+            rng.randint(1, 35): [
+                EvaluationCreate(
+                    value=rng.randint(1, 10),
+                    effort=rng.randint(1, 10),
+                    confidence=rng.randint(1, 10),
+                )
+                for _ in range(rng.randint(1, 6))
+            ]
+            for _ in range(30)
+        }
+        for store in (memory, sqlite):
+            store.add_evaluations(batches)
+            store.update(2, IdeaUpdate(status=IdeaStatus.approved.value))
+        for group_by in AnalyticsGroupBy:
+            assert memory.evaluation_analytics(group_by) == sqlite.evaluation_analytics(
+                group_by
+            )
+    finally:
+        sqlite.close()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_shard_histograms_have_a_row_per_local_idea(compact):
+    # Шард 2 из 3 выдаёт id 2, 5, 8, ...: строки гистограмм только под них.
+    shard = IdeaStorage(compact=compact, id_start=2, id_step=3)
+    single = IdeaStorage(compact=compact)
+    payloads = [
+        IdeaCreate(
+            title=f"Idea {index}",
+            description="Shard histogram check.",
+            tags=["ai"] if index % 2 else ["ops"],
+        )
+        for index in range(30)
+    ]
+    shard_ids = shard.create_many(payloads)
+    single_ids = single.create_many(payloads)
+    rng = random.Random(5)
+    for shard_id, single_id in zip(shard_ids, single_ids):
+        payload = [
+            EvaluationCreate(
+                value=rng.randint(1, 10),
+                effort=rng.randint(1, 10),
+                confidence=rng.randint(1, 10),
+            )
+            for _ in range(rng.randint(0, 3))
+        ]
+        shard.add_evaluations({shard_id: payload})
+        single.add_evaluations({single_id: payload})
+
+    histograms = shard._columns.histograms()
+    assert len(histograms["value"]) <= len(shard_ids)
+    assert histograms["value"].dtype == np.uint32
+    for group_by in AnalyticsGroupBy:
+        assert shard.evaluation_analytics(group_by) == single.evaluation_analytics(
+            group_by
+        )
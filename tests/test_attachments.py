@@ -1,12 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import os
+import threading
+import time
 from typing import Any, Dict
 
+import pytest
 from fastapi.testclient import TestClient
 
+from app import main
+from app.attachment_sweeper import AttachmentSweeper
 from app.main import app, attachment_storage, storage
 from app.problem_details import ApiProblem
-from app.security import MAX_ATTACHMENT_BYTES
+from app.security import (
+    MAX_ATTACHMENT_BYTES,
+    REF_SUFFIX,
+    AttachmentStorage,
+    AttachmentValidationError,
+)
+from app.sqlite_storage import SQLiteIdeaStorage
 
 client = TestClient(app)
 
@@ -76,6 +90,7 @@ def test_rejects_large_attachment():
     )
     body = expect_problem(resp, status=413, code="attachment_too_large")
     assert "size limit" in body["detail"]
+    assert list(attachment_storage.base_dir.iterdir()) == []
 
 
 def test_rejects_unknown_signature():
@@ -133,3 +148,383 @@ def test_cleanup_happens_when_storage_add_fails(monkeypatch):
     )
     expect_problem(resp, status=503, code="storage_error")
     assert list(attachment_storage.base_dir.iterdir()) == []
+
+
+def test_streaming_writer_tracks_jpeg_end_marker_across_chunks():
+    data = b"\xff\xd8" + b"\x00" * 10 + b"\xff\xd9"
+
+    with attachment_storage.open_writer() as writer:
+        for index in range(len(data)):
+            writer.write(data[index : index + 1])
+        stored = writer.commit()
+
+    assert stored.content_type == "image/jpeg"
+    assert stored.path.read_bytes() == data
+    assert [path.name for path in attachment_storage.base_dir.iterdir()] == [
+        stored.filename
+    ]
+
+
+def test_streaming_writer_rejects_bad_signature_on_first_chunk():
+    writer = attachment_storage.open_writer()
+    with pytest.raises(AttachmentValidationError) as error:
+        writer.write(b"GIF89a" + b"\x00" * 64)
+    assert error.value.code == "attachment_bad_type"
+    assert list(attachment_storage.base_dir.iterdir()) == []
+
+
+def test_streaming_writer_rejects_truncated_jpeg():
+    with pytest.raises(AttachmentValidationError) as error:
+        attachment_storage.save(b"\xff\xd8" + b"\x00" * 32)
+    assert error.value.code == "attachment_bad_type"
+    assert list(attachment_storage.base_dir.iterdir()) == []
+
+
+def test_streaming_writer_aborts_once_size_cap_is_passed():
+    writer = attachment_storage.open_writer()
+    writer.write(make_png(b"\x00" * (MAX_ATTACHMENT_BYTES - 100)))
+    with pytest.raises(AttachmentValidationError) as error:
+        writer.write(b"\x00" * 200)
+    assert error.value.code == "attachment_too_large"
+    assert list(attachment_storage.base_dir.iterdir()) == []
+
+
+def test_async_writer_runs_file_io_outside_event_loop(tmp_path):
+    store = AttachmentStorage(tmp_path, io_workers=2)
+    threads = set()
+
+    async def upload():
+        async with await store.open_writer_async() as writer:
+            original = writer._writer.write
+
+            def spy(chunk):
+                threads.add(threading.current_thread().name)
+                original(chunk)
+
+            writer._writer.write = spy
+            await writer.write(make_png(b"\x00" * 64))
+            return await writer.commit()
+
+    stored = asyncio.run(upload())
+    assert stored.path.read_bytes() == make_png(b"\x00" * 64)
+    assert threads and all(name.startswith("attachment-io") for name in threads)
+
+
+def test_async_writer_aborts_in_io_pool_even_when_busy(tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs", io_workers=1, io_queue_depth=0)
+    threads = []
+
+    async def failed_upload():
+        async with await store.open_writer_async() as writer:
+            original = writer._writer.abort
+
+            def spy():
+                threads.append(threading.current_thread().name)
+                original()
+
+            writer._writer.abort = spy
+            await writer.write(make_png(b"\x00" * 64))
+            # Пул занят до предела, но уборку это не отменяет.
+            store._io_in_flight = 1
+            raise RuntimeError("client went away")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(failed_upload())
+    assert len(threads) == 1 and threads[0].startswith("attachment-io")
+    assert list(store.base_dir.iterdir()) == []
+
+
+def test_busy_io_pool_rejects_instead_of_queueing(tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs", io_workers=1, io_queue_depth=0)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(store.run_io(release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(AttachmentValidationError) as error:
+            await store.open_writer_async()
+        release.set()
+        await blocked
+        return error.value.code
+
+    assert asyncio.run(scenario()) == "attachment_storage_busy"
+    assert list(store.base_dir.iterdir()) == []
+
+
+def test_upload_returns_503_when_io_pool_is_busy(monkeypatch):
+    create = client.post(
+        "/ideas",
+        json={
+            "title": "Busy idea",
+            "description": "Upload while the disk pool is saturated.",
+            "tags": ["files"],
+        },
+    )
+    idea = create.json()
+    monkeypatch.setattr(attachment_storage, "_io_in_flight", 10_000)
+
+    resp = client.post(
+        f"/ideas/{idea['id']}/attachments",
+        files={"file": ("diagram.png", make_png(), "image/png")},
+    )
+    expect_problem(resp, status=503, code="attachment_storage_busy")
+    assert storage.get(idea["id"]).attachments == []
+
+
+def test_content_addressed_storage_keeps_one_blob_per_content(tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs", content_addressed=True)
+    data = make_png(b"\x01" * 256)
+
+    first = store.save(data)
+    second = store.save(data)
+    other = store.save(make_png(b"\x02" * 256))
+
+    assert first.filename == f"{hashlib.sha256(data).hexdigest()}.png"
+    assert second.filename == first.filename
+    assert (first.deduplicated, second.deduplicated) == (False, True)
+    assert sorted(path.name for path in store.base_dir.iterdir()) == sorted(
+        [
+            first.filename,
+            f"{first.filename}{REF_SUFFIX}",
+            other.filename,
+            f"{other.filename}{REF_SUFFIX}",
+        ]
+    )
+
+    store.delete(first.filename)
+    assert first.path.read_bytes() == data
+    store.delete(first.filename)
+    assert not first.path.exists()
+    assert not (store.base_dir / f"{first.filename}{REF_SUFFIX}").exists()
+    assert other.path.exists()
+
+
+def test_content_addressed_upload_reuses_blob_across_ideas(monkeypatch, tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs", content_addressed=True)
+    monkeypatch.setattr(main, "attachment_storage", store)
+    data = make_png(b"\x00" * 64)
+    ids = []
+    for title in ("Shared screenshot A", "Shared screenshot B"):
+        idea = client.post(
+            "/ideas",
+            json={
+                "title": title,
+                "description": "Same screenshot everywhere.",
+                "tags": [],
+            },
+        ).json()
+        resp = client.post(
+            f"/ideas/{idea['id']}/attachments",
+            files={"file": ("diagram.png", data, "image/png")},
+        )
+        assert resp.status_code == 201
+        ids.append(resp.json()["attachment_id"])
+
+    assert ids[0] == ids[1]
+    assert ids[0].endswith(".png")
+    assert (store.base_dir / f"{ids[0]}{REF_SUFFIX}").read_text() == "2\n"
+
+
+def upload_to_new_idea(data: bytes) -> tuple[int, str]:
+    idea = client.post(
+        "/ideas",
+        json={
+            "title": "Download idea",
+            "description": "Idea with a file to read back.",
+        },
+    ).json()
+    resp = client.post(
+        f"/ideas/{idea['id']}/attachments",
+        files={"file": ("diagram.png", data, "image/png")},
+    )
+    assert resp.status_code == 201
+    return idea["id"], resp.json()["attachment_id"]
+
+
+def test_download_returns_file_with_cache_headers_and_etag():
+    data = make_png(bytes(range(256)) * 4)
+    idea_id, attachment_id = upload_to_new_idea(data)
+    url = f"/ideas/{idea_id}/attachments/{attachment_id}"
+
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.content == data
+    assert resp.headers["content-type"] == "image/png"
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert "immutable" in resp.headers["cache-control"]
+    etag = resp.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+
+    cached = client.get(url, headers={"If-None-Match": f'"other", {etag}'})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    head = client.head(url)
+    assert head.status_code == 200
+    assert head.headers["content-length"] == str(len(data))
+    assert head.content == b""
+
+
+def test_download_serves_byte_ranges():
+    data = make_png(bytes(range(256)) * 4)
+    idea_id, attachment_id = upload_to_new_idea(data)
+    url = f"/ideas/{idea_id}/attachments/{attachment_id}"
+
+    part = client.get(url, headers={"Range": "bytes=8-15"})
+    assert part.status_code == 206
+    assert part.content == data[8:16]
+    assert part.headers["content-range"] == f"bytes 8-15/{len(data)}"
+
+    suffix = client.get(url, headers={"Range": "bytes=-10"})
+    assert suffix.status_code == 206
+    assert suffix.content == data[-10:]
+
+    stale = client.get(url, headers={"Range": "bytes=0-3", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == data
+
+    beyond = client.get(url, headers={"Range": f"bytes={len(data)}-"})
+    expect_problem(beyond, status=416, code="range_not_satisfiable")
+    assert beyond.headers["content-range"] == f"bytes */{len(data)}"
+
+
+def test_download_reads_file_in_the_attachment_io_pool(monkeypatch):
+    data = make_png(bytes(range(256)) * 600)
+    idea_id, attachment_id = upload_to_new_idea(data)
+    calls = []
+    run_io = attachment_storage.run_io
+
+    async def spy(func, *args, **kwargs):
+        calls.append((func, kwargs.get("queue_limit", True)))
+        return await run_io(func, *args, **kwargs)
+
+    monkeypatch.setattr(attachment_storage, "run_io", spy)
+    resp = client.get(f"/ideas/{idea_id}/attachments/{attachment_id}")
+    assert resp.content == data
+    # open — с лимитом очереди (503 до начала ответа), чанки — без него.
+    assert (open, True) in calls
+    chunks = [limited for func, limited in calls if func is os.pread]
+    assert len(chunks) > 1 and not any(chunks)
+
+    monkeypatch.setattr(attachment_storage, "_io_in_flight", 10_000)
+    busy = client.get(f"/ideas/{idea_id}/attachments/{attachment_id}")
+    expect_problem(busy, status=503, code="attachment_storage_busy")
+
+
+def test_download_requires_attachment_of_that_idea():
+    idea_id, attachment_id = upload_to_new_idea(make_png())
+    other = client.post(
+        "/ideas",
+        json={"title": "Other idea", "description": "Has no attachments at all."},
+    ).json()
+
+    resp = client.get(f"/ideas/{other['id']}/attachments/{attachment_id}")
+    expect_problem(resp, status=404, code="attachment_not_found")
+    resp = client.get(f"/ideas/{idea_id}/attachments/..%2F..%2Fetc%2Fpasswd")
+    assert resp.status_code == 404
+
+
+def test_lookup_keeps_path_and_symlink_checks(tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs")
+    outside = tmp_path / "secret.png"
+    outside.write_bytes(make_png())
+    (store.base_dir / "link.png").symlink_to(outside)
+
+    for name in ("../secret.png", "link.png", "notes.txt"):
+        with pytest.raises(AttachmentValidationError) as error:
+            store.lookup(name)
+        assert error.value.code == "attachment_path_violation"
+    with pytest.raises(AttachmentValidationError) as error:
+        store.lookup("missing.png")
+    assert error.value.code == "attachment_not_found"
+
+
+def test_content_addressed_etag_is_content_hash(tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs", content_addressed=True)
+    data = make_png(b"\x05" * 32)
+    stored = store.save(data)
+    assert store.lookup(stored.filename).etag == f'"{hashlib.sha256(data).hexdigest()}"'
+
+
+def test_sharded_layout_and_migration_of_flat_files(tmp_path):
+    flat = AttachmentStorage(tmp_path / "blobs", content_addressed=True)
+    legacy = flat.save(make_png(b"\x07" * 16))
+    flat.save(make_png(b"\x07" * 16))
+
+    store = AttachmentStorage(tmp_path / "blobs", content_addressed=True, sharded=True)
+    fresh = store.save(make_png(b"\x08" * 16))
+    name = fresh.filename
+    assert fresh.path == store.base_dir / name[:2] / name[2:4] / name
+    # Ещё не перенесённый файл находится в корне и считается там же.
+    assert store.lookup(legacy.filename).path == legacy.path
+    assert store.save(make_png(b"\x07" * 16)).path == legacy.path
+
+    assert store.shard_flat_files() == (1, 0)
+    moved = store.lookup(legacy.filename).path
+    assert moved.parent.parent.parent == store.base_dir
+    assert moved.with_name(legacy.filename + REF_SUFFIX).read_text() == "3\n"
+    assert sorted(path.name for path in store.base_dir.iterdir()) == sorted(
+        {name[:2], legacy.filename[:2]}
+    )
+
+    for _ in range(3):
+        store.delete(legacy.filename)
+    assert not moved.exists()
+
+
+def test_sweeper_removes_orphans_incrementally(tmp_path):
+    store = AttachmentStorage(tmp_path / "blobs", sharded=True)
+    kept = store.save(make_png(b"\x01"))
+    orphan = store.save(make_png(b"\x02"))
+    recent = store.save(make_png(b"\x03"))
+    stale_part = store.base_dir / ".upload-dead.part"
+    stale_part.write_bytes(b"\x89PNG")
+    stale_ref = store.base_dir / f"gone.png{REF_SUFFIX}"
+    stale_ref.write_text("1\n")
+    old = time.time() - 7200
+    for path in (kept.path, orphan.path, stale_part, stale_ref):
+        os.utime(path, (old, old))
+
+    lookups = []
+
+    def find_referenced(names):
+        lookups.append(len(names))
+        return {kept.filename} & set(names)
+
+    sweeper = AttachmentSweeper(
+        store, find_referenced, grace_seconds=3600, batch_size=2
+    )
+    while sweeper.passes < 2:
+        sweeper.tick()
+
+    assert kept.path.exists()
+    assert recent.path.exists()
+    assert not orphan.path.exists()
+    assert not stale_part.exists()
+    assert not stale_ref.exists()
+    assert sweeper.removed == 3
+    assert max(lookups) <= 2
+
+
+def test_sweeper_starts_only_with_shared_storage(tmp_path, monkeypatch, caplog):
+    sweeper = AttachmentSweeper(attachment_storage, lambda names: set(names))
+    monkeypatch.setattr(main, "attachment_sweeper", sweeper)
+
+    # Память процесса: чужие и пережившие рестарт вложения были бы удалены.
+    assert not main.start_attachment_sweeper(60)
+    assert "per-process" in caplog.text
+
+    backend = SQLiteIdeaStorage(tmp_path / "ideas.db")
+    monkeypatch.setattr(main, "storage", backend)
+    assert not main.start_attachment_sweeper(0)
+    assert main.start_attachment_sweeper(60)
+    sweeper.stop()
+    backend.close()
+
+
+def test_storage_reports_referenced_attachments():
+    idea_id, attachment_id = upload_to_new_idea(make_png(b"\x09"))
+    assert storage.referenced_attachments([attachment_id, "missing.png"]) == {
+        attachment_id
+    }
@@ -55,6 +55,11 @@ def test_evaluate_missing_idea_exposes_problem_details():
     assert_problem(resp, status=404, code="idea_not_found")
 
 
+def test_invalid_cursor_uses_problem_details():
+    response = client.get("/ideas", params={"cursor": "not-a-cursor"})
+    assert_problem(response, status=422, code="invalid_cursor")
+
+
 def test_rate_limit_blocks_excessive_requests(monkeypatch):
     monkeypatch.setenv("IDEA_RATE_LIMIT_PER_MINUTE", "2")
     base_payload = {
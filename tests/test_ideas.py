@@ -1,7 +1,34 @@
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 
+import app.main as main
 from app.main import app
+from app.sqlite_storage import SQLiteIdeaStorage
+from app.storage import IdeaStorage
+
+
+@pytest.fixture(autouse=True, params=["memory", "compact", "sqlite", "sharded"])
+def storage_backend(request, tmp_path, monkeypatch):
+    """Гоняем API-тесты на in-memory хранилище (обычном и компактном), SQLite и шардах."""
+    if request.param == "memory":
+        yield main.storage
+        return
+    if request.param == "compact":
+        backend = IdeaStorage(compact=True)
+        monkeypatch.setattr(main, "storage", backend)
+        yield backend
+        return
+    if request.param == "sharded":
+        backend = request.getfixturevalue("sharded_storage")
+        monkeypatch.setattr(main, "storage", backend)
+        yield backend
+        return
+    backend = SQLiteIdeaStorage(tmp_path / "ideas.db")
+    monkeypatch.setattr(main, "storage", backend)
+    yield backend
+    backend.close()
 
 
 def create_sample_idea(client, **override):
@@ -86,6 +113,24 @@ def test_update_idea():
     assert body["tags"] == ["ai", "product"]
 
 
+def test_rejected_update_leaves_idea_untouched():
+    client = TestClient(app)
+    idea_id = create_sample_idea(client)["id"]
+    before = client.get(f"/ideas/{idea_id}")
+
+    response = client.patch(
+        f"/ideas/{idea_id}",
+        json={"title": "Changed title", "tags": ["other"], "status": "bogus"},
+    )
+    assert response.status_code == 422
+
+    after = client.get(f"/ideas/{idea_id}")
+    assert after.json() == before.json()
+    assert after.headers["etag"] == before.headers["etag"]
+    assert client.get("/ideas", params={"q": "changed"}).json() == []
+    assert client.get("/ideas", params={"q": "assistant"}).json()[0]["id"] == idea_id
+
+
 def test_evaluation_updates_score():
     client = TestClient(app)
     created = create_sample_idea(client)
@@ -112,3 +157,400 @@ def test_evaluation_updates_score():
     evaluations = client.get(f"/ideas/{idea_id}/evaluations")
     assert evaluations.status_code == 200
     assert len(evaluations.json()) == 2
+
+
+def test_list_ideas_paginates_with_cursor():
+    client = TestClient(app)
+    created = [
+        create_sample_idea(client, title=f"Idea {idx}")["id"] for idx in range(5)
+    ]
+
+    first = client.get("/ideas", params={"limit": 2})
+    assert first.status_code == 200
+    assert [item["id"] for item in first.json()] == created[:2]
+    cursor = first.headers["X-Next-Cursor"]
+    assert 'rel="next"' in first.headers["Link"]
+
+    # Новые записи между страницами не сдвигают уже выданные позиции.
+    extra = create_sample_idea(client, title="Late idea")["id"]
+
+    second = client.get("/ideas", params={"limit": 2, "cursor": cursor})
+    assert [item["id"] for item in second.json()] == created[2:4]
+
+    third = client.get(
+        "/ideas", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]}
+    )
+    assert [item["id"] for item in third.json()] == [created[4], extra]
+    assert "X-Next-Cursor" not in third.headers
+
+
+def test_list_ideas_paginates_filtered_results():
+    client = TestClient(app)
+    tagged = []
+    for idx in range(6):
+        tags = ["ops"] if idx % 2 else ["ai"]
+        idea = create_sample_idea(client, title=f"Idea {idx}", tags=tags)
+        if idx % 2:
+            tagged.append(idea["id"])
+
+    seen = []
+    params = {"tag": "ops", "limit": 2}
+    while True:
+        page = client.get("/ideas", params=params)
+        assert page.status_code == 200
+        seen.extend(item["id"] for item in page.json())
+        if "X-Next-Cursor" not in page.headers:
+            break
+        params["cursor"] = page.headers["X-Next-Cursor"]
+    assert seen == tagged
+
+
+def test_export_streams_ndjson_in_batches(monkeypatch, storage_backend):
+    monkeypatch.setattr("app.main.EXPORT_BATCH_SIZE", 2)
+    client = TestClient(app)
+    ids = [create_sample_idea(client, title=f"Idea {idx}")["id"] for idx in range(5)]
+    client.post(
+        f"/ideas/{ids[0]}/evaluations",
+        json={"value": 7, "effort": 2, "confidence": 6, "comment": "ok"},
+    )
+    # Оценки берутся одной выборкой на пачку, а не запросом на каждую идею.
+    batches = []
+    evaluations_many = storage_backend.evaluations_many
+
+    def spy(idea_ids):
+        batches.append(list(idea_ids))
+        return evaluations_many(idea_ids)
+
+    def per_idea(idea_id):
+        raise AssertionError("export must not fetch evaluations per idea")
+
+    monkeypatch.setattr(storage_backend, "evaluations_many", spy)
+    monkeypatch.setattr(storage_backend, "evaluations", per_idea)
+
+    response = client.get("/ideas/export", params={"include_evaluations": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["id"] for item in lines] == ids
+    assert lines[0]["score"]["votes"] == 1
+    assert lines[0]["evaluations"] == [
+        {"value": 7, "effort": 2, "confidence": 6, "comment": "ok"}
+    ]
+    assert lines[1]["evaluations"] == []
+    assert batches == [ids[0:2], ids[2:4], ids[4:5]]
+    assert lines[2] == client.get(f"/ideas/{ids[2]}").json() | {"evaluations": []}
+
+
+def test_export_applies_list_filters():
+    client = TestClient(app)
+    create_sample_idea(client, title="Idea ai", tags=["ai"])
+    ops = create_sample_idea(client, title="Idea ops", tags=["ops"])
+
+    response = client.get("/ideas/export", params={"tag": "ops"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["id"] for item in lines] == [ops["id"]]
+    assert "evaluations" not in lines[0]
+
+
+def test_batch_create_returns_per_item_results(monkeypatch):
+    client = TestClient(app)
+    monkeypatch.setenv("IDEA_RATE_LIMIT_PER_MINUTE", "3")
+    valid = {
+        "title": "Imported idea",
+        "description": "Comes from the spreadsheet importer.",
+        "tags": ["Import", "import"],
+    }
+    items = [valid, {"title": "x", "description": "too short"}, valid, valid, valid]
+
+    response = client.post("/ideas/batch", json={"items": items})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 3
+    statuses = [result["status"] for result in body["results"]]
+    assert statuses == [201, 422, 201, 201, 429]
+    assert body["results"][1]["code"] == "validation_error"
+    assert body["results"][1]["errors"]
+    assert body["results"][4]["code"] == "too_many_requests"
+    assert body["results"][4]["correlation_id"] == response.headers["X-Correlation-Id"]
+
+    ids = [result["id"] for result in body["results"] if result["status"] == 201]
+    assert ids == [1, 2, 3]
+    assert client.get("/ideas/3").json()["tags"] == ["import"]
+    assert [
+        idea["id"] for idea in client.get("/ideas", params={"tag": "import"}).json()
+    ] == ids
+    # Лимит уже исчерпан пачкой.
+    assert client.post("/ideas", json=valid).status_code == 429
+
+
+def test_batch_create_rejects_oversized_batches():
+    client = TestClient(app)
+    item = {"title": "Imported idea", "description": "Comes from the importer."}
+    response = client.post("/ideas/batch", json={"items": [item] * 501})
+    assert response.status_code == 422
+    assert client.post("/ideas/batch", json={"items": []}).status_code == 422
+
+
+def test_bulk_evaluations_are_grouped_per_idea():
+    client = TestClient(app)
+    first = create_sample_idea(client)["id"]
+    second = create_sample_idea(client, title="Second idea")["id"]
+    client.post(
+        f"/ideas/{first}/evaluations", json={"value": 2, "effort": 2, "confidence": 2}
+    )
+
+    items = [
+        {"idea_id": first, "value": 8, "effort": 4, "confidence": 6},
+        {"idea_id": second, "value": 5, "effort": 5, "confidence": 5, "comment": "ok"},
+        {"idea_id": first, "value": 11, "effort": 1, "confidence": 1},
+        {"idea_id": 999, "value": 5, "effort": 5, "confidence": 5},
+        {"idea_id": first, "value": 5, "effort": 3, "confidence": 4},
+    ]
+    response = client.post("/ideas/evaluations/batch", json={"items": items})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["applied"] == 3
+    assert body["ideas"] == [
+        {
+            "id": first,
+            "added": 2,
+            "score": {
+                "value": 5.0,
+                "confidence": 4.0,
+                "effort": 3.0,
+                "impact": 6.67,
+                "votes": 3,
+            },
+        },
+        {
+            "id": second,
+            "added": 1,
+            "score": {
+                "value": 5.0,
+                "confidence": 5.0,
+                "effort": 5.0,
+                "impact": 5.0,
+                "votes": 1,
+            },
+        },
+    ]
+    assert [(error["index"], error["status"]) for error in body["errors"]] == [
+        (2, 422),
+        (3, 404),
+    ]
+    assert body["errors"][1]["code"] == "idea_not_found"
+
+    assert client.get(f"/ideas/{first}").json()["score"] == body["ideas"][0]["score"]
+    assert [
+        item["value"] for item in client.get(f"/ideas/{first}/evaluations").json()
+    ] == [
+        2,
+        8,
+        5,
+    ]
+    filtered = client.get("/ideas", params={"min_score": 5}).json()
+    assert [idea["id"] for idea in filtered] == [first, second]
+
+    metrics = client.get("/metrics").text
+    assert "\nidea_ideas 2\n" in metrics
+    assert "\nidea_evaluations 4\n" in metrics
+
+
+def test_conditional_get_uses_versioned_etags(storage_backend):
+    client = TestClient(app)
+    idea_id = create_sample_idea(client)["id"]
+    other_id = create_sample_idea(client, title="Other idea")["id"]
+
+    item = client.get(f"/ideas/{idea_id}")
+    listing = client.get("/ideas")
+    item_etag, list_etag = item.headers["etag"], listing.headers["etag"]
+    assert item_etag != list_etag
+
+    cached = client.get(f"/ideas/{idea_id}", headers={"If-None-Match": item_etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == item_etag
+    assert cached.content == b""
+    assert (
+        client.get("/ideas", headers={"If-None-Match": f"W/{list_etag}"}).status_code
+        == 304
+    )
+
+    client.patch(f"/ideas/{other_id}", json={"status": "in_review"})
+    # Чужая правка меняет список, но не ETag карточки.
+    assert (
+        client.get(
+            f"/ideas/{idea_id}", headers={"If-None-Match": item_etag}
+        ).status_code
+        == 304
+    )
+    refreshed = client.get("/ideas", headers={"If-None-Match": list_etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != list_etag
+
+    version = storage_backend.version
+    client.post(
+        f"/ideas/{idea_id}/evaluations", json={"value": 5, "effort": 5, "confidence": 5}
+    )
+    assert storage_backend.version > version
+    changed = client.get(f"/ideas/{idea_id}", headers={"If-None-Match": item_etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != item_etag
+    assert changed.json()["score"]["votes"] == 1
+
+    assert client.get("/ideas/999", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_etags_do_not_repeat_after_clear(storage_backend):
+    client = TestClient(app)
+    idea_id = create_sample_idea(client)["id"]
+    etag = client.get(f"/ideas/{idea_id}").headers["etag"]
+
+    storage_backend.clear()
+    assert create_sample_idea(client)["id"] == idea_id
+    assert client.get(f"/ideas/{idea_id}").headers["etag"] != etag
+
+
+def test_search_ranks_ideas_and_combines_with_filters():
+    client = TestClient(app)
+    dashboard = create_sample_idea(
+        client,
+        title="Дашборд для поддержки",
+        description="Ёмкий дашборд: очередь обращений, дашборд SLA и дашборд нагрузки.",
+        tags=["support"],
+    )["id"]
+    mention = create_sample_idea(
+        client,
+        title="Бот для поддержки",
+        description="Отвечает на типовые вопросы, ссылки на дашборд в ответах.",
+        tags=["support", "ai"],
+    )["id"]
+    create_sample_idea(client, title="Unrelated idea", tags=["support"])
+
+    response = client.get("/ideas", params={"q": "ДАШБОРД емкий"})
+    assert response.status_code == 200
+    assert [idea["id"] for idea in response.json()] == [dashboard, mention]
+
+    filtered = client.get("/ideas", params={"q": "дашборд", "tag": "ai"}).json()
+    assert [idea["id"] for idea in filtered] == [mention]
+    assert client.get("/ideas", params={"q": "!!!"}).json() == []
+
+    client.patch(f"/ideas/{mention}", json={"title": "Чат-помощник"})
+    assert [
+        idea["id"] for idea in client.get("/ideas", params={"q": "чат"}).json()
+    ] == [mention]
+    assert client.get("/ideas", params={"q": "бот"}).json() == []
+
+
+def test_search_pages_with_offset_cursor():
+    client = TestClient(app)
+    for index in range(5):
+        create_sample_idea(
+            client,
+            title=f"Search idea {index}",
+            description="roadmap " * (index + 1) + "planning notes",
+        )
+
+    seen = []
+    params = {"q": "roadmap", "limit": 2}
+    while True:
+        page = client.get("/ideas", params=params)
+        seen.extend(idea["id"] for idea in page.json())
+        if "X-Next-Cursor" not in page.headers:
+            break
+        params["cursor"] = page.headers["X-Next-Cursor"]
+    # Больше вхождений слова — выше в выдаче.
+    assert seen == [5, 4, 3, 2, 1]
+
+    list_cursor = client.get("/ideas", params={"limit": 1}).headers["X-Next-Cursor"]
+    rejected = client.get("/ideas", params={"q": "roadmap", "cursor": list_cursor})
+    assert rejected.status_code == 422
+    assert rejected.json()["code"] == "invalid_cursor"
+
+
+def test_list_ideas_sorted_by_metric_with_top_k():
+    client = TestClient(app)
+    # value, effort, confidence для каждой оценки; у третьей идеи оценок нет.
+    votes = {
+        "Fast win": [(6, 1, 6)],
+        "Big bet": [(9, 9, 9), (9, 9, 9)],
+        "No votes yet": [],
+        "Same value": [(9, 9, 9)],
+    }
+    for title, evaluations in votes.items():
+        idea = create_sample_idea(client, title=title, tags=["rank"])
+        for value, effort, confidence in evaluations:
+            client.post(
+                f"/ideas/{idea['id']}/evaluations",
+                json={"value": value, "effort": effort, "confidence": confidence},
+            )
+
+    def ids(**params):
+        response = client.get("/ideas", params=params)
+        assert response.status_code == 200
+        return [idea["id"] for idea in response.json()]
+
+    # Равные метрики — по id, идеи без оценок — в конце.
+    assert ids(sort="impact") == [1, 2, 4, 3]
+    assert ids(sort="value") == [2, 4, 1, 3]
+    assert ids(sort="votes") == [2, 1, 4, 3]
+    assert ids(sort="value", top=2) == [2, 4]
+    assert ids(sort="value", min_score=7) == [2, 4]
+
+    first = client.get("/ideas", params={"sort": "votes", "limit": 3})
+    assert (
+        "X-Next-Cursor"
+        not in client.get("/ideas", params={"sort": "votes", "top": 3}).headers
+    )
+    second = client.get(
+        "/ideas",
+        params={"sort": "votes", "limit": 3, "cursor": first.headers["X-Next-Cursor"]},
+    )
+    assert [idea["id"] for idea in second.json()] == [3]
+
+    for params in [
+        {"sort": "impact", "q": "idea"},
+        {"top": 3},
+        {"sort": "impact", "top": 3, "cursor": first.headers["X-Next-Cursor"]},
+    ]:
+        rejected = client.get("/ideas", params=params)
+        assert rejected.status_code == 422
+        assert rejected.json()["code"] == "validation_error"
+    assert client.get("/ideas", params={"sort": "random"}).status_code == 422
+
+
+def test_evaluation_analytics_by_tag_and_status():
+    client = TestClient(app)
+    first = create_sample_idea(client, tags=["ai"])
+    second = create_sample_idea(client, tags=["ai", "ops"])
+    create_sample_idea(client, tags=["ux"])
+    for idea_id, value in [(first["id"], 4), (first["id"], 8), (second["id"], 10)]:
+        client.post(
+            f"/ideas/{idea_id}/evaluations",
+            json={"value": value, "effort": 2, "confidence": 6},
+        )
+    client.patch(f"/ideas/{second['id']}", json={"status": "approved"})
+
+    by_tag = client.get("/ideas/analytics", params={"group_by": "tag"})
+    assert by_tag.status_code == 200
+    body = by_tag.json()
+    assert body["total"]["ideas"] == 3
+    assert body["total"]["evaluations"] == 3
+    assert body["total"]["value"]["mean"] == 7.33
+    groups = {group["key"]: group for group in body["groups"]}
+    assert list(groups) == ["ai", "ops", "ux"]
+    assert groups["ai"]["value"] == {
+        "count": 3,
+        "mean": 7.33,
+        "p50": 8.0,
+        "p90": 9.6,
+        "p99": 9.96,
+        "histogram": [0, 0, 0, 1, 0, 0, 0, 1, 0, 1],
+    }
+    assert groups["ux"]["ideas"] == 1
+    assert groups["ux"]["effort"]["count"] == 0
+
+    by_status = client.get("/ideas/analytics").json()
+    assert by_status["group_by"] == "status"
+    statuses = {group["key"]: group["evaluations"] for group in by_status["groups"]}
+    assert statuses == {"approved": 1, "draft": 2}
+    assert client.get("/ideas/analytics", params={"group_by": "x"}).status_code == 422
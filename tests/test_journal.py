@@ -0,0 +1,281 @@
+import threading
+
+import pytest
+
+from app import journal
+from app.journal import JournaledIdeaStorage
+from app.models import AnalyticsGroupBy, EvaluationCreate, IdeaCreate, IdeaUpdate
+from app.problem_details import ApiProblem
+
+
+def make_idea(title: str = "Durable idea", tags=("ops",)) -> IdeaCreate:
+    return IdeaCreate(
+        title=title,
+        description="Needs to survive a process restart.",
+        tags=list(tags),
+    )
+
+
+def fill(store: JournaledIdeaStorage) -> None:
+    first = store.create(make_idea("First idea", tags=("ops", "ai")))
+    second = store.create(make_idea("Second idea"))
+    store.update(
+        first.id, IdeaUpdate(title="Renamed idea", status="approved", tags=["ai"])
+    )
+    store.add_evaluation(first.id, EvaluationCreate(value=8, effort=3, confidence=6))
+    store.add_evaluation(
+        second.id, EvaluationCreate(value=4, effort=5, confidence=2, comment="meh")
+    )
+    store.add_attachment(second.id, "screen.png")
+
+
+def test_journal_replays_mutations_after_restart(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False)
+    fill(store)
+    expected = store.list()
+    expected_history = store.evaluations(2)
+    expected_analytics = store.evaluation_analytics(AnalyticsGroupBy.tag)
+    store.close()
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert restored.list() == expected
+        assert restored.evaluations(2) == expected_history
+        assert restored.evaluation_analytics(AnalyticsGroupBy.tag) == expected_analytics
+        assert restored.totals() == (2, 2)
+        assert restored.list(tag="ops") == [expected[1]]
+        assert [idea.id for idea in restored.search("renamed")] == [1]
+        assert restored.search("first") == []
+        assert restored.referenced_attachments(["screen.png", "x.png"]) == {
+            "screen.png"
+        }
+        assert restored.create(make_idea()).id == 3
+    finally:
+        restored.close()
+
+
+def test_snapshot_covers_journal_and_tail_is_replayed(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False)
+    fill(store)
+    store.compact()
+    store.add_evaluation(1, EvaluationCreate(value=2, effort=2, confidence=2))
+    expected = store.list()
+    store.close()
+
+    assert len(list(tmp_path.glob("snapshot-*.json"))) == 1
+    # Старые сегменты удалены, остался только хвост после снапшота.
+    segments = sorted(tmp_path.glob("journal-*.log"))
+    assert len(segments) == 1
+    assert segments[0].read_bytes().count(b"\n") == 1
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert restored.list() == expected
+    finally:
+        restored.close()
+
+
+def test_background_compaction_is_triggered_by_entry_count(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False, snapshot_every=5)
+    fill(store)
+    store.close()
+
+    assert list(tmp_path.glob("snapshot-*.json"))
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert [idea.id for idea in restored.list()] == [1, 2]
+        assert restored.get(1).score.votes == 1
+    finally:
+        restored.close()
+
+
+def test_torn_tail_is_ignored_and_trimmed(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False)
+    store.create(make_idea())
+    store.close()
+
+    segment = sorted(tmp_path.glob("journal-*.log"))[-1]
+    with segment.open("ab") as handle:
+        handle.write(b'{"op":"create","id":2,"tit')
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    restored.create(make_idea("After crash"))
+    restored.close()
+
+    again = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert [idea.title for idea in again.list()] == ["Durable idea", "After crash"]
+    finally:
+        again.close()
+
+
+def test_group_commit_keeps_concurrent_writes(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, commit_delay=0.001)
+
+    def worker():
+        for _ in range(20):
+            store.create(make_idea())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert [idea.id for idea in restored.list()] == list(range(1, 161))
+    finally:
+        restored.close()
+
+
+def test_batch_create_is_journaled(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False)
+    assert store.create_many([make_idea(f"Batch {index}") for index in range(3)]) == [
+        1,
+        2,
+        3,
+    ]
+    store.close()
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert [idea.title for idea in restored.list()] == [
+            "Batch 0",
+            "Batch 1",
+            "Batch 2",
+        ]
+        assert restored.create(make_idea()).id == 4
+    finally:
+        restored.close()
+
+
+def test_bulk_evaluations_are_journaled(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False)
+    fill(store)
+    scores = store.add_evaluations(
+        {
+            1: [EvaluationCreate(value=2, effort=2, confidence=2)] * 2,
+            7: [EvaluationCreate(value=9, effort=9, confidence=9)],
+        }
+    )
+    assert list(scores) == [1]
+    expected = store.list()
+    store.close()
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        assert restored.list() == expected
+        assert restored.get(1).score.votes == 3
+    finally:
+        restored.close()
+
+
+def test_compact_store_restores_from_snapshot_and_tail(tmp_path):
+    store = JournaledIdeaStorage(tmp_path, fsync=False, compact=True)
+    fill(store)
+    store.compact()
+    store.add_evaluation(2, EvaluationCreate(value=9, effort=1, confidence=7))
+    expected = (store.list(), store.evaluations(2))
+    store.close()
+
+    # Снапшот компактного хранилища читается и обычным, и наоборот.
+    for compact in (True, False):
+        restored = JournaledIdeaStorage(tmp_path, fsync=False, compact=compact)
+        try:
+            assert (restored.list(), restored.evaluations(2)) == expected
+        finally:
+            restored.close()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_writes_during_snapshot_serialization_land_in_the_tail(
+    tmp_path, monkeypatch, compact
+):
+    store = JournaledIdeaStorage(tmp_path, fsync=False, compact=compact)
+    fill(store)
+    late = EvaluationCreate(value=1, effort=9, confidence=1, comment="late")
+    serialize = journal._evaluation_rows
+    pending = [late]
+
+    def write_then_serialize(evaluations, length):
+        # Писатели уже не ждут снапшот: оценка попадает в запись и в новый
+        # сегмент, а в снапшот — нет.
+        while pending:
+            store.add_evaluation(2, pending.pop())
+            store.add_attachment(2, "late.png")
+        return serialize(evaluations, length)
+
+    monkeypatch.setattr(journal, "_evaluation_rows", write_then_serialize)
+    store.compact()
+    monkeypatch.undo()
+    expected = (store.list(), store.evaluations(2))
+    store.close()
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False, compact=compact)
+    try:
+        assert (restored.list(), restored.evaluations(2)) == expected
+        assert restored.get(2).score.votes == 2
+    finally:
+        restored.close()
+
+
+def test_failed_journal_write_refuses_further_mutations(tmp_path, monkeypatch):
+    store = JournaledIdeaStorage(tmp_path)
+    store.create(make_idea("Durable idea"))
+
+    def broken_fsync(fd):
+        raise OSError("disk is gone")
+
+    monkeypatch.setattr(journal.os, "fsync", broken_fsync)
+    with pytest.raises(ApiProblem) as error:
+        store.create(make_idea("Lost idea"))
+    assert (error.value.status, error.value.code) == (503, "storage_unavailable")
+    monkeypatch.undo()
+
+    # Хранилище неисправно: мутации отклоняются, не меняя состояние в памяти.
+    before = store.list()
+    for mutation in (
+        lambda: store.create(make_idea("Refused idea")),
+        lambda: store.update(1, IdeaUpdate(title="Refused title")),
+        lambda: store.add_evaluation(
+            1, EvaluationCreate(value=1, effort=1, confidence=1)
+        ),
+        lambda: store.add_attachment(1, "refused.png"),
+        store.clear,
+    ):
+        with pytest.raises(ApiProblem):
+            mutation()
+    assert store.list() == before
+    store.close()
+
+    restored = JournaledIdeaStorage(tmp_path, fsync=False)
+    try:
+        # Строка упавшей записи могла успеть попасть в файл до fsync, а
+        # отклонённые мутации в журнал не попадают вовсе.
+        titles = [idea.title for idea in restored.list()]
+        assert titles in (["Durable idea"], ["Durable idea", "Lost idea"])
+        assert restored.evaluations(1) == []
+    finally:
+        restored.close()
+
+
+def test_snapshot_counter_is_exact_under_concurrent_commits(tmp_path, monkeypatch):
+    store = JournaledIdeaStorage(tmp_path, fsync=False, snapshot_every=10**9)
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        for _ in range(50):
+            store.create(make_idea())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert store._entries_since_snapshot == 400
+    finally:
+        store.close()
@@ -0,0 +1,144 @@
+import random
+import sys
+import threading
+import time
+
+import pytest
+
+from app.locks import ReadWriteLock
+from app.models import EvaluationCreate, IdeaCreate, IdeaSort, IdeaStatus, IdeaUpdate
+from app.storage import IdeaStorage
+
+
+def test_readers_share_the_lock_and_writer_waits_for_them():
+    lock = ReadWriteLock()
+    both_inside = threading.Barrier(2, timeout=5)
+    release_readers = threading.Event()
+    events = []
+
+    def reader() -> None:
+        with lock.read:
+            # Оба читателя внутри одновременно, иначе барьер не пройти.
+            both_inside.wait()
+            release_readers.wait(5)
+        events.append("reader done")
+
+    def writer() -> None:
+        with lock.write:
+            events.append("writer")
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in readers:
+        thread.start()
+    time.sleep(0.05)
+    writing = threading.Thread(target=writer)
+    writing.start()
+    time.sleep(0.05)
+    # Писатель ждёт, пока активные читатели не выйдут.
+    assert events == []
+    release_readers.set()
+    for thread in readers + [writing]:
+        thread.join(5)
+    assert events == ["reader done", "reader done", "writer"]
+
+
+def test_waiting_writer_blocks_new_readers():
+    lock = ReadWriteLock()
+    events = []
+    lock.acquire_read()
+
+    def writer() -> None:
+        with lock.write:
+            events.append("writer")
+
+    def late_reader() -> None:
+        with lock.read:
+            events.append("late reader")
+
+    writing = threading.Thread(target=writer)
+    writing.start()
+    time.sleep(0.05)
+    reading = threading.Thread(target=late_reader)
+    reading.start()
+    time.sleep(0.05)
+    assert events == []
+    lock.release_read()
+    writing.join(5)
+    reading.join(5)
+    assert events == ["writer", "late reader"]
+
+
+@pytest.fixture
+def frequent_switches():
+    """Переключаем потоки почти на каждом байткоде, чтобы гонки проявлялись."""
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(previous)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_storage_stays_consistent_under_concurrent_load(compact, frequent_switches):
+    store = IdeaStorage(compact=compact)
+    errors = []
+    created = []
+    votes = []
+    writers, readers, rounds = 4, 4, 150
+
+    def write(seed: int) -> None:
+        rng = random.Random(seed)
+        try:
+            for index in range(rounds):
+                idea = store.create(
+                    IdeaCreate(
+                        title=f"Idea {seed}-{index}",
+                        description="Created by the concurrency stress test.",
+                        tags=[rng.choice(["ai", "ops", "ux"])],
+                    )
+                )
+                created.append(idea.id)
+                target = rng.choice(created)
+                store.add_evaluation(
+                    target, EvaluationCreate(value=5, effort=3, confidence=7)
+                )
+                votes.append(target)
+                store.update(
+                    rng.choice(created),
+                    IdeaUpdate(
+                        status=rng.choice(list(IdeaStatus)).value,
+                        tags=[rng.choice(["ai", "ops", "ux"])],
+                    ),
+                )
+        except Exception as exc:  # pragma: no cover - попадёт в assert ниже
+            errors.append(exc)
+
+    def read() -> None:
+        try:
+            while len(created) < writers * rounds:
+                store.list(tag="ai")
+                store.list_json(status=IdeaStatus.approved, limit=20)
+                store.ranked(IdeaSort.votes, limit=10)
+                store.search_json("stress idea", limit=10)
+        except Exception as exc:  # pragma: no cover - попадёт в assert ниже
+            errors.append(exc)
+
+    threads = [threading.Thread(target=write, args=(seed,)) for seed in range(writers)]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+
+    assert errors == []
+    ideas = store.list()
+    # Ни одного потерянного или повторного id.
+    assert sorted(created) == [idea.id for idea in ideas]
+    assert [idea.id for idea in ideas] == list(range(1, writers * rounds + 1))
+    assert sum(idea.score.votes for idea in ideas) == len(votes)
+    # Вторичные индексы согласованы с записями.
+    for tag in ["ai", "ops", "ux"]:
+        expected = [idea.id for idea in ideas if tag in idea.tags]
+        assert [idea.id for idea in store.list(tag=tag)] == expected
+    for status in IdeaStatus:
+        expected = [idea.id for idea in ideas if idea.status == status]
+        assert [idea.id for idea in store.list(status=status)] == expected
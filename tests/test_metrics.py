@@ -0,0 +1,124 @@
+from typing import Dict
+
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import app
+from app.metrics import CONTENT_TYPE, Histogram, Metrics
+from app.security import AttachmentStorage, RateLimiter, SharedMemoryRateLimitBackend
+
+client = TestClient(app)
+
+IDEA = {
+    "title": "Observable idea",
+    "description": "Idea created to be counted by /metrics.",
+    "tags": ["ops"],
+}
+
+
+def scrape() -> Dict[str, float]:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.001, 0.01, 0.1))
+    for value in (0.0005, 0.001, 0.05, 0.05, 3.0):
+        histogram.observe(value)
+
+    # Граница входит в свою корзину (le = «меньше или равно»).
+    assert histogram.counts == [2, 0, 2, 1]
+    assert histogram.cumulative() == [2, 2, 4, 5]
+    assert histogram.count == 5
+
+    metrics = Metrics(buckets=(0.001, 0.01, 0.1))
+    metrics.observe_request("GET", '/odd "route"', 200, 0.05)
+    text = metrics.render({"idea_ideas": ("Ideas.", 3)})
+    labels = 'method="GET",route="/odd \\"route\\"",status="200"'
+    assert f'idea_http_request_duration_seconds_bucket{{{labels},le="0.01"}} 0' in text
+    assert f'idea_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"idea_http_request_duration_seconds_count{{{labels}}} 1" in text
+    assert "# TYPE idea_ideas gauge\nidea_ideas 3\n" in text
+
+
+def test_requests_are_labelled_by_route_template_and_status():
+    idea = client.post("/ideas", json=IDEA).json()
+    client.get(f"/ideas/{idea['id']}")
+    client.get(f"/ideas/{idea['id'] + 100}")
+    client.get(f"/ideas/{idea['id'] + 200}")
+    client.get("/no/such/page")
+
+    samples = scrape()
+    count = "idea_http_request_duration_seconds_count"
+    assert samples[f'{count}{{method="POST",route="/ideas",status="201"}}'] == 1
+    card = 'method="GET",route="/ideas/{idea_id}"'
+    assert samples[f'{count}{{{card},status="200"}}'] == 1
+    assert samples[f'{count}{{{card},status="404"}}'] == 2
+    assert samples[f'{count}{{method="GET",route="<unmatched>",status="404"}}'] == 1
+    # Путь с конкретным id не порождает отдельную серию.
+    assert not any(f"/ideas/{idea['id']}" in name for name in samples)
+
+
+def test_storage_and_rate_limiter_sizes_are_exported(monkeypatch):
+    monkeypatch.setenv("IDEA_RATE_LIMIT_PER_MINUTE", "2")
+    first = client.post("/ideas", json=IDEA).json()
+    client.post("/ideas", json=IDEA)
+    assert client.post("/ideas", json=IDEA).status_code == 429
+    evaluation = {"value": 7, "effort": 3, "confidence": 6}
+    client.post(f"/ideas/{first['id']}/evaluations", json=evaluation)
+    client.post(f"/ideas/{first['id']}/evaluations", json=evaluation)
+    batch = client.post("/ideas/batch", json={"items": [IDEA] * 3})
+    assert batch.status_code == 200
+
+    samples = scrape()
+    assert samples["idea_ideas"] == 2
+    assert samples["idea_evaluations"] == 2
+    assert samples["idea_rate_limit_tracked_keys"] == 1
+    assert samples['idea_rate_limited_total{route="/ideas"}'] == 1
+    # В пакете отказ считается по каждому элементу.
+    assert samples['idea_rate_limited_total{route="/ideas/batch"}'] == 3
+
+
+def test_attachment_bytes_and_errors_are_counted(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        main,
+        "attachment_storage",
+        AttachmentStorage(tmp_path / "blobs", content_addressed=True),
+    )
+    idea = client.post("/ideas", json=IDEA).json()
+    data = b"\x89PNG\r\n\x1a\n" + b"\x00" * 500
+    for _ in range(2):
+        response = client.post(
+            f"/ideas/{idea['id']}/attachments",
+            files={"file": ("diagram.png", data, "image/png")},
+        )
+        assert response.status_code == 201
+    for payload in (b"not_an_image", b"\xff\xd8" + b"\x00" * 500):
+        # Вторая сигнатура проходит, но без конца JPEG отклоняется на commit.
+        rejected = client.post(
+            f"/ideas/{idea['id']}/attachments",
+            files={"file": ("payload.jpg", payload, "image/jpeg")},
+        )
+        assert rejected.status_code == 415
+
+    samples = scrape()
+    # Отклонённые загрузки и дубль по содержимому в байты не попадают.
+    assert samples["idea_attachment_bytes_written_total"] == len(data)
+    assert samples['idea_attachment_errors_total{code="attachment_bad_type"}'] == 2
+
+
+def test_shared_rate_limit_table_is_counted(tmp_path, monkeypatch):
+    backend = SharedMemoryRateLimitBackend(tmp_path / "rate-limit.bin")
+    monkeypatch.setattr(main, "rate_limiter", RateLimiter(backend=backend))
+    for client_id in ("alpha", "beta", "gamma"):
+        client.post("/ideas", json=IDEA, headers={"X-Client-Id": client_id})
+
+    assert scrape()["idea_rate_limit_tracked_keys"] == 3
+    backend.close()
@@ -0,0 +1,197 @@
+import fcntl
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from app.security import (
+    DEFAULT_RATE_LIMIT,
+    SHARED_BUCKET_SIZE,
+    SHARED_HEADER,
+    RateLimiter,
+    SharedMemoryRateLimitBackend,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_blocks_after_limit_within_window():
+    clock = FakeClock(1000.0)
+    limiter = RateLimiter(clock=clock)
+
+    assert all(limiter.allow("client", limit=3) for _ in range(3))
+    assert not limiter.allow("client", limit=3)
+    assert limiter.allow("other", limit=3)
+
+
+def test_default_limit_comes_from_env(monkeypatch):
+    clock = FakeClock(1000.0)
+    limiter = RateLimiter(clock=clock)
+    assert limiter.resolve_limit() == DEFAULT_RATE_LIMIT
+
+    monkeypatch.setenv("IDEA_RATE_LIMIT_PER_MINUTE", "2")
+    assert limiter.allow("client")
+    assert limiter.allow("client")
+    assert not limiter.allow("client")
+
+
+def test_previous_window_decays_linearly():
+    clock = FakeClock(60.0 * 100)
+    limiter = RateLimiter(clock=clock)
+    for _ in range(10):
+        assert limiter.allow("client", limit=10)
+
+    # В начале следующего окна предыдущее ещё засчитывается почти целиком.
+    clock.now += 60.0
+    assert not limiter.allow("client", limit=10)
+
+    # К середине окна вес предыдущего падает вдвое: 10 * 0.5 = 5 из 10.
+    clock.now += 30.0
+    allowed = sum(limiter.allow("client", limit=10) for _ in range(10))
+    assert allowed == 5
+
+    # Через два окна без запросов счётчики обнуляются.
+    clock.now += 120.0
+    assert all(limiter.allow("client", limit=10) for _ in range(10))
+
+
+def test_idle_keys_are_evicted():
+    clock = FakeClock(60.0 * 100)
+    limiter = RateLimiter(clock=clock)
+    for index in range(20):
+        limiter.allow(f"client-{index}", limit=5)
+    assert limiter.tracked_keys() == 20
+
+    clock.now += 130.0
+    limiter.allow("fresh", limit=5)
+    assert list(limiter.backend._hits) == ["fresh"]
+
+
+def test_shared_backend_is_shared_between_limiters(tmp_path):
+    clock = FakeClock(60.0 * 100)
+    path = tmp_path / "rate-limit.bin"
+    first = SharedMemoryRateLimitBackend(path, buckets=8)
+    second = SharedMemoryRateLimitBackend(path, buckets=1024)
+    try:
+        worker_a = RateLimiter(clock=clock, backend=first)
+        worker_b = RateLimiter(clock=clock, backend=second)
+
+        assert worker_a.allow("client", limit=3)
+        assert worker_b.allow("client", limit=3)
+        assert worker_a.allow("client", limit=3)
+        assert not worker_b.allow("client", limit=3)
+        assert worker_b.allow("other", limit=3)
+
+        clock.now += 180.0
+        assert worker_b.allow("client", limit=3)
+        assert first.tracked_keys() == 2
+    finally:
+        first.close()
+        second.close()
+
+
+def test_shared_backend_evicts_oldest_entry_when_bucket_is_full(tmp_path):
+    clock = FakeClock(60.0 * 100)
+    backend = SharedMemoryRateLimitBackend(tmp_path / "rate-limit.bin", buckets=1)
+    try:
+        limiter = RateLimiter(clock=clock, backend=backend)
+        for index in range(4):
+            assert limiter.allow(f"client-{index}", limit=1)
+            clock.now += 60.0
+        # Новый ключ занимает место самого старого, остальные не трогаются.
+        assert limiter.allow("client-new", limit=1)
+        assert not limiter.allow("client-3", limit=1)
+        assert backend.tracked_keys() == 4
+    finally:
+        backend.close()
+
+
+def _hammer(path, results):
+    backend = SharedMemoryRateLimitBackend(path)
+    limiter = RateLimiter(clock=lambda: 6000.0, backend=backend)
+    results.put(sum(limiter.allow("shared-client", limit=100) for _ in range(60)))
+    backend.close()
+
+
+def test_shared_backend_enforces_limit_across_processes(tmp_path):
+    path = tmp_path / "rate-limit.bin"
+    SharedMemoryRateLimitBackend(path).close()
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_hammer, args=(path, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sum(results.get() for _ in workers) == 100
+
+
+def test_allow_many_matches_sequential_allow(tmp_path):
+    backend = SharedMemoryRateLimitBackend(tmp_path / "rate-limit.bin")
+    try:
+        for make in (
+            lambda clock: RateLimiter(clock=clock),
+            lambda clock: RateLimiter(clock=clock, backend=backend),
+        ):
+            clock = FakeClock(60.0 * 100)
+            single = RateLimiter(clock=clock)
+            batched = make(clock)
+            assert sum(single.allow("client", limit=10) for _ in range(7)) == 7
+            assert batched.allow_many("client", 7, limit=10) == 7
+
+            clock.now += 75.0  # предыдущее окно весит 0.75: 7 * 0.75 = 5.25
+            expected = sum(single.allow("client", limit=10) for _ in range(8))
+            assert batched.allow_many("client", 8, limit=10) == expected == 5
+            assert not batched.allow("client", limit=10)
+            assert batched.allow_many("client", 0, limit=10) == 0
+            backend.reset()
+    finally:
+        backend.close()
+
+
+def _hold_bucket(path, locked, hold):
+    fd = os.open(path, os.O_RDWR)
+    offset = SHARED_HEADER.size
+    fcntl.lockf(fd, fcntl.LOCK_EX, SHARED_BUCKET_SIZE, offset)
+    locked.set()
+    time.sleep(hold)
+    fcntl.lockf(fd, fcntl.LOCK_UN, SHARED_BUCKET_SIZE, offset)
+    os.close(fd)
+
+
+def test_shared_reset_waits_for_bucket_locks_of_other_workers(tmp_path):
+    path = tmp_path / "rate-limit.bin"
+    backend = SharedMemoryRateLimitBackend(path, buckets=8)
+    context = multiprocessing.get_context("fork")
+    locked = context.Event()
+    # Другой воркер посреди hit держит блокировку корзины.
+    worker = context.Process(target=_hold_bucket, args=(path, locked, 0.3))
+    worker.start()
+    try:
+        assert locked.wait(5)
+        started = time.monotonic()
+        backend.reset()
+        assert time.monotonic() - started >= 0.2
+    finally:
+        worker.join()
+        backend.close()
+
+
+def test_security_module_does_not_import_numpy():
+    code = "import sys, app.security; print('numpy' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).resolve().parents[1],
+    )
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,83 @@
+import random
+
+from app.models import IdeaCreate, IdeaUpdate
+from app.search import SearchIndex, tokenize
+from app.sqlite_storage import SQLiteIdeaStorage
+from app.storage import IdeaStorage
+
+WORDS = ["идея", "ёлка", "roadmap", "бот", "sla", "дашборд", "api", "очередь"]
+
+
+def test_tokenize_handles_cyrillic_and_punctuation():
+    assert tokenize("Ёлка-бот: API_v2, «Дашборд» 2024!") == [
+        "елка",
+        "бот",
+        "api",
+        "v2",
+        "дашборд",
+        "2024",
+    ]
+
+
+def test_index_updates_incrementally():
+    index = SearchIndex()
+    index.add(1, "roadmap roadmap planning")
+    index.add(2, "planning session")
+    assert [doc_id for doc_id, _ in index.search("planning")] == [2, 1]
+
+    index.add(1, "retro notes")
+    assert [doc_id for doc_id, _ in index.search("roadmap")] == []
+    assert [doc_id for doc_id, _ in index.search("retro planning")] == [1, 2]
+
+    index.remove(2)
+    assert index.search("planning") == []
+    assert len(index) == 1
+    assert index.search("retro", allowed={2}) == []
+
+
+def test_pruned_top_k_matches_full_ranking():
+    rng = random.Random(5)
+    vocabulary = [f"w{index}" for index in range(40)]
+    weights = [1 / rank for rank in range(1, 41)]
+    index = SearchIndex()
+    for doc_id in range(1, 501):
+        words = rng.choices(vocabulary, weights, k=rng.randint(3, 20))
+        index.add(doc_id, " ".join(words))
+    for doc_id in rng.sample(range(1, 501), 50):
+        index.remove(doc_id)
+
+    allowed = set(rng.sample(range(1, 501), 200))
+    for _ in range(30):
+        query = " ".join(rng.sample(vocabulary, rng.randint(1, 4)))
+        for subset in (None, allowed):
+            full = index.search(query, allowed=subset)
+            assert index.search(query, allowed=subset, limit=10) == full[:10]
+            assert index.search(query, allowed=subset, offset=7, limit=5) == full[7:12]
+
+
+def test_memory_ranking_matches_sqlite_fts(tmp_path):
+    rng = random.Random(11)
+    memory = IdeaStorage()
+    sqlite = SQLiteIdeaStorage(tmp_path / "ideas.db", pool_size=2)
+    try:
+        for _ in range(60):
+            payload = IdeaCreate(
+                title=" ".join(rng.choices(WORDS, k=3)),
+                description=" ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+            )
+            memory.create(payload)
+            sqlite.create(payload)
+        for idea_id in rng.sample(range(1, 61), 10):
+            payload = IdeaUpdate(description=" ".join(rng.choices(WORDS, k=5)))
+            memory.update(idea_id, payload)
+            sqlite.update(idea_id, payload)
+
+        for query in ["ёлка", "бот sla", "Дашборд API очередь", "missing"]:
+            assert [idea.id for idea in sqlite.search(query, limit=20)] == [
+                idea.id for idea in memory.search(query, limit=20)
+            ]
+            assert sqlite.search(query, offset=5, limit=5) == memory.search(
+                query, offset=5, limit=5
+            )
+    finally:
+        sqlite.close()
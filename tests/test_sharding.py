@@ -0,0 +1,312 @@
+import logging
+import multiprocessing
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client
+from pathlib import Path
+
+import pytest
+
+from app.models import (
+    AnalyticsGroupBy,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaSort,
+    IdeaStatus,
+    IdeaUpdate,
+)
+from app.problem_details import ApiProblem
+from app.sharding import (
+    ShardedIdeaStorage,
+    ShardServer,
+    run_shard,
+    shard_of,
+    shard_socket,
+    wait_for_shards,
+)
+from app.storage import IdeaStorage
+
+TAGS = ["ai", "ops", "ux", "infra"]
+
+
+def fill(store, seed: int = 5) -> None:
+    rng = random.Random(seed)
+    store.create_many(
+        [
+            IdeaCreate(
+                title=f"Idea {index} dashboard" if index % 3 else f"Idea {index}",
+                description="Catalogue entry for the sharding test.",
+                tags=rng.sample(TAGS, 2),
+            )
+            for index in range(60)
+        ]
+    )
+    for idea_id in range(1, 61, 4):
+        store.update(idea_id, IdeaUpdate(status=rng.choice(list(IdeaStatus)).value))
+    store.add_evaluations(
+        {
+            idea_id: [
+                EvaluationCreate(
+                    value=rng.randint(1, 10),
+                    effort=rng.randint(1, 10),
+                    confidence=rng.randint(1, 10),
+                )
+                for _ in range(rng.randint(1, 4))
+            ]
+            for idea_id in range(1, 61, 2)
+        }
+    )
+
+
+def test_sharded_storage_matches_single_storage(sharded_storage):
+    single = IdeaStorage()
+    fill(single)
+    fill(sharded_storage)
+
+    # Идеи разложены по всем шардам, а id совпадают с одним хранилищем.
+    assert [idea.id for idea in sharded_storage.list()] == list(range(1, 61))
+    assert {shard_of(idea_id, 3) for idea_id in range(1, 61)} == {0, 1, 2}
+    for filters in (
+        {},
+        {"tag": "ai"},
+        {"status": IdeaStatus.draft, "min_score": 4.0},
+    ):
+        for after_id in (None, 7, 30):
+            assert sharded_storage.list_json(
+                **filters, after_id=after_id, limit=9
+            ) == single.list_json(**filters, after_id=after_id, limit=9)
+        for sort in IdeaSort:
+            for offset, limit in ((0, 5), (7, 10), (0, None)):
+                assert sharded_storage.ranked_json(
+                    sort, **filters, offset=offset, limit=limit
+                ) == single.ranked_json(sort, **filters, offset=offset, limit=limit)
+    # BM25 считается по статистике шарда: набор результатов тот же, порядок
+    # может отличаться.
+    assert {idea_id for idea_id, _ in sharded_storage.search_json("dashboard")} == {
+        idea_id for idea_id, _ in single.search_json("dashboard")
+    }
+    assert len(sharded_storage.search_json("dashboard", offset=3, limit=5)) == 5
+    for group_by in AnalyticsGroupBy:
+        assert sharded_storage.evaluation_analytics(
+            group_by
+        ) == single.evaluation_analytics(group_by)
+    batch = {7: [EvaluationCreate(value=3, effort=3, confidence=3)], 999: [], 2: []}
+    batch[4] = batch[7]
+    assert list(sharded_storage.add_evaluations(batch)) == [7, 4]
+
+
+def test_workers_share_one_catalog(shard_servers, shard_authkey):
+    addresses = [server.address for server in shard_servers]
+    workers = [ShardedIdeaStorage(addresses, authkey=shard_authkey) for _ in range(2)]
+    created = []
+
+    def create(worker: ShardedIdeaStorage, prefix: str) -> None:
+        for index in range(30):
+            idea = worker.create(
+                IdeaCreate(
+                    title=f"{prefix} idea {index}",
+                    description="Created by one of two workers.",
+                    tags=["shared"],
+                )
+            )
+            created.append(idea.id)
+
+    threads = [
+        threading.Thread(target=create, args=(worker, f"Worker {index}"))
+        for index, worker in enumerate(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    first, second = workers
+    # Ни одного повторного id, и оба воркера видят одно и то же.
+    assert len(set(created)) == 60
+    assert [idea_id for idea_id, _ in first.list_json()] == sorted(created)
+    assert first.list_json() == second.list_json()
+    etag = second.list_etag()
+    assert first.list_etag() == etag
+    first.update(created[0], IdeaUpdate(status="approved"))
+    assert second.get(created[0]).status == IdeaStatus.approved
+    assert second.list_etag() != etag
+    for worker in workers:
+        worker.close()
+
+
+def test_shard_errors_reach_the_caller(shard_servers, sharded_storage):
+    with pytest.raises(ApiProblem) as error:
+        sharded_storage.get(42)
+    assert error.value.status == 404
+    assert error.value.code == "idea_not_found"
+
+    stranger = ShardedIdeaStorage(
+        [server.address for server in shard_servers], authkey=b"wrong key"
+    )
+    with pytest.raises(ApiProblem) as error:
+        stranger.list_json()
+    assert error.value.status == 503
+
+    shard_servers[1].close()
+    with pytest.raises(ApiProblem) as error:
+        sharded_storage.list_json()
+    assert error.value.code == "storage_unavailable"
+    # Остальные шарды по-прежнему отвечают.
+    with pytest.raises(ApiProblem) as error:
+        sharded_storage.get(1)
+    assert error.value.code == "idea_not_found"
+
+
+def test_shard_processes_serve_until_terminated(shard_authkey):
+    directory = Path(tempfile.mkdtemp(prefix="shards-"))
+    processes = [
+        multiprocessing.Process(
+            target=run_shard, args=(index, 2, directory, shard_authkey), daemon=True
+        )
+        for index in range(2)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        wait_for_shards(directory, 2, authkey=shard_authkey)
+        store = ShardedIdeaStorage.from_directory(directory, 2, authkey=shard_authkey)
+        ids = store.create_many(
+            [
+                IdeaCreate(
+                    title=f"Process idea {index}",
+                    description="Stored in a shard process.",
+                    tags=["ops"],
+                )
+                for index in range(4)
+            ]
+        )
+        assert ids == [1, 2, 3, 4]
+        assert [idea.title for idea in store.list()] == [
+            f"Process idea {index}" for index in range(4)
+        ]
+        store.close()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(10)
+        shutil.rmtree(directory, ignore_errors=True)
+    assert [process.exitcode for process in processes] == [0, 0]
+
+
+class SlowStorage(IdeaStorage):
+    def __init__(self) -> None:
+        super().__init__()
+        self.delay = 0.0
+
+    def get_json(self, idea_id: int) -> bytes:
+        time.sleep(self.delay)
+        return super().get_json(idea_id)
+
+
+def test_silent_shard_times_out_instead_of_hanging(shard_authkey):
+    directory = Path(tempfile.mkdtemp(prefix="shards-"))
+    # Остановленный шард: соединение встаёт в очередь listen, ответа нет.
+    silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    silent.bind(str(shard_socket(directory, 0)))
+    silent.listen()
+    slow = SlowStorage()
+    server = ShardServer(slow, shard_socket(directory, 1), authkey=shard_authkey)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        hung = ShardedIdeaStorage(
+            [shard_socket(directory, 0)], authkey=shard_authkey, timeout=0.2
+        )
+        started = time.monotonic()
+        with pytest.raises(ApiProblem) as error:
+            hung.list_json()
+        assert error.value.status == 503
+        assert time.monotonic() - started < 2
+
+        store = ShardedIdeaStorage(
+            [shard_socket(directory, 1)], authkey=shard_authkey, timeout=0.2
+        )
+        idea = store.create(
+            IdeaCreate(title="Slow idea", description="Shard answers late.", tags=[])
+        )
+        slow.delay = 0.5
+        with pytest.raises(ApiProblem) as error:
+            store.get_json(idea.id)
+        assert error.value.code == "storage_unavailable"
+        # Опоздавший ответ ушёл в закрытое соединение и не достаётся следующему.
+        slow.delay = 0.0
+        assert store.totals() == (1, 0)
+        assert store.get_json(idea.id) == slow.get_json(idea.id)
+        store.close()
+    finally:
+        server.close()
+        silent.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_stalled_client_does_not_block_other_connections(shard_authkey):
+    directory = Path(tempfile.mkdtemp(prefix="shards-"))
+    server = ShardServer(
+        IdeaStorage(),
+        shard_socket(directory, 0),
+        authkey=shard_authkey,
+        handshake_timeout=0.3,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    wait_for_shards(directory, 1, authkey=shard_authkey)
+    # Подключился и молчит: рукопожатие с ним не должно держать accept.
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(str(shard_socket(directory, 0)))
+    try:
+        store = ShardedIdeaStorage(
+            [shard_socket(directory, 0)], authkey=shard_authkey, timeout=2
+        )
+        started = time.monotonic()
+        assert store.totals() == (0, 0)
+        assert time.monotonic() - started < 1
+        store.close()
+
+        # По таймауту рукопожатия сервер закрывает молчащее соединение.
+        stalled.settimeout(2)
+        assert stalled.recv(4096)  # вызов deliver_challenge
+        deadline = time.monotonic() + 2
+        while stalled.recv(4096):
+            assert time.monotonic() < deadline
+    finally:
+        stalled.close()
+        server.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_malformed_request_closes_only_its_connection(shard_authkey, caplog):
+    directory = Path(tempfile.mkdtemp(prefix="shards-"))
+    address = shard_socket(directory, 0)
+    server = ShardServer(IdeaStorage(), address, authkey=shard_authkey)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    wait_for_shards(directory, 1, authkey=shard_authkey)
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.sharding"):
+            for send in (
+                lambda conn: conn.send_bytes(b"not a pickle"),
+                lambda conn: conn.send(("totals",)),
+                lambda conn: conn.send(42),
+            ):
+                conn = Client(str(address), family="AF_UNIX", authkey=shard_authkey)
+                with conn:
+                    send(conn)
+                    # Сервер не падает молча с открытым сокетом, а закрывает его.
+                    assert conn.poll(2)
+                    with pytest.raises(EOFError):
+                        conn.recv()
+        assert len(caplog.records) == 3
+
+        store = ShardedIdeaStorage([address], authkey=shard_authkey, timeout=2)
+        assert store.totals() == (0, 0)
+        store.close()
+    finally:
+        server.close()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,489 @@
+import asyncio
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.async_storage import AsyncIdeaStorage
+from app.journal import JournaledIdeaStorage
+from app.models import (
+    AnalyticsGroupBy,
+    Evaluation,
+    EvaluationCreate,
+    IdeaCreate,
+    IdeaRecord,
+    IdeaResponse,
+    IdeaSort,
+    IdeaStatus,
+    IdeaUpdate,
+    PackedEvaluations,
+    ScoreSummary,
+)
+from app.problem_details import ApiProblem
+from app.response_cache import (
+    DEFAULT_CACHE_ENTRIES,
+    cache_entries_from_env,
+    serialize_idea,
+)
+from app.sqlite_storage import SQLiteIdeaStorage
+from app.storage import IdeaStorage
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_running_totals_match_full_recompute(seed):
+    rng = random.Random(seed)
+    record = IdeaRecord(id=1, title="Idea", description="Running totals check", tags=[])
+
+    for _ in range(rng.randint(0, 300)):
+        record.append_evaluation(
+            Evaluation(
+                value=rng.randint(1, 10),
+                effort=rng.randint(1, 10),
+                confidence=rng.randint(1, 10),
+            )
+        )
+        expected = ScoreSummary.from_evaluations(record.evaluations)
+        assert IdeaResponse.from_record(record).score == expected
+
+
+def brute_force_list(store, *, tag=None, status=None, min_score=None):
+    ideas = []
+    for idea_id in sorted(store._ideas):
+        idea = IdeaResponse.from_record(store._ideas[idea_id])
+        if tag and tag.lower() not in idea.tags:
+            continue
+        if status and idea.status != status:
+            continue
+        if min_score is not None and (
+            idea.score.value is None or idea.score.value < min_score
+        ):
+            continue
+        ideas.append(idea)
+    return ideas
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_indexed_list_matches_full_scan(seed):
+    rng = random.Random(seed)
+    store = IdeaStorage()
+    tags = ["ai", "ops", "ux", "rare"]
+    statuses = list(IdeaStatus)
+
+    for _ in range(300):
+        action = rng.random()
+        if action < 0.3 or not store._ideas:
+            store.create(
+                IdeaCreate(
+                    title="Generated idea",
+                    description="Generated for the index consistency check.",
+                    tags=rng.sample(tags, rng.randint(0, 2)),
+                )
+            )
+        elif action < 0.5:
+            store.update(
+                rng.choice(list(store._ideas)),
+                IdeaUpdate(
+                    status=rng.choice(statuses).value,
+                    tags=rng.sample(tags, rng.randint(0, 3)),
+                ),
+            )
+        else:
+            store.add_evaluation(
+                rng.choice(list(store._ideas)),
+                EvaluationCreate(
+                    value=rng.randint(1, 10),
+                    effort=rng.randint(1, 10),
+                    confidence=rng.randint(1, 10),
+                ),
+            )
+
+    for tag in [None, "ai", "RARE", "missing"]:
+        for status in [None, *statuses]:
+            for min_score in [None, 0, 4.5, 9.99]:
+                filters = {"tag": tag, "status": status, "min_score": min_score}
+                expected = brute_force_list(store, **filters)
+                assert store.list(**filters) == expected
+                # Постраничный обход даёт тот же результат, что и целиком.
+                pages, after_id = [], None
+                while page := store.list(**filters, after_id=after_id, limit=7):
+                    pages.extend(page)
+                    after_id = page[-1].id
+                assert pages == expected
+    for bucket in [*store._by_tag.values(), *store._by_status.values()]:
+        assert bucket == sorted(set(bucket))
+
+
+def test_filtered_pages_stay_consistent_while_ideas_are_inserted():
+    store = IdeaStorage()
+    for n in range(50):
+        store.create(
+            IdeaCreate(
+                title=f"Idea {n}",
+                description="Seed for filtered paging.",
+                tags=["rare"] if n % 10 == 0 else ["ai"],
+            )
+        )
+    seen = []
+    after_id = None
+    while page := store.list(tag="rare", after_id=after_id, limit=2):
+        seen.extend(idea.id for idea in page)
+        after_id = page[-1].id
+        # Между страницами появляются новые идеи, в том числе с тем же тегом.
+        for tags in (["rare"], ["ai"], ["ai"]):
+            store.create(
+                IdeaCreate(
+                    title="Late idea", description="Inserted between pages.", tags=tags
+                )
+            )
+        if len(seen) > 40:
+            break
+
+    # Курсор не теряет и не повторяет идеи; новые попадают на следующие страницы.
+    assert seen == sorted(set(seen))
+    assert (
+        seen == [idea.id for idea in brute_force_list(store, tag="rare")][: len(seen)]
+    )
+    assert len(seen) > 5
+
+
+def apply_random_operations(stores, seed, steps=200):
+    """Прогоняет одинаковую случайную последовательность мутаций по всем хранилищам."""
+    rng = random.Random(seed)
+    tags = ["ai", "ops", "ux", "rare"]
+    created = 0
+    for _ in range(steps):
+        action = rng.random()
+        if action < 0.3 or not created:
+            payload = IdeaCreate(
+                title="Generated idea",
+                description="Generated for the backend consistency check.",
+                tags=rng.sample(tags, rng.randint(0, 2)),
+            )
+            for store in stores:
+                store.create(payload)
+            created += 1
+        elif action < 0.5:
+            idea_id = rng.randint(1, created)
+            payload = IdeaUpdate(
+                status=rng.choice(list(IdeaStatus)).value,
+                tags=rng.sample(tags, rng.randint(0, 3)),
+            )
+            for store in stores:
+                store.update(idea_id, payload)
+        elif action < 0.6:
+            batches = {
+                rng.randint(1, created + 1): [
+                    EvaluationCreate(
+                        value=rng.randint(1, 10),
+                        effort=rng.randint(1, 10),
+                        confidence=rng.randint(1, 10),
+                    )
+                    for _ in range(rng.randint(1, 3))
+                ]
+                for _ in range(3)
+            }
+            for store in stores:
+                store.add_evaluations(batches)
+        else:
+            idea_id = rng.randint(1, created)
+            payload = EvaluationCreate(
+                value=rng.randint(1, 10),
+                effort=rng.randint(1, 10),
+                confidence=rng.randint(1, 10),
+            )
+            for store in stores:
+                store.add_evaluation(idea_id, payload)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_sqlite_backend_matches_memory_backend(seed, tmp_path):
+    memory = IdeaStorage()
+    sqlite = SQLiteIdeaStorage(tmp_path / "ideas.db", pool_size=2)
+    try:
+        apply_random_operations([memory, sqlite], seed)
+        for tag in [None, "ai", "rare"]:
+            for status in [None, IdeaStatus.approved]:
+                for min_score in [None, 5]:
+                    for after_id, limit in [(None, None), (3, 4)]:
+                        filters = {
+                            "tag": tag,
+                            "status": status,
+                            "min_score": min_score,
+                            "after_id": after_id,
+                            "limit": limit,
+                        }
+                        assert sqlite.list(**filters) == memory.list(**filters)
+        assert sqlite.evaluations(1) == memory.evaluations(1)
+        for sort in IdeaSort:
+            for filters in [{}, {"tag": "ai"}, {"status": IdeaStatus.approved}]:
+                for offset, limit in [(0, None), (0, 5), (4, 3)]:
+                    window = {"offset": offset, "limit": limit, **filters}
+                    assert sqlite.ranked(sort, **window) == memory.ranked(
+                        sort, **window
+                    )
+    finally:
+        sqlite.close()
+
+
+def brute_force_ranking(store, sort, **filters):
+    """Эталон: полная сортировка; без оценок — в конце, при равенстве — по id."""
+    ideas = store.list(**filters)
+    metric = {
+        IdeaSort.impact: lambda idea: idea.score.impact,
+        IdeaSort.value: lambda idea: idea.score.value,
+        IdeaSort.votes: lambda idea: idea.score.votes,
+    }[sort]
+    ideas.sort(
+        key=lambda idea: (
+            metric(idea) is None,
+            -(metric(idea) or 0),
+            idea.id,
+        )
+    )
+    return [idea.id for idea in ideas]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_ranked_matches_full_sort(seed):
+    store = IdeaStorage()
+    apply_random_operations([store], seed, steps=300)
+    for sort in IdeaSort:
+        for filters in [{}, {"tag": "ops"}, {"min_score": 5}]:
+            expected = brute_force_ranking(store, sort, **filters)
+            ranked = [idea.id for idea in store.ranked(sort, **filters)]
+            assert ranked == expected
+            top = [idea.id for idea in store.ranked(sort, limit=7, **filters)]
+            assert top == expected[:7]
+            window = store.ranked_json(sort, offset=5, limit=4, **filters)
+            assert [idea_id for idea_id, _ in window] == expected[5:9]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_cached_json_follows_mutations(backend, tmp_path):
+    if backend == "memory":
+        store = IdeaStorage(json_cache_size=8)
+    else:
+        store = SQLiteIdeaStorage(tmp_path / "ideas.db", json_cache_size=8)
+    try:
+        for seed in range(6):
+            # Кэш прогревается чтениями между порциями мутаций.
+            apply_random_operations([store], seed, steps=40)
+            expected = [
+                (idea.id, serialize_idea(idea)) for idea in store.list(tag="ai")
+            ]
+            assert store.list_json(tag="ai") == expected
+            assert store.list_json(after_id=2, limit=3) == [
+                (idea.id, serialize_idea(idea))
+                for idea in store.list(after_id=2, limit=3)
+            ]
+            assert json.loads(store.get_json(1)) == store.get(1).model_dump(mode="json")
+        store.clear()
+        store.create(IdeaCreate(title="Fresh idea", description="Created after clear."))
+        assert json.loads(store.get_json(1))["title"] == "Fresh idea"
+    finally:
+        if backend == "sqlite":
+            store.close()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_memory_json_cache_stays_bounded(compact):
+    store = IdeaStorage(compact=compact, json_cache_size=16)
+    store.create_many(
+        [
+            IdeaCreate(title=f"Idea {n}", description="Bounded cache.")
+            for n in range(100)
+        ]
+    )
+    after_id = None
+    while page := store.list_json(after_id=after_id, limit=7):
+        assert len(store._json) <= 16
+        after_id = page[-1][0]
+    assert len(store._json) == 16
+    # Самые свежие чтения остаются в кэше.
+    assert store._json.get(100, store._ideas[100].version) is not None
+
+
+def test_json_cache_size_comes_from_env(monkeypatch):
+    monkeypatch.delenv("IDEA_JSON_CACHE_SIZE", raising=False)
+    assert cache_entries_from_env() == DEFAULT_CACHE_ENTRIES
+    monkeypatch.setenv("IDEA_JSON_CACHE_SIZE", "500")
+    assert cache_entries_from_env() == 500
+    # Опечатка не должна молча превращаться в размер по умолчанию.
+    monkeypatch.setenv("IDEA_JSON_CACHE_SIZE", "20k")
+    with pytest.raises(ValueError, match="IDEA_JSON_CACHE_SIZE"):
+        cache_entries_from_env()
+
+
+def test_sqlite_backend_survives_reopen(tmp_path):
+    path = tmp_path / "ideas.db"
+    first = SQLiteIdeaStorage(path)
+    created = first.create(
+        IdeaCreate(
+            title="Durable idea", description="Must survive a restart.", tags=["db"]
+        )
+    )
+    first.add_evaluation(created.id, EvaluationCreate(value=8, effort=2, confidence=7))
+    first.add_attachment(created.id, "file.png")
+    etags = (first.list_etag(), first.record_etag(created.id))
+    first.close()
+
+    second = SQLiteIdeaStorage(path)
+    try:
+        restored = second.get(created.id)
+        assert restored.tags == ["db"]
+        assert restored.score.votes == 1
+        assert restored.attachments == ["file.png"]
+        assert second.referenced_attachments(["file.png", "x.png"]) == {"file.png"}
+        assert (second.list_etag(), second.record_etag(created.id)) == etags
+        mode = second._pool.get()
+        assert mode.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        second._pool.put(mode)
+    finally:
+        second.close()
+
+
+def test_packed_evaluations_behave_like_a_list():
+    entries = [
+        Evaluation(value=3, effort=4, confidence=5),
+        Evaluation(value=10, effort=1, confidence=1, comment="great"),
+        Evaluation(value=1, effort=10, confidence=2),
+    ]
+    packed = PackedEvaluations(entries[:1])
+    packed.extend(entries[1:])
+    assert len(packed) == 3
+    assert list(packed) == entries
+    assert packed[1] == entries[1]
+    assert packed[-1] == entries[-1]
+    assert packed.comments == {1: "great"}
+    with pytest.raises(IndexError):
+        packed[3]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_compact_storage_matches_regular_storage(seed):
+    regular = IdeaStorage()
+    compact = IdeaStorage(compact=True)
+    apply_random_operations([regular, compact], seed)
+    comment = EvaluationCreate(value=7, effort=2, confidence=9, comment="ship it")
+    for store in (regular, compact):
+        store.add_evaluation(1, comment)
+
+    assert compact.list() == regular.list()
+    assert compact.list_json() == regular.list_json()
+    for idea_id in range(1, 6):
+        assert compact.evaluations(idea_id) == regular.evaluations(idea_id)
+    for filters in [{"tag": "ai"}, {"min_score": 5}]:
+        assert compact.list(**filters) == regular.list(**filters)
+    for sort in IdeaSort:
+        assert compact.ranked(sort, limit=10) == regular.ranked(sort, limit=10)
+    for group_by in AnalyticsGroupBy:
+        assert compact.evaluation_analytics(group_by) == regular.evaluation_analytics(
+            group_by
+        )
+
+    record = compact._ideas[1]
+    assert isinstance(record.evaluations, PackedEvaluations)
+    assert isinstance(record.tags, tuple)
+    # Одинаковые теги разных идей — один и тот же объект строки.
+    tagged = [item for item in compact._ideas.values() if "ai" in item.tags]
+    assert len({id(item.tags[item.tags.index("ai")]) for item in tagged}) == 1
+
+
+@pytest.mark.parametrize(
+    "backend, read_thread, write_thread",
+    [
+        ("memory", "MainThread", "MainThread"),
+        ("journal", "storage-io", "storage-io"),
+        ("sqlite", "storage-io", "storage-io"),
+    ],
+)
+def test_async_storage_offloads_only_blocking_calls(
+    backend, read_thread, write_thread, tmp_path
+):
+    if backend == "memory":
+        store = IdeaStorage()
+    elif backend == "journal":
+        store = JournaledIdeaStorage(tmp_path / "journal", fsync=False)
+    else:
+        store = SQLiteIdeaStorage(tmp_path / "ideas.db")
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage-io")
+    facade = AsyncIdeaStorage(store, executor=executor)
+    threads = {}
+    for name in ("create", "get_json", "evaluation_analytics"):
+        original = getattr(store, name)
+
+        def spy(*args, _name=name, _original=original, **kwargs):
+            threads[_name] = threading.current_thread().name
+            return _original(*args, **kwargs)
+
+        setattr(store, name, spy)
+
+    async def scenario():
+        created = await facade.create(
+            IdeaCreate(
+                title="Async idea",
+                description="Created through the async storage facade.",
+                tags=["ai"],
+            )
+        )
+        body = await facade.get_json(created.id)
+        page = await facade.list_json(tag="ai", limit=10)
+        await facade.evaluation_analytics(AnalyticsGroupBy.tag)
+        # Ошибки хранилища доходят до обработчика как есть, из любого потока.
+        with pytest.raises(ApiProblem):
+            await facade.get(created.id + 1)
+        return created, body, page
+
+    try:
+        created, body, page = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+        if backend != "memory":
+            store.close()
+    assert json.loads(body)["id"] == created.id
+    assert page == [(created.id, body)]
+    assert threads["create"].startswith(write_thread)
+    assert threads["get_json"].startswith(read_thread)
+    # Аналитика уходит в пул у любого бэкенда.
+    assert threads["evaluation_analytics"].startswith("storage-io")
+
+
+def test_journal_reads_do_not_block_loop_behind_a_writer(tmp_path):
+    store = JournaledIdeaStorage(tmp_path / "journal", fsync=False)
+    created = store.create(
+        IdeaCreate(title="Journal idea", description="Read while a write waits.")
+    )
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="storage-io")
+    facade = AsyncIdeaStorage(store, executor=executor)
+
+    async def scenario():
+        # Писатель в пуле держит блокировку, как во время fsync группового коммита.
+        store._lock.acquire_write()
+        read = asyncio.ensure_future(facade.get_json(created.id))
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not read.done()
+        store._lock.release_write()
+        return ticks, await read
+
+    try:
+        ticks, body = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    finally:
+        executor.shutdown()
+        store.close()
+    assert ticks == 5
+    assert json.loads(body)["id"] == created.id
+
+
+def test_async_storage_requires_executor_for_blocking_backend(tmp_path):
+    assert AsyncIdeaStorage(IdeaStorage()).sync is not None
+    store = SQLiteIdeaStorage(tmp_path / "ideas.db")
+    try:
+        with pytest.raises(ValueError):
+            AsyncIdeaStorage(store)
+    finally:
+        store.close()